@@ -0,0 +1,527 @@
+#!/usr/bin/python3
+
+import argparse
+import collections
+import itertools
+import json
+import sys
+import time
+
+from rummy_final import CARDS_PER_PACK, MAX_PACKS, RANK, RUN_WINDOWS_BY_RANK, Player, int_to_card, joker_run_fits
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+"""
+Vectorized batch validation of Rummy hands with NumPy.
+Hands are rows of card codes (or card ints, see card_to_int) in an (N, 13) or
+(N, 14) array.  Necessary conditions (a pure run of 3 must exist, and the cards
+outside runs and books must be filled up to sets with the Jokers at hand) run on
+the whole batch at once over 52 bit occupancy masks.  The hands that pass them are
+searched level by level for the 4 sets, all hands of a level at once: the lowest
+card left must sit in one of the set templates of its card code, and every
+template that fits a hand spawns a child hand without its cards.
+
+Usage:
+	python3 rummy_batch.py --hands 200000
+"""
+
+# row i holds the positions of a 14 card hand that stay when card i is dropped
+_DROPS = [[j for j in range(14) if j != i] for i in range(14)]
+
+def _require_numpy():
+	""" Raise an ImportError when NumPy is not installed """
+	if np is None:
+		raise ImportError("rummy_batch needs NumPy: pip install numpy")
+
+def _joker_ranks(joker_ranks, n):
+	""" Joker RANK index of every hand
+	Args:
+		joker_ranks: None, one RANK index for every hand, or an (N,) array of RANK indexes, -1 for no Joker
+		n: number of hands
+	Returns:
+		(N,) int array
+	"""
+	if joker_ranks is None:
+		joker_ranks = -1
+	return np.broadcast_to(np.asarray(joker_ranks, dtype=np.int64), (n,))
+
+def card_counts(hands):
+	""" Number of copies of every card code in every hand
+	Args:
+		hands: (N, K) int array of card codes or card ints
+	Returns:
+		(N, 52) int array
+	"""
+	n = hands.shape[0]
+	flat = hands % CARDS_PER_PACK + CARDS_PER_PACK * np.arange(n)[:, None]
+	return np.bincount(flat.ravel(), minlength=n * CARDS_PER_PACK).reshape(n, CARDS_PER_PACK)
+
+def partner_counts(counts):
+	""" Number of other held cards that can share a set with each card code, see PARTNER_MASKS
+	Args:
+		counts: (N, 52) array made by card_counts
+	Returns:
+		(N, 52) int array
+	"""
+	held = (counts > 0).reshape(-1, len(RANK), 4).astype(np.int8)
+	near = held.sum(axis=2, keepdims=True) - held
+	for d in (-3, -2, -1, 1, 2, 3):
+		near = near + np.roll(held, d, axis=1)
+	return near.reshape(-1, CARDS_PER_PACK)
+
+_FULL = (1 << CARDS_PER_PACK) - 1
+_RANK_LOW = sum(1 << (r * 4) for r in range(len(RANK)))	# lowest bit of every rank
+
+def _popcount(masks):
+	""" Number of bits set in every uint64 of an array """
+	if hasattr(np, 'bitwise_count'):
+		return np.bitwise_count(masks).astype(np.int64)
+	table = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+	masks = np.ascontiguousarray(masks)
+	return table[masks.view(np.uint8)].reshape(masks.shape + (8,)).sum(axis=-1)
+
+def _rotate(masks, ranks):
+	""" Move every card of a mask a number of ranks up its suit, the King wraps to the Ace """
+	up = np.uint64(4 * (ranks % len(RANK)))
+	down = np.uint64(CARDS_PER_PACK - 4 * (ranks % len(RANK)))
+	return ((masks << up) | (masks >> down)) & np.uint64(_FULL)
+
+# bit of the card code of every card int, see _card_bits
+_CARD_BITS = None
+
+def _card_bits():
+	""" Bit of the card code of every card int of the largest Deck, built on first use """
+	global _CARD_BITS
+	if _CARD_BITS is None:
+		_CARD_BITS = np.uint64(1) << (np.arange(MAX_PACKS * CARDS_PER_PACK) % CARDS_PER_PACK).astype(np.uint64)
+	return _CARD_BITS
+
+def hand_masks(hands, joker_ranks=None):
+	""" Occupancy masks of a batch of hands
+	Args:
+		hands: (N, K) int array of card codes or card ints
+		joker_ranks: see _joker_ranks
+	Returns:
+		(held, twice, jokers, wild): (N,) uint64 arrays of the card codes held and of the
+		card codes held more than once, the card code mask of the Jokers of every hand,
+		and the (N,) int array of the number of Jokers in every hand
+	"""
+	hands = np.asarray(hands)
+	ranks = _joker_ranks(joker_ranks, hands.shape[0])
+	jokers = np.where(ranks >= 0, np.uint64(15) << (np.uint64(4) * np.maximum(ranks, 0).astype(np.uint64)), np.uint64(0))
+	held = np.zeros(hands.shape[0], dtype=np.uint64)
+	twice = np.zeros(hands.shape[0], dtype=np.uint64)
+	wild = np.zeros(hands.shape[0], dtype=np.int64)
+	for column in _card_bits()[hands.T]:
+		twice |= held & column
+		held |= column
+		wild += (column & jokers) != 0
+	return held, twice, jokers, wild
+
+def _may_close(held, twice, jokers, wild, pure=None):
+	""" Necessary conditions of closing on the masks of the cards held
+	A pure run of 3 must be held, unless one was made already.  A non Joker card
+	that is in no pure run and has no other card of its rank needs a wild Joker in
+	its set, and two of them when no card of its suit is up to 3 ranks away.  A set
+	holds at most 3 such cards.
+	Args:
+		held, twice, jokers, wild: see hand_masks
+		pure: (N,) bool array, True where a pure run was made already
+	Returns:
+		(N,) bool array
+	"""
+	natural = held & ~jokers
+	low = np.uint64(_RANK_LOW)
+	four, eight = np.uint64(4), np.uint64(8)
+
+	# pure runs of 3, the Ace after the King is moved to a 14th rank
+	extended = held | (held & np.uint64(15)) << np.uint64(CARDS_PER_PACK)
+	start = extended & (extended >> four) & (extended >> eight)
+	runs = start | start << four | start << eight
+	runs = (runs | runs >> np.uint64(CARDS_PER_PACK)) & np.uint64(_FULL)
+
+	# ranks with two non Joker cards or more
+	planes = [(natural >> np.uint64(k)) & low for k in range(4)]
+	twice = twice & natural
+	copies = (twice | twice >> np.uint64(1) | twice >> np.uint64(2) | twice >> np.uint64(3)) & low
+	books = (planes[0] & (planes[1] | planes[2] | planes[3])) | (planes[1] & (planes[2] | planes[3])) | (planes[2] & planes[3]) | copies
+
+	alone = natural & ~(runs | books * np.uint64(15))
+	near = np.zeros_like(natural)
+	for d in (1, 2, 3):
+		near |= _rotate(natural, d) | _rotate(natural, len(RANK) - d)
+	fits = 2 * _popcount(alone & ~near) + (_popcount(alone & near) + 2) // 3 <= wild
+	if pure is None:
+		return fits & (start != 0)
+	return fits & (pure | (start != 0))
+
+def prefilter(hands, joker_ranks=None):
+	""" Hands that pass the necessary conditions of closing, the others can never close the game
+	Args:
+		hands: (N, 13) int array of card codes or card ints
+		joker_ranks: see _joker_ranks
+	Returns:
+		(N,) bool array, see _may_close
+	"""
+	_require_numpy()
+	return _may_close(*hand_masks(hands, joker_ranks))
+
+# set templates of the batch search, built on first use, see _templates
+_TEMPLATES = None
+
+def _templates():
+	""" Every set of 3 or 4 cards that holds a card code, the sets _HandSearch.sets yields
+	A set is its cards and a number of wild Jokers: pure runs, where a Joker may sit as
+	its own card, books of the rank and runs of the suit topped up with wild Jokers.
+	Args:
+		No args
+	Returns:
+		dict of arrays indexed by card code and template (52, T): 'mask', the card codes of
+		the set, all bits set for the padding; 'codes' and 'need' (52, T, 4), the card codes
+		of the set and their copies, padded with code 52 and 0 copies; 'wild', 'size';
+		'pure', True for pure runs; 'slots' (52 * T, 4), the card code of every place of
+		the set, -1 for a wild Joker and -2 past a set of 3; and 'width', T
+	"""
+	global _TEMPLATES
+	if _TEMPLATES is not None:
+		return _TEMPLATES
+	table = []
+	for code in range(CARDS_PER_PACK):
+		rank, suit = code >> 2, code & 3
+		found = []
+		for size in (3, 4):
+			for window in RUN_WINDOWS_BY_RANK[size][rank]:
+				found.append(([r * 4 + suit for r in window], 0, size, True))
+			for taken in range(size):
+				for extra in itertools.combinations_with_replacement(range(rank * 4, rank * 4 + 4), taken):
+					found.append(([code] + list(extra), size - 1 - taken, size, False))
+			# is_valid_run_joker lets a Joker fill more than one gap, so any ranks of the suit may fit
+			others = [r for r in range(len(RANK)) if r != rank]
+			for taken in range(1, size - 1):
+				for extra in itertools.combinations(others, taken):
+					if joker_run_fits(sorted([rank + 1] + [r + 1 for r in extra]), size - 1 - taken):
+						found.append(([code] + [r * 4 + suit for r in extra], size - 1 - taken, size, False))
+		table.append(found)
+
+	width = max(len(found) for found in table)
+	shape = (CARDS_PER_PACK, width)
+	masks = [[(1 << 64) - 1] * width for code in range(CARDS_PER_PACK)]
+	tpl = {'codes': np.full(shape + (4,), CARDS_PER_PACK, dtype=np.intp), 'need': np.zeros(shape + (4,), dtype=np.int8),
+		'wild': np.zeros(shape, dtype=np.int64), 'size': np.zeros(shape, dtype=np.int64), 'pure': np.zeros(shape, dtype=bool),
+		'slots': np.full((CARDS_PER_PACK * width, 4), -2, dtype=np.int64), 'width': width}
+	for code, found in enumerate(table):
+		for t, (cards, wild, size, pure) in enumerate(found):
+			for k, (card, copies) in enumerate(sorted(collections.Counter(cards).items())):
+				tpl['codes'][code, t, k] = card
+				tpl['need'][code, t, k] = copies
+			tpl['wild'][code, t] = wild
+			tpl['size'][code, t] = size
+			tpl['pure'][code, t] = pure
+			masks[code][t] = sum(1 << card for card in set(cards))
+			tpl['slots'][code * width + t, :size] = cards + [-1] * wild
+	tpl['mask'] = np.array(masks, dtype=np.uint64)
+	_TEMPLATES = tpl
+	return tpl
+
+def _held_masks(own, copies=1):
+	""" Occupancy mask of every row of card counts
+	Args:
+		own: (M, 52 or more) array of card counts
+		copies: number of copies of a card code the mask asks for
+	Returns:
+		(M,) uint64 array, bit c set when card code c is held that many times or more
+	"""
+	bits = np.packbits(own[:, :CARDS_PER_PACK] >= copies, axis=1, bitorder='little')
+	return np.pad(bits, ((0, 0), (0, 1))).view(np.uint64)[:, 0]
+
+def search_hands(counts, joker_ranks, block=1 << 14):
+	""" Exact close_game search over a batch of hands, one set at a time for all hands at once
+	Like _HandSearch, every state places its lowest non Joker card in a set.  Every
+	set template of that card the state can fill becomes a new state, so after at
+	most 4 rounds every arrangement of every hand has been tried.  A template fits
+	when its card codes are held, then the copies it needs are counted.
+	States that fail the checks of prefilter are dropped on the way.
+	Args:
+		counts: (N, 52) array made by card_counts of 13 card hands
+		joker_ranks: (N,) int array of Joker RANK indexes, -1 for no Joker
+		block: number of states expanded at once, bounds the memory used
+	Returns:
+		(found, sets): (N,) bool array, and (N, 4) int array of the sets of every hand
+		that closes: card code * T + template (see _templates), or -3 and -4 for a set
+		of 3 and 4 wild Jokers
+	"""
+	tpl = _templates()
+	width = tpl['width']
+	n = counts.shape[0]
+	found = np.zeros(n, dtype=bool)
+	sets = np.full((n, 4), -5, dtype=np.int64)
+
+	# one state per hand to start with
+	hand = np.arange(n)
+	ranks = np.asarray(joker_ranks, dtype=np.int64)
+	joker_masks = np.where(ranks >= 0, np.uint64(15) << (np.uint64(4) * np.maximum(ranks, 0).astype(np.uint64)), np.uint64(0))
+	own = np.zeros((n, CARDS_PER_PACK + 1), dtype=np.int8)
+	own[:, :CARDS_PER_PACK] = counts
+	held = _held_masks(own)
+	wild = np.where((np.arange(CARDS_PER_PACK) >> 2) == ranks[:, None], counts, 0).sum(axis=1)
+	n3 = np.full(n, 3, dtype=np.int64)
+	n4 = np.ones(n, dtype=np.int64)
+	pure = np.zeros(n, dtype=bool)
+	path = np.full((n, 4), -5, dtype=np.int64)
+
+	for level in range(5):
+		jokers = joker_masks[hand]
+		natural = held & ~jokers
+		left = natural != 0
+
+		# only wild Jokers are left, they make books on their own
+		done = np.flatnonzero(~left & pure & (wild == 3 * n3 + 4 * n4))
+		if len(done):
+			for j in range(4 - level):
+				path[done, level + j] = np.where(j < n3[done], -3, -4)
+			winners, first = np.unique(hand[done], return_index=True)
+			fresh = ~found[winners]
+			found[winners[fresh]] = True
+			sets[winners[fresh]] = path[done[first[fresh]]]
+
+		keep = np.flatnonzero(left & ~found[hand])
+		if level == 4 or len(keep) == 0:
+			break
+		# the lowest card left of every state
+		lowest = natural[keep] & (~natural[keep] + np.uint64(1))
+		low = np.zeros(len(keep), dtype=np.int64)
+		for shift in (32, 16, 8, 4, 2, 1):
+			up = lowest >> np.uint64(shift) != 0
+			low += np.where(up, shift, 0)
+			lowest = np.where(up, lowest >> np.uint64(shift), lowest)
+
+		parts = []
+		for start in range(0, len(keep), block):
+			rows = keep[start:start + block]
+			c = low[start:start + block]
+			# the templates whose cards are all held, then the other checks on those only
+			masks = tpl['mask'][c]
+			i, t = np.nonzero(masks & ~held[rows, None] == 0)
+			parent = rows[i]
+			c = c[i]
+			size = tpl['size'][c, t]
+			codes = tpl['codes'][c, t]
+			need = tpl['need'][c, t]
+			fit = np.where(size == 3, n3[parent] > 0, n4[parent] > 0)
+			fit &= (own[parent[:, None], codes] >= need).all(axis=1)
+			# Jokers sit in a pure run as their own card, and only there
+			as_own = masks[i, t] & jokers[parent]
+			used = np.where(as_own != 0, _popcount(as_own), 0)
+			fit &= tpl['pure'][c, t] | (used == 0)
+			spare = wild[parent] - tpl['wild'][c, t] - used
+			fit &= spare >= 0
+			ok = np.flatnonzero(fit)
+			if len(ok) == 0:
+				continue
+			parent, c, t, size, codes, need = parent[ok], c[ok], t[ok], size[ok], codes[ok], need[ok]
+			child = own[parent]
+			at = np.arange(len(ok))
+			for k in range(4):
+				child[at, codes[:, k]] -= need[:, k]
+			step = path[parent]
+			step[:, level] = c * width + t
+			parts.append((hand[parent], child, spare[ok], n3[parent] - (size == 3), n4[parent] - (size == 4),
+				pure[parent] | tpl['pure'][c, t], step))
+		if not parts:
+			break
+		hand, own, wild, n3, n4, pure, path = [np.concatenate(part) for part in zip(*parts)]
+		held = _held_masks(own)
+		alive = _may_close(held, _held_masks(own, 2), joker_masks[hand], wild, pure)
+		hand, own, held, wild, n3, n4, pure, path = (hand[alive], own[alive], held[alive], wild[alive], n3[alive],
+			n4[alive], pure[alive], path[alive])
+	return found, sets
+
+def _place(hands, joker_ranks, found, sets):
+	""" Positions of the cards of every hand in its winning sets
+	Args:
+		hands: (N, 13) int array of card codes or card ints
+		joker_ranks: (N,) int array of Joker RANK indexes
+		found, sets: made by search_hands
+	Returns:
+		(N, 13) int array of positions, the sets of 3 cards first, -1 when not found
+	"""
+	tpl = _templates()
+	n = hands.shape[0]
+	order = np.full((n, 13), -1, dtype=np.int16)
+	rows = np.flatnonzero(found)
+	if len(rows) == 0:
+		return order
+	m = len(rows)
+	wild_sets = np.array([[-1, -1, -1, -2], [-1, -1, -1, -1]], dtype=np.int64)
+	chosen = sets[rows]
+	slots = np.where((chosen >= 0)[:, :, None], tpl['slots'][np.maximum(chosen, 0)], wild_sets[(chosen == -4).astype(np.intp)])
+	# the set of 4 cards goes last, then the place past every set of 3 is left out
+	fours = (slots[:, :, 3] != -2).argmax(axis=1)
+	last = np.array([[j for j in range(4) if j != f] + [f] for f in range(4)])[fours]
+	slots = np.take_along_axis(slots, last[:, :, None], axis=1).reshape(m, 16)[:, [0, 1, 2, 4, 5, 6, 8, 9, 10, 12, 13, 14, 15]]
+
+	# the k-th place of a card code takes the k-th card of the hand with that code
+	codes = hands[rows] % CARDS_PER_PACK
+	offset = np.arange(m)[:, None] * 64
+	hand_keys = (codes + offset).ravel()
+	hand_order = np.argsort(hand_keys, kind='stable')
+	sorted_keys = hand_keys[hand_order]
+	named = slots >= 0
+	slot_keys = np.where(named, slots + offset, -1).ravel()
+	slot_order = np.argsort(slot_keys, kind='stable')
+	keys = slot_keys[slot_order]
+	first = np.searchsorted(keys, keys)
+	at = hand_order[np.searchsorted(sorted_keys, keys) + np.arange(len(keys)) - first]
+	place = np.empty(len(keys), dtype=np.int64)
+	place[slot_order] = at % 13
+	place = place.reshape(m, 13)
+
+	# the wild Jokers take the cards that are left, in hand order
+	used = np.zeros((m, 14), dtype=bool)
+	np.put_along_axis(used, np.where(named, place, 13), True, axis=1)
+	spare = np.argsort(used[:, :13], axis=1, kind='stable')
+	nth = np.cumsum(~named, axis=1) - 1
+	place = np.where(named, place, np.take_along_axis(spare, np.maximum(nth, 0), axis=1))
+	order[rows] = place
+	return order
+
+def validate_hands(hands, joker_ranks=None, chunk=1 << 14):
+	""" Check a batch of 13 card hands against the close_game rules
+	Args:
+		hands: (N, 13) int array of card codes or card ints
+		joker_ranks: see _joker_ranks
+		chunk: number of hands handled at once, bounds the memory used
+	Returns:
+		(valid, order): (N,) bool array, and (N, 13) int array of the positions of the
+		cards in the winning sets (3 sets of 3 cards, then the set of 4), -1 when not valid
+	"""
+	_require_numpy()
+	hands = np.asarray(hands)
+	n = hands.shape[0]
+	if hands.ndim != 2 or hands.shape[1] != 13:
+		raise ValueError('ERROR: validate_hands needs an (N, 13) array of hands')
+	ranks = _joker_ranks(joker_ranks, n)
+	valid = np.zeros(n, dtype=bool)
+	order = np.full((n, 13), -1, dtype=np.int16)
+	for start in range(0, n, chunk):
+		part = hands[start:start + chunk]
+		part_ranks = ranks[start:start + chunk]
+		rows = np.flatnonzero(prefilter(part, part_ranks))
+		found, sets = search_hands(card_counts(part[rows]), part_ranks[rows])
+		valid[start + rows] = found
+		order[start + rows] = _place(part[rows], part_ranks[rows], found, sets)
+	return valid, order
+
+def best_discards(hands, joker_ranks=None, chunk=1 << 12):
+	""" Find the card to drop from a batch of 14 card hands
+	A card whose drop closes the game is chosen first, otherwise the card with the
+	fewest partners, as GreedyPolicy does.  Jokers are never dropped.
+	Args:
+		hands: (N, 14) int array of card codes or card ints
+		joker_ranks: see _joker_ranks
+		chunk: number of hands handled at once
+	Returns:
+		(closes, discard, order): (N,) bool array, (N,) int array of the position of the
+		card to drop, and (N, 13) int array of the positions of the winning sets, -1 when
+		the hand does not close
+	"""
+	_require_numpy()
+	hands = np.asarray(hands)
+	n = hands.shape[0]
+	if hands.ndim != 2 or hands.shape[1] != 14:
+		raise ValueError('ERROR: best_discards needs an (N, 14) array of hands')
+	ranks = _joker_ranks(joker_ranks, n)
+	drops = np.array(_DROPS)
+	closes = np.zeros(n, dtype=bool)
+	discard = np.zeros(n, dtype=np.int64)
+	order = np.full((n, 13), -1, dtype=np.int16)
+	for start in range(0, n, chunk):
+		part = hands[start:start + chunk]
+		m = part.shape[0]
+		part_ranks = ranks[start:start + chunk]
+
+		# every hand of 13 cards left by one of the 14 drops
+		valid, split = validate_hands(part[:, drops].reshape(-1, 13), np.repeat(part_ranks, 14))
+		valid = valid.reshape(m, 14)
+		split = split.reshape(m, 14, 13)
+		first = valid.argmax(axis=1)
+		found = valid.any(axis=1)
+
+		# the card with the fewest partners, duplicates count as partners
+		counts = card_counts(part)
+		codes = part % CARDS_PER_PACK
+		score = np.take_along_axis(partner_counts(counts) + counts - 1, codes, axis=1)
+		score = np.where((codes >> 2) == part_ranks[:, None], np.iinfo(np.int64).max, score)
+
+		rows = np.arange(m)
+		kept = drops[first]
+		placed = np.take_along_axis(kept, np.maximum(split[rows, first], 0).astype(np.int64), axis=1)
+		closes[start:start + m] = found
+		discard[start:start + m] = np.where(found, first, score.argmin(axis=1))
+		order[start:start + m] = np.where(found[:, None], placed, -1)
+	return closes, discard, order
+
+def from_masks(masks):
+	""" Hands from occupancy masks, the bit of every held card code set (one copy of each code)
+	Args:
+		masks: (N,) array or list of ints, every mask with the same number of bits set
+	Returns:
+		(N, K) int array of card codes in increasing order
+	"""
+	_require_numpy()
+	masks = np.asarray(masks, dtype=np.uint64)
+	bits = ((masks[:, None] >> np.arange(CARDS_PER_PACK, dtype=np.uint64)) & np.uint64(1)).astype(bool)
+	sizes = bits.sum(axis=1)
+	if len(sizes) and (sizes != sizes[0]).any():
+		raise ValueError('ERROR: every mask must hold the same number of cards')
+	return np.nonzero(bits)[1].reshape(len(masks), -1)
+
+def random_deals(count, size=13, packs=2, seed=0):
+	""" Seeded random deals from a shuffled Deck
+	Args:
+		count: number of hands
+		size: number of cards in each hand
+		packs: number of packs in the Deck
+		seed: seed of the deals
+	Returns:
+		(count, size) int array of card ints
+	"""
+	_require_numpy()
+	rng = np.random.default_rng(seed)
+	decks = np.tile(np.arange(packs * CARDS_PER_PACK, dtype=np.int16), (count, 1))
+	return rng.permuted(decks, axis=1)[:, :size]
+
+def main():
+	""" Main Program """
+	parser = argparse.ArgumentParser(description="Compare batch validation with Player.close_game")
+	parser.add_argument('--hands', type=int, default=100000)
+	parser.add_argument('--sample', type=int, default=2000, help="hands checked with Player.close_game")
+	parser.add_argument('--seed', type=int, default=0)
+	args = parser.parse_args()
+	_require_numpy()
+
+	hands = random_deals(args.hands, seed=args.seed)
+	ranks = np.random.default_rng(args.seed).integers(-1, len(RANK), args.hands)
+	_templates()
+	start = time.perf_counter()
+	valid, order = validate_hands(hands, ranks)
+	batch = args.hands / (time.perf_counter() - start)
+
+	start = time.perf_counter()
+	for i in range(min(args.sample, args.hands)):
+		player = Player("Batch", None, None)
+		for value in hands[i]:
+			card = int_to_card(int(value))
+			card.isjoker = ranks[i] >= 0 and card.rank == RANK[ranks[i]]
+			player.deal_card(card)
+		assert (player.close_game() == valid[i])
+	single = min(args.sample, args.hands) / (time.perf_counter() - start)
+
+	print(json.dumps({'hands': args.hands, 'valid': int(valid.sum()), 'batch_hands_per_second': batch,
+		'close_game_hands_per_second': single, 'speedup': batch / single}), file=sys.stderr)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,395 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+import rummy_final
+from rummy_final import (Card, Deck, MAX_PACKS, MIN_PACKS, Player, RANK, SUIT, Screen, Stash, is_valid_run, is_valid_book,
+	is_valid_run_joker, joker_mask, push_joker_toend, get_object, new_game, restore, snapshot, solve_hand, sort_sequence)
+from rummy_sim import GreedyPolicy, play_game
+
+"""
+Rummy benchmark suite.
+Times the hot paths on fixed seeded corpora of hands, saves the timings as a JSON
+baseline and compares a later run against it.  A comparison fails (exit code 1)
+when a benchmark got slower than the baseline by more than the threshold.
+
+Usage:
+	python3 rummy_bench.py --save baseline.json
+	python3 rummy_bench.py --compare baseline.json --threshold 0.25
+	python3 rummy_bench.py --render
+	python3 rummy_bench.py --decks
+	python3 rummy_bench.py --hints --max-p90 1.0
+"""
+
+def corpus(seed, count, size, packs=2, joker_rate=0.5):
+	""" Seeded hands drawn from a shuffled Deck
+	Args:
+		seed: seed of the corpus
+		count: number of hands
+		size: number of cards in each hand
+		packs: number of packs in the Deck the hands are drawn from
+		joker_rate: share of the hands that are played with a Joker rank
+	Returns:
+		list of lists of Card objects, each hand has its own Deck
+	"""
+	rng = random.Random(seed)
+	hands = []
+	for i in range(count):
+		deck = Deck(packs, rng)
+		deck.shuffle()
+		deck.joker_rank = rng.choice(RANK) if rng.random() < joker_rate else None
+		hands.append(deck.cards[:size])
+	return hands
+
+def meld_corpus(seed, count):
+	""" Seeded sets of 3 and 4 cards, a narrow band of ranks of one or two suits so that valid sets are common
+	Args:
+		seed: seed of the corpus
+		count: number of sets
+	Returns:
+		list of lists of Card objects
+	"""
+	rng = random.Random(seed)
+	deck = Deck(2)
+	sets = []
+	for i in range(count):
+		suits = rng.sample(SUIT, rng.choice([1, 1, 2]))
+		low = rng.randrange(len(RANK))
+		pool = [c for c in deck.cards if c.suit in suits and (RANK.index(c.rank) - low) % len(RANK) < 5]
+		cards = rng.sample(pool, rng.choice([3, 4]))
+		joker = rng.choice(RANK + [None] * 4)
+		for n, card in enumerate(cards):
+			# give every set its own Card objects, so that the Joker flags do not clash
+			cards[n] = Card(card.rank, card.suit, card.pack)
+			cards[n].isjoker = card.rank == joker
+		sets.append(cards)
+	return sets
+
+def bench_each(func, items):
+	""" Benchmark body that calls func on a copy of every set or hand
+	sort_sequence sorts its argument in place, the copy gives every run the same unsorted input.
+	"""
+	def run():
+		for item in items:
+			func(list(item))
+	return run, len(items)
+
+def bench_get_object(hands):
+	""" Benchmark body that looks up every card of every hand by its label, in a Stash like Player.play does """
+	queries = [(Stash(hand), [card.label() for card in hand] + ["XX"]) for hand in hands]
+	def run():
+		for hand, labels in queries:
+			for label in labels:
+				get_object(hand, label)
+	return run, sum(len(labels) for hand, labels in queries)
+
+def bench_close_game(hands):
+	""" Benchmark body that runs Player.close_game on every hand
+	The hand cache is emptied before every call, so every hand is solved.
+	"""
+	players = []
+	for hand in hands:
+		player = Player("Bench", None, None)
+		for card in hand:
+			player.deal_card(card)
+		players.append(player)
+	def run():
+		for player in players:
+			rummy_final.HAND_CACHE.clear()
+			player.close_game()
+	return run, len(players)
+
+def bench_hint(hands):
+	""" Benchmark body that asks for a hint on every hand of 14 cards
+	The distance and hand caches are emptied before every hint, a stash that just took a card is not in them.
+	"""
+	players = []
+	for hand in hands:
+		player = Player("Bench", None, None)
+		for card in hand:
+			player.deal_card(card)
+		players.append(player)
+	def run():
+		for player in players:
+			rummy_final._DISTANCE_CACHE.clear()
+			rummy_final.HAND_CACHE.clear()
+			player.hint()
+	return run, len(players)
+
+def bench_solve(hands):
+	""" Benchmark body that runs solve_hand on every hand, without the hand cache """
+	queries = [([card.code for card in hand], joker_mask(hand)) for hand in hands]
+	def run():
+		for codes, jokers in queries:
+			solve_hand(codes, jokers)
+	return run, len(queries)
+
+def bench_decks(packs, count):
+	""" Benchmark body that builds fresh Decks, as a table does for every hand """
+	def run():
+		for i in range(count):
+			Deck(packs)
+	return run, count
+
+def bench_snapshots(count):
+	""" Benchmark bodies that take snapshots of seeded 4 player games, and restore them """
+	games = [new_game(4, 2, seed, ["A", "B", "C", "D"], joker=True) for seed in range(count)]
+	snaps = [snapshot(game) for game in games]
+	rng = random.Random(0)
+	def take():
+		for game in games:
+			snapshot(game)
+	def back():
+		for data in snaps:
+			restore(data, rng)
+	return (take, count), (back, count)
+
+def bench_games(packs, games):
+	""" Benchmark body that plays seeded headless games between greedy policies, at most 300 turns each
+	The caches are emptied before every run, so a run is not warmed by the one before.
+	"""
+	def run():
+		rummy_final._DISTANCE_CACHE.clear()
+		rummy_final.HAND_CACHE.clear()
+		for seed in range(games):
+			play_game(seed, ['greedy', 'greedy'], packs=packs, max_turns=300)
+	return run, games
+
+def benchmarks(scale=1):
+	""" The benchmark suite
+	Args:
+		scale: multiplier for the corpus sizes
+	Returns:
+		dict of name to (body, calls per run)
+	"""
+	melds = meld_corpus(10, 2000 * scale)
+	hands = corpus(11, 300 * scale, 13)
+	take, back = bench_snapshots(200 * scale)
+	return {
+		'sort_sequence': bench_each(sort_sequence, hands),
+		'is_valid_run': bench_each(is_valid_run, melds),
+		'is_valid_book': bench_each(is_valid_book, melds),
+		'is_valid_run_joker': bench_each(is_valid_run_joker, melds),
+		'push_joker_toend': bench_each(push_joker_toend, hands),
+		'get_object': bench_get_object(hands),
+		'close_game': bench_close_game(hands),
+		'solve_hand': bench_solve(hands),
+		'hint': bench_hint(corpus(12, 300 * scale, 14)),
+		'deck_1_pack': bench_decks(1, 500 * scale),
+		'deck_8_packs': bench_decks(8, 500 * scale),
+		'snapshot': take,
+		'restore': back,
+		'game_1_pack': bench_games(1, 3 * scale),
+		'game_2_packs': bench_games(2, 3 * scale),
+		'game_6_packs': bench_games(6, 3 * scale),
+	}
+
+def render_bytes(games=5, packs=2, max_turns=200):
+	""" Bytes sent to the terminal per turn by the full screen and the differential Screen
+	Every Player has a terminal of its own, a frame is drawn at the start of the turn
+	and again once the Player took a card.
+	Args:
+		games: number of seeded games between greedy policies
+		packs: number of packs in the Deck
+		max_turns: turns played in each game at most
+	Returns:
+		dict with the bytes per turn of both modes
+	"""
+	totals = {'full': 0, 'diff': 0}
+	turns = 0
+	for seed in range(games):
+		game = new_game(2, packs, seed, ["Tom", "Narm"])
+		policy = GreedyPolicy(random.Random(seed))
+		screens = [{'full': Screen(diff=False, headless=True), 'diff': Screen(headless=True)} for p in game.players]
+		for turn in range(max_turns):
+			player = game.players[game.turn]
+			for screen in screens[game.turn].values():
+				player.render(screen)
+			if policy.choose_source(player, game) != 'P' or player.pick_card() is None:
+				if player.take_card() is None:
+					break
+			for screen in screens[game.turn].values():
+				player.render(screen)
+			turns += 1
+			card = policy.choose_close(player, game)
+			if card is not None and player.close(card.label()):
+				break
+			player.drop_card(policy.choose_drop(player, game).label())
+			game.turn = (game.turn + 1) % len(game.players)
+		for pair in screens:
+			for mode, screen in pair.items():
+				totals[mode] += screen.bytes
+	return {'turns': turns, 'full_bytes_per_turn': totals['full'] / turns, 'diff_bytes_per_turn': totals['diff'] / turns}
+
+def hint_latency(games=60, packs=2, max_turns=60, repeat=3):
+	""" Latency of cold hints on the 14 card stashes of seeded games between greedy policies
+	The distance and hand caches are emptied before every hint, as in bench_hint, and the
+	fastest of a few hints on the same stash is kept.
+	Args:
+		games: number of games, every game has a Joker rank
+		packs: number of packs in the Deck
+		max_turns: turns played in each game at most
+		repeat: number of hints on every stash
+	Returns:
+		dict with the number of hints, the median, 90th and 99th percentile and the
+		slowest hint in milliseconds, and the share of the hints slower than 1 ms
+	"""
+	times = []
+	for seed in range(games):
+		game = new_game(2, packs, seed, ["Tom", "Narm"], joker=True)
+		policy = GreedyPolicy(random.Random(seed))
+		for turn in range(max_turns):
+			player = game.players[game.turn]
+			if policy.choose_source(player, game) != 'P' or player.pick_card() is None:
+				if player.take_card() is None:
+					break
+			best = None
+			for i in range(repeat):
+				rummy_final._DISTANCE_CACHE.clear()
+				rummy_final.HAND_CACHE.clear()
+				start = time.perf_counter()
+				player.hint()
+				elapsed = time.perf_counter() - start
+				if best is None or elapsed < best:
+					best = elapsed
+			times.append(best * 1e3)
+			card = policy.choose_close(player, game)
+			if card is not None and player.close(card.label()):
+				break
+			player.drop_card(policy.choose_drop(player, game).label())
+			game.turn = (game.turn + 1) % len(game.players)
+	times.sort()
+	n = len(times)
+	return {'hints': n, 'p50_ms': times[n // 2], 'p90_ms': times[n * 9 // 10], 'p99_ms': times[n * 99 // 100],
+		'max_ms': times[-1], 'over_1ms': sum(1 for t in times if t > 1) / n}
+
+def deck_setup(packs=range(MIN_PACKS, MAX_PACKS + 1), count=200):
+	""" Memory and build time of a Deck for every number of packs
+	Args:
+		packs: numbers of packs to measure
+		count: number of Decks built for each
+	Returns:
+		list of dicts with the packs, the bytes held by one Deck and the microseconds to build one
+	"""
+	report = []
+	for n in packs:
+		tracemalloc.start()
+		decks = [Deck(n) for i in range(count)]
+		held = tracemalloc.get_traced_memory()[0]
+		tracemalloc.stop()
+		del decks
+		run, calls = bench_decks(n, count)
+		report.append({'packs': n, 'bytes_per_deck': held // count, 'us_per_deck': measure(run, calls, 3)})
+	return report
+
+def measure(run, calls, repeat):
+	""" Best time of a benchmark body
+	Args:
+		run: benchmark body
+		calls: number of calls in one run of the body
+		repeat: number of runs, the fastest is kept
+	Returns:
+		microseconds per call - float
+	"""
+	best = None
+	for i in range(repeat):
+		start = time.perf_counter()
+		run()
+		elapsed = time.perf_counter() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best * 1e6 / calls
+
+def run_suite(names=None, repeat=5, scale=1):
+	""" Run the benchmarks
+	Args:
+		names: names of the benchmarks to run, all of them when not given
+		repeat: number of runs of each benchmark
+		scale: multiplier for the corpus sizes
+	Returns:
+		dict of name to microseconds per call
+	"""
+	results = {}
+	for name, (run, calls) in benchmarks(scale).items():
+		if names and name not in names:
+			continue
+		results[name] = measure(run, calls, repeat)
+	return results
+
+def compare(results, baseline, threshold):
+	""" Compare timings with a baseline
+	Args:
+		results: dict of name to microseconds per call
+		baseline: dict of name to microseconds per call
+		threshold: allowed slow down, 0.25 for 25%
+	Returns:
+		list of (name, baseline, result, ratio) of the benchmarks that regressed
+	"""
+	regressions = []
+	for name, us in sorted(results.items()):
+		if name not in baseline:
+			continue
+		ratio = us / baseline[name]
+		if ratio > 1 + threshold:
+			regressions.append((name, baseline[name], us, ratio))
+	return regressions
+
+def main():
+	""" Main Program """
+	parser = argparse.ArgumentParser(description="Benchmark the Rummy hot paths")
+	parser.add_argument('--save', metavar='FILE', help="write the timings as a JSON baseline")
+	parser.add_argument('--compare', metavar='FILE', help="fail when slower than this JSON baseline")
+	parser.add_argument('--threshold', type=float, default=0.25, help="allowed slow down, 0.25 for 25%%")
+	parser.add_argument('--repeat', type=int, default=5)
+	parser.add_argument('--scale', type=int, default=1, help="multiplier for the corpus sizes")
+	parser.add_argument('--only', nargs='+', metavar='NAME', help="benchmarks to run")
+	parser.add_argument('--render', action='store_true', help="only compare the bytes sent by the two screen modes")
+	parser.add_argument('--decks', action='store_true', help="only report the memory and build time of a Deck for 1 to 8 packs")
+	parser.add_argument('--hints', action='store_true', help="only report the latency of cold hints in greedy games")
+	parser.add_argument('--max-p90', type=float, default=1.0, metavar='MS', help="fail when the 90th percentile hint is slower")
+	args = parser.parse_args()
+
+	if args.render:
+		print(json.dumps(render_bytes()))
+		return
+	if args.decks:
+		for line in deck_setup():
+			print(json.dumps(line))
+		return
+	if args.hints:
+		report = hint_latency()
+		print(json.dumps(report))
+		if report['p90_ms'] > args.max_p90:
+			print("REGRESSION hint: 90th percentile %.3f ms > %.3f ms" % (report['p90_ms'], args.max_p90), file=sys.stderr)
+			sys.exit(1)
+		return
+
+	results = run_suite(args.only, args.repeat, args.scale)
+	baseline = {}
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)['results']
+	for name, us in results.items():
+		line = "%-20s %12.3f us" % (name, us)
+		if name in baseline:
+			line += "  %+7.1f%%" % ((us / baseline[name] - 1) * 100)
+		print(line)
+
+	if args.save:
+		with open(args.save, 'w') as f:
+			json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=1, sort_keys=True)
+
+	if args.compare:
+		regressions = compare(results, baseline, args.threshold)
+		for name, before, after, ratio in regressions:
+			print("REGRESSION %s: %.3f us -> %.3f us (x%.2f)" % (name, before, after, ratio), file=sys.stderr)
+		if regressions:
+			sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,373 @@
+#!/usr/bin/python3
+
+import argparse
+import concurrent.futures
+import os
+import random
+import time
+
+from rummy_final import (Game, Deck, Player, CARDS_PER_PACK, PARTNER_MASKS, cached_solve, joker_mask,
+	print_cards)
+from rummy_sim import Policy, GreedyPolicy, play_game
+
+"""
+Monte Carlo Rummy bot.
+Chooses between the Pile and the Deck, and which card to drop, by playing out
+determinized rollouts: the unseen cards are shuffled into a possible Deck and
+opponent hands, and the rest of the game is played out for a few rounds with a
+fast greedy policy.  Rollouts run on worker processes for a fixed wall clock
+budget per move.
+
+Usage:
+	python3 rummy_bot.py --games 20 --budget 0.05 --workers 4
+"""
+
+def _loose_cards(hand, jokers):
+	""" Number of cards of a hand of card codes that cannot share a set with any other card
+	A cheap stand in for HandEvaluator.distance at the end of a rollout.
+	"""
+	mask = 0
+	for code in hand:
+		mask |= 1 << code
+	loose = 0
+	for code in hand:
+		if not (jokers >> code) & 1 and not PARTNER_MASKS[code] & mask and hand.count(code) == 1:
+			loose += 1
+	return loose
+
+def _worst_card(hand, jokers):
+	""" Index of the card with the fewest partners in a hand of card codes, Jokers are kept """
+	worst = None
+	for i, code in enumerate(hand):
+		if (jokers >> code) & 1:
+			continue
+		mask = PARTNER_MASKS[code] | (1 << code)
+		score = sum(1 for j, c in enumerate(hand) if j != i and (mask >> c) & 1)
+		if worst is None or score < worst_score:
+			worst = i
+			worst_score = score
+	return worst if worst is not None else len(hand) - 1
+
+def _end_turn(hand, pile, jokers):
+	""" Drop the worst card of a hand of 14 card codes, or close the game
+	Args:
+		hand: list of card codes, changed in place
+		pile: list of card codes with the top card last, changed in place
+		jokers: card code mask of the Jokers
+	Returns:
+		True if the rest of the hand closes the game
+	"""
+	drop = hand.pop(_worst_card(hand, jokers))
+	if cached_solve(hand, jokers) is not None:
+		return True
+	pile.append(drop)
+	return False
+
+def rollout(state, phase, action, rng):
+	""" Play out one determinized game from the bot's move
+	Args:
+		state: dict made by MonteCarloPolicy.state
+		phase: 'source' to try a card source, 'drop' to try a card to drop
+		action: 'P' or 'T' for the source phase, a card code for the drop phase
+		rng: random.Random instance
+	Returns:
+		score of the move between 0 (an opponent closed) and 1 (the bot closed)
+	"""
+	jokers = state['jokers']
+	pile = list(state['pile'])
+	unseen = list(state['unseen'])
+	rng.shuffle(unseen)
+
+	# Deal the unseen cards into the opponent hands and the Deck
+	hands = [list(state['hand'])]
+	start = 0
+	for size in state['opponents']:
+		hands.append(unseen[start:start + size])
+		start += size
+	deck = unseen[start:start + state['deck_size']]
+
+	hand = hands[0]
+	if phase == 'source':
+		if action == 'P' and pile:
+			hand.append(pile.pop())
+		elif deck:
+			hand.append(deck.pop())
+		else:
+			return 0.5
+		if _end_turn(hand, pile, jokers):
+			return 1.0
+	else:
+		hand.remove(action)
+		pile.append(action)
+
+	turn = 1 % len(hands)
+	for step in range(state['horizon'] * len(hands)):
+		hand = hands[turn]
+		if pile and (PARTNER_MASKS[pile[-1]] | (1 << pile[-1])) & sum(1 << c for c in hand):
+			hand.append(pile.pop())
+		elif deck:
+			hand.append(deck.pop())
+		else:
+			break
+		if _end_turn(hand, pile, jokers):
+			return 1.0 if turn == 0 else 0.0
+		turn = (turn + 1) % len(hands)
+
+	# Nobody closed, compare how close the hands are
+	mine = _loose_cards(hands[0], jokers)
+	theirs = min(_loose_cards(h, jokers) for h in hands[1:])
+	return 0.5 + (theirs - mine) / 26
+
+def rollout_task(state, phase, actions, budget, seed):
+	""" Run rollouts over the candidate moves until the time budget is used up
+	Args:
+		state: dict made by MonteCarloPolicy.state
+		phase: 'source' or 'drop'
+		actions: candidate moves
+		budget: wall clock seconds to run for
+		seed: seed for the determinizations
+	Returns:
+		(list of total scores, list of rollout counts), one entry per action
+	"""
+	rng = random.Random(seed)
+	totals = [0.0] * len(actions)
+	counts = [0] * len(actions)
+	deadline = time.perf_counter() + budget
+	i = 0
+	# every action gets at least one rollout
+	while i < len(actions) or time.perf_counter() < deadline:
+		n = i % len(actions)
+		totals[n] += rollout(state, phase, actions[n], rng)
+		counts[n] += 1
+		i += 1
+	return totals, counts
+
+class RolloutPool:
+	""" RolloutPool Class - Worker processes shared by the bots of a process """
+
+	def __init__(self, workers=None):
+		""" Class Constructor
+		Args:
+			workers: number of worker processes, 0 runs the rollouts in this process,
+				defaults to the number of cores
+		Returns:
+			No return value
+		"""
+		self.workers = (os.cpu_count() or 1) if workers is None else workers
+		self.executor = None
+		if self.workers > 0:
+			self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+
+	def run(self, state, phase, actions, budget, rng):
+		""" Run rollouts on every worker for the time budget
+		Args:
+			state: dict made by MonteCarloPolicy.state
+			phase: 'source' or 'drop'
+			actions: candidate moves
+			budget: wall clock seconds per move
+			rng: random.Random instance for the worker seeds
+		Returns:
+			(list of total scores, list of rollout counts), one entry per action
+		"""
+		if self.executor is None:
+			return rollout_task(state, phase, actions, budget, rng.getrandbits(64))
+
+		futures = [self.executor.submit(rollout_task, state, phase, actions, budget, rng.getrandbits(64))
+			for i in range(self.workers)]
+		totals = [0.0] * len(actions)
+		counts = [0] * len(actions)
+		for future in futures:
+			t, c = future.result()
+			for n in range(len(actions)):
+				totals[n] += t[n]
+				counts[n] += c[n]
+		return totals, counts
+
+	def close(self):
+		""" Stop the worker processes
+		Args:
+			No args
+		Returns:
+			No returns
+		"""
+		if self.executor is not None:
+			self.executor.shutdown()
+			self.executor = None
+
+_POOLS = {}
+
+def get_pool(workers=None):
+	""" RolloutPool shared by all the bots of this process that use the same number of workers """
+	if workers not in _POOLS:
+		_POOLS[workers] = RolloutPool(workers)
+	return _POOLS[workers]
+
+class MonteCarloPolicy(Policy):
+	""" MonteCarloPolicy Class - Picks the move with the best determinized rollouts """
+
+	max_drops = 6		# cards to drop that are tried with rollouts
+
+	def __init__(self, rng, budget=0.05, workers=None, horizon=6):
+		""" Class Constructor
+		Args:
+			rng: random.Random instance the rollouts draw from
+			budget: wall clock seconds per decision
+			workers: worker processes, 0 to run the rollouts in the calling process
+			horizon: rounds played out after the move
+		Returns:
+			No return value
+		"""
+		Policy.__init__(self, rng)
+		self.budget = budget
+		self.workers = workers
+		self.horizon = horizon
+		self.rollouts = 0
+		self.rollout_time = 0.0
+
+	def rollouts_per_second(self):
+		""" Rollout rate of this bot so far
+		Args:
+			No args
+		Returns:
+			rollouts per second of wall clock time spent deciding - float
+		"""
+		return self.rollouts / self.rollout_time if self.rollout_time else 0.0
+
+	def state(self, player, game):
+		""" Everything the Player can see, as card codes
+		Args:
+			player: the Player whose turn it is
+			game: the Game being played
+		Returns:
+			dict for rollout
+		"""
+		deck = player.deck
+		unseen = [0] * CARDS_PER_PACK
+		for code in range(CARDS_PER_PACK):
+			unseen[code] = deck.packs
+		seen = player.stash + list(game.pile) + ([deck.joker] if deck.joker is not None else [])
+		for card in seen:
+			unseen[card.code] -= 1
+		return {
+			'hand': [card.code for card in player.stash],
+			'pile': [card.code for card in game.pile],
+			'unseen': [code for code in range(CARDS_PER_PACK) for n in range(unseen[code])],
+			'opponents': [len(p.stash) for p in game.players if p is not player],
+			'deck_size': len(deck.cards),
+			'jokers': deck.joker_mask() | joker_mask(player.stash),
+			'horizon': self.horizon,
+		}
+
+	def best(self, player, game, phase, actions):
+		""" Run the rollouts and return the best action """
+		start = time.perf_counter()
+		totals, counts = get_pool(self.workers).run(self.state(player, game), phase, actions, self.budget, self.rng)
+		self.rollout_time += time.perf_counter() - start
+		self.rollouts += sum(counts)
+		return max(range(len(actions)), key=lambda n: totals[n] / max(counts[n], 1))
+
+	def choose_source(self, player, game):
+		if not game.pile:
+			return 'T'
+		return ['P', 'T'][self.best(player, game, 'source', ['P', 'T'])]
+
+	def choose_drop(self, player, game):
+		# Only the cards that leave the stash closest to closing are played out
+		choices = {}
+		for card in player.stash:
+			if not card.isjoker and card.code not in choices:
+				choices[card.code] = card
+		if not choices:
+			return player.stash[-1]
+		ranked = sorted(choices.values(), key=player.evaluator.distance_without)[:self.max_drops]
+		n = self.best(player, game, 'drop', [card.code for card in ranked])
+		return ranked[n]
+
+class BotPlayer(Player):
+	""" BotPlayer Class - A Player whose turns are played by a Policy """
+
+	def __init__(self, name, deck, game, policy):
+		""" Class Constructor
+		Args:
+			name: Name of the Player - string
+			deck: Reference to the Deck Object that is part of the Game
+			game: Reference to the Game object that is being played now
+			policy: Policy object that makes the moves
+		Returns:
+			No return value
+		"""
+		Player.__init__(self, name, deck, game)
+		self.policy = policy
+
+	def play(self):
+		""" Play a single turn by the bot
+		Args:
+			No args
+		Returns:
+			True if the bot closed the game, False if it dropped a card,
+			None if the Deck and the Pile are both used up
+		"""
+		if self.policy.choose_source(self, self.game) != 'P' or self.pick_card() is None:
+			if self.take_card() is None:
+				return None
+			print("***", self.name, "took a card from the deck.")
+		else:
+			print("***", self.name, "picked", self.stash[-1], "from the pile.")
+
+		card = self.policy.choose_close(self, self.game)
+		if card is not None and self.close(card.label()):
+			print(print_cards(self.stash))
+			return True
+
+		card = self.policy.choose_drop(self, self.game)
+		self.drop_card(card.label())
+		print("***", self.name, "dropped", card)
+		return False
+
+def play_against_bot(name, packs=2, budget=0.05, workers=None):
+	""" Interactive game of a human Player against the Monte Carlo bot
+	Args:
+		name: name of the human Player
+		packs: number of packs in the Deck
+		budget: wall clock seconds per decision of the bot
+		workers: worker processes of the bot
+	Returns:
+		No returns
+	"""
+	deck = Deck(packs)
+	deck.shuffle()
+	game = Game(2, deck, [name, "Bot"])
+	game.players[1] = BotPlayer("Bot", deck, game, MonteCarloPolicy(random.Random(), budget=budget, workers=workers))
+	game.deal(13)
+	game.play()
+
+def main():
+	""" Main Program """
+	parser = argparse.ArgumentParser(description="Measure the Monte Carlo bot against the greedy policy")
+	parser.add_argument('--games', type=int, default=10)
+	parser.add_argument('--budget', type=float, default=0.05, help="seconds per decision")
+	parser.add_argument('--workers', type=int, default=None)
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--play', metavar='NAME', help="play against the bot in the terminal")
+	args = parser.parse_args()
+
+	if args.play:
+		play_against_bot(args.play, budget=args.budget, workers=args.workers)
+		return
+
+	wins = 0
+	rollouts = 0
+	elapsed = 0.0
+	for seed in range(args.seed, args.seed + args.games):
+		bot = MonteCarloPolicy(random.Random(seed), budget=args.budget, workers=args.workers)
+		result = play_game(seed, [bot, GreedyPolicy])
+		wins += result.winner == 0
+		rollouts += bot.rollouts
+		elapsed += bot.rollout_time
+		print(result, "rollouts/s: %.0f" % bot.rollouts_per_second())
+	print("bot won %d of %d games, %.0f rollouts per second" % (wins, args.games, rollouts / elapsed if elapsed else 0))
+	for pool in _POOLS.values():
+		pool.close()
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,267 @@
+#!/usr/bin/python3
+
+import argparse
+import collections
+import json
+import os
+import random
+import threading
+import time
+
+from rummy_final import Deck, Game
+from rummy_sim import EndurancePolicy, play_turn
+
+"""
+Structured events of Rummy games.
+A Game with an EventBus reports every deal, take, pick, drop, move, sort, close
+attempt and win.  The events go into a bounded ring buffer and a background thread
+hands them to the subscribers in batches, so the turn loop never waits on a sink.
+When the buffer is full the oldest events are dropped and counted.
+
+Usage:
+	python3 rummy_events.py --turns 20000
+	python3 rummy_events.py --turns 5000 --output events.jsonl
+"""
+
+# What an event can be about, in the order they happen in a turn
+EVENT_KINDS = ('deal', 'take', 'pick', 'drop', 'move', 'sort', 'close', 'win')
+
+# One reported event.  game is the key the Game was attached with, player the index
+#	of the Player (None for the deal), card the label of the Card or None.
+Event = collections.namedtuple('Event', ['seq', 'time', 'game', 'kind', 'player', 'card', 'data'])
+
+class EventBus:
+	""" EventBus Class - Ring buffer of events and the thread that delivers them
+
+	emit only appends a tuple to the buffer, the Event objects are made on the
+	delivery thread.  Without subscribers nothing is buffered at all.  Games on
+	several threads may share a bus, the buffer and its counts are guarded by a
+	lock of their own that is never held while a subscriber runs.
+	"""
+
+	def __init__(self, size=1 << 16, batch=512, interval=0.05):
+		""" Class Constructor
+		Args:
+			size: most events buffered, the oldest are dropped beyond it
+			batch: most events handed to a subscriber at once, a full batch wakes the thread up
+			interval: seconds the thread waits for a full batch before it delivers what there is
+		Returns:
+			No return value
+		"""
+		self.ring = collections.deque(maxlen=size)
+		self.batch = batch
+		self.interval = interval
+		self.subscribers = []
+		self.keys = {}	# Game -> key its events carry
+		self.seq = 0	# events emitted
+		self.dropped = 0	# events lost to a full buffer
+		self.delivered = 0	# events handed to the subscribers
+		self.errors = 0	# batches a subscriber failed on
+		self.lock = threading.Lock()	# one delivery at a time, so the subscribers see the events in order
+		self.guard = threading.Lock()	# the buffer, seq and dropped, emit may be called from many threads
+		self.wake = threading.Event()
+		self.thread = None
+		self.closed = False
+
+	def attach(self, game, key=None):
+		""" Make a Game report its events to the bus
+		Args:
+			game: Game object, attach it before the deal to get the deal event
+			key: what the events of the Game carry as game, a number is given when not set
+		Returns:
+			the key
+		"""
+		if key is None:
+			key = len(self.keys)
+		self.keys[game] = key
+		game.events = self
+		return key
+
+	def detach(self, game):
+		""" Stop the events of a Game, the ones already buffered are still delivered """
+		game.events = None
+		self.keys.pop(game, None)
+
+	def subscribe(self, subscriber):
+		""" Add a subscriber
+		Args:
+			subscriber: callable taking a list of Event, called on the delivery thread
+		Returns:
+			No returns
+		"""
+		self.subscribers.append(subscriber)
+		if self.thread is None:
+			self.thread = threading.Thread(target=self.run, name="rummy-events", daemon=True)
+			self.thread.start()
+
+	def unsubscribe(self, subscriber):
+		""" Remove a subscriber, it gets no batch after this returns """
+		with self.lock:
+			self.subscribers.remove(subscriber)
+
+	def emit(self, game, kind, player=None, card=None, data=None):
+		""" Buffer an event, called from the turn loop
+		Args:
+			game: the Game
+			kind: one of EVENT_KINDS
+			player: index of the Player
+			card: the Card object the event is about
+			data: dict of the other details
+		Returns:
+			No returns
+		"""
+		if not self.subscribers:
+			return
+		ring = self.ring
+		with self.guard:
+			if len(ring) == ring.maxlen:
+				self.dropped += 1
+			self.seq += 1
+			ring.append((self.seq, time.time(), self.keys.get(game), kind, player, card, data))
+			full = len(ring) >= self.batch
+		if full:
+			self.wake.set()
+
+	def run(self):
+		""" Body of the delivery thread """
+		while not self.closed:
+			self.wake.wait(self.interval)
+			self.wake.clear()
+			self.flush()
+
+	def flush(self):
+		""" Deliver every buffered event now
+		Args:
+			No args
+		Returns:
+			number of events delivered
+		"""
+		with self.lock:
+			ring = self.ring
+			count = 0
+			while True:
+				with self.guard:
+					raw = [ring.popleft() for i in range(min(len(ring), self.batch))]
+				if not raw:
+					break
+				batch = [Event(seq, stamp, game, kind, player, card.label() if card is not None else None, data)
+					for seq, stamp, game, kind, player, card, data in raw]
+				for subscriber in list(self.subscribers):
+					try:
+						subscriber(batch)
+					except Exception:
+						# a broken sink must not stop the others, nor the games
+						self.errors += 1
+				count += len(batch)
+			self.delivered += count
+			return count
+
+	def close(self):
+		""" Stop the delivery thread, deliver what is left and close the subscribers that can be closed
+		Args:
+			No args
+		Returns:
+			No returns
+		"""
+		self.closed = True
+		self.wake.set()
+		if self.thread is not None:
+			self.thread.join()
+		self.flush()
+		for subscriber in self.subscribers:
+			if hasattr(subscriber, 'close'):
+				subscriber.close()
+
+	def stats(self):
+		""" Counts of the bus
+		Args:
+			No args
+		Returns:
+			dict with the events emitted, delivered, dropped and still buffered, and the failed batches
+		"""
+		return {'emitted': self.seq, 'delivered': self.delivered, 'dropped': self.dropped,
+			'buffered': len(self.ring), 'errors': self.errors}
+
+class JsonlSink:
+	""" JsonlSink Class - Subscriber that appends every event to a file as a line of JSON """
+
+	def __init__(self, path):
+		""" Class Constructor
+		Args:
+			path: file to append to
+		Returns:
+			No return value
+		"""
+		self.path = path
+		self.file = open(path, 'a')
+		self.lines = 0
+
+	def __call__(self, batch):
+		""" Write a batch of events in one write """
+		self.file.write("".join(json.dumps(event._asdict(), separators=(',', ':')) + "\n" for event in batch))
+		self.file.flush()
+		self.lines += len(batch)
+
+	def close(self):
+		""" Close the file """
+		self.file.close()
+
+def overhead(turns, mode, packs=2, players=4, seed=0, path=None):
+	""" Time the turns of a game that never closes with the events reported in one of the ways
+	Args:
+		turns: number of turns to play
+		mode: 'off' without an EventBus, 'idle' with a bus and no subscriber,
+			'null' with a subscriber that ignores the events, 'jsonl' with a JsonlSink
+		packs: number of packs in the Deck
+		players: number of Players
+		seed: seed for the shuffle and for the Policies
+		path: file of the JsonlSink
+	Returns:
+		dict with the mode, the microseconds per turn and the counts of the bus
+	"""
+	rng = random.Random(seed)
+	deck = Deck(packs, rng)
+	deck.shuffle()
+	game = Game(players, deck, ['Player' + str(i) for i in range(players)], rng)
+	bus = None
+	if mode != 'off':
+		bus = EventBus()
+		bus.attach(game)
+		if mode == 'null':
+			bus.subscribe(lambda batch: None)
+		elif mode == 'jsonl':
+			bus.subscribe(JsonlSink(path))
+	game.deal(13)
+	policies = [EndurancePolicy(random.Random(rng.random())) for i in range(players)]
+
+	start = time.perf_counter()
+	for turn in range(turns):
+		if play_turn(game, policies[game.turn]) is None:
+			break
+		game.turn = (game.turn + 1) % len(game.players)
+	elapsed = time.perf_counter() - start
+
+	report = {'mode': mode, 'us_per_turn': round(elapsed * 1e6 / turns, 2)}
+	if bus is not None:
+		bus.close()
+		report.update(bus.stats())
+	return report
+
+def main():
+	""" Main Program """
+	parser = argparse.ArgumentParser(description="Measure the per turn cost of the Rummy event hooks")
+	parser.add_argument('--turns', type=int, default=20000)
+	parser.add_argument('--packs', type=int, default=2)
+	parser.add_argument('--players', type=int, default=4)
+	parser.add_argument('--output', default='events.jsonl', help="file the jsonl mode appends to, removed afterwards unless it was there before")
+	parser.add_argument('--keep', action='store_true', help="keep the file the jsonl mode wrote")
+	args = parser.parse_args()
+
+	existed = os.path.exists(args.output)
+	for mode in ('off', 'idle', 'null', 'jsonl'):
+		print(json.dumps(overhead(args.turns, mode, args.packs, args.players, path=args.output)))
+	if not args.keep and not existed:
+		os.remove(args.output)
+
+if __name__ == "__main__":
+	main()
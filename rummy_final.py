@@ -1,6 +1,18 @@
 #!/usr/bin/python3
 
+import argparse
+import collections
+import concurrent.futures
+import functools
+import io
+import itertools
+import json
+import mmap
+import os
 import random
+import struct
+import sys
+import zlib
 
 """
 Author: Vinitha Gadiraju
@@ -28,22 +40,41 @@ SYMBOLS = ['♠', '♢', '♡', '♣']
 SUIT = ['Hearts', 'Clubs', 'Spades', 'Diamonds']
 RANK = ['A', '2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K']
 RANK_VALUE = {'A': 1, '2': 2, '3': 3, '4': 4, '5': 5, '6': 6, '7': 7, '8': 8, '9': 9, 'T': 10, 'J': 11, 'Q': 12, 'K': 13}
+# RANK values of an Ace that follows the King, for runs like Q K A
+ACE_HIGH_VALUE = dict(RANK_VALUE, A=14)
 SUIT_SYMBOLS = {'Hearts': '♡', 'Clubs': '♣', 'Spades': '♠', 'Diamonds': '♢'}
 
+#constants for the compact integer representation of the cards.
+#	A card code is RANK index * 4 + SUIT index (0 - 51), so all four suits of a rank
+#	share one nibble of a hand mask and a single suit is every 4th bit.
+CARDS_PER_PACK = 52
+
+#limits of the configurable tables
+MIN_PACKS, MAX_PACKS = 1, 8
+MIN_PLAYERS, MAX_PLAYERS = 2, 10
+RANK_INDEX = {r: i for i, r in enumerate(RANK)}
+SUIT_INDEX = {s: i for i, s in enumerate(SUIT)}
+PACK_ORDER = [RANK_INDEX[r] * 4 + SUIT_INDEX[s] for s in SUIT for r in RANK]	# card codes of a new pack, in order
+
 class Card:
 	""" Card Class - Models a single Playing Card """
 
-	def __init__(self, rank, suit):
+	__slots__ = ('rank', 'suit', 'isjoker', 'pack', 'code')
+
+	def __init__(self, rank, suit, pack=0):
 		""" Class Constructor
 		Args:
 			rank: A valid RANK value - a single char
 			suit: A valid SUIT value - a string
+			pack: Index of the pack the Card belongs to - int value
 		Returns:
 			No return value
 		"""
 		self.rank = rank
 		self.suit = suit
 		self.isjoker = False
+		self.pack = pack
+		self.code = card_code(rank, suit)
 
 	def __str__(self):
 		""" Helper for builtin __str__ function
@@ -58,6 +89,15 @@ class Card:
 			return (self.rank + SUIT_SYMBOLS[self.suit] + '-J')
 		return (self.rank + SUIT_SYMBOLS[self.suit])
 
+	def label(self):
+		""" User Input string representation of the Card
+		Args:
+			no args.
+		Returns:
+			Rank followed by first letter of Suit. For example 4H for 4 of Hearts
+		"""
+		return self.rank + self.suit[0]
+
 	def is_joker(self):
 		"""Status check to see if this Card is a Joker
 		Args:
@@ -67,25 +107,216 @@ class Card:
 		"""
 		return self.isjoker
 
+class DeckCard(Card):
+	""" DeckCard Class - Card of a Deck
+	Every pack of a Deck holds its own DeckCards, so the copies of a card stay apart.
+	Whether a DeckCard is a Joker is decided by its rank and the Joker rank of the
+	Deck, so picking the Joker does not touch the cards.
+	"""
+
+	__slots__ = ('deck',)
+
+	def __init__(self, code, deck, pack=0):
+		""" Class Constructor
+		Args:
+			code: card code of the Card, see card_code
+			deck: the Deck the Card belongs to
+			pack: Index of the pack the Card belongs to - int value
+		Returns:
+			No return value
+		"""
+		self.rank = RANK[code >> 2]
+		self.suit = SUIT[code & 3]
+		self.pack = pack
+		self.code = code
+		self.deck = deck
+
+	@property
+	def isjoker(self):
+		""" Joker status, a single check of the rank against the Joker rank of the Deck """
+		return self.rank == self.deck.joker_rank
+
+class CardZone(list):
+	""" CardZone Class - An ordered group of Cards: the Deck, the Pile or a stash
+	The top of the zone is the end of the list, so drawing, pushing and peeking
+	at the top card do not shift the other cards.
+	"""
+
+	__slots__ = ()
+
+	def push(self, card):
+		""" Put a card on top of the zone
+		Args:
+			card: Card object
+		Returns:
+			No returns
+		"""
+		self.append(card)
+
+	def draw(self):
+		""" Take the top card of the zone
+		Args:
+			No args
+		Returns:
+			the Card Object, or None if the zone is empty
+		"""
+		if len(self) == 0:
+			return None
+		return self.pop()
+
+	def peek(self):
+		""" Look at the top card of the zone without taking it
+		Args:
+			No args
+		Returns:
+			the Card Object, or None if the zone is empty
+		"""
+		if len(self) == 0:
+			return None
+		return self[-1]
+
+class Stash(CardZone):
+	""" Stash Class - The cards of a Player, indexed by their label
+	labels maps a label such as 4H to the Cards with that label in stash order, so
+	looking a card up does not scan the stash and the copies of a card from
+	different packs are told apart by their place in the stash.
+	"""
+
+	__slots__ = ('labels',)
+
+	def __init__(self, cards=()):
+		""" Class Constructor
+		Args:
+			cards: Card objects to start with
+		Returns:
+			No return value
+		"""
+		super().__init__(cards)
+		self.reindex()
+
+	def reindex(self):
+		""" Build the label index again from the whole stash """
+		self.labels = {}
+		for card in self:
+			self.labels.setdefault(card.label(), []).append(card)
+
+	def find(self, label, copy=0):
+		""" Card of the stash with a label
+		Args:
+			label: Rank followed by first letter of Suit.  For example: 4H
+			copy: 0 for the first card with the label in the stash, 1 for the second...
+		Returns:
+			the Card Object, or None if the stash does not have it
+		"""
+		copies = self.labels.get(label)
+		if copies is None or copy >= len(copies):
+			return None
+		return copies[copy]
+
+	def _add(self, card):
+		""" Index a card that was put in the stash """
+		copies = self.labels.setdefault(card.label(), [])
+		copies.append(card)
+		if len(copies) > 1:
+			copies.sort(key=self.position)
+
+	def _forget(self, card):
+		""" Drop a card that left the stash from the index """
+		label = card.label()
+		copies = self.labels[label]
+		if len(copies) == 1:
+			del self.labels[label]
+		else:
+			copies.remove(card)
+
+	def position(self, card):
+		""" Index of a Card object in the stash, raises ValueError if it is not there """
+		for i, item in enumerate(self):
+			if item is card:
+				return i
+		raise ValueError('ERROR: The card is not in the stash')
+
+	def append(self, card):
+		list.append(self, card)
+		self._add(card)
+
+	def insert(self, i, card):
+		list.insert(self, i, card)
+		self._add(card)
+
+	def pop(self, i=-1):
+		card = list.pop(self, i)
+		self._forget(card)
+		return card
+
+	def remove(self, card):
+		del self[self.position(card)]
+
+	def __delitem__(self, key):
+		if isinstance(key, slice):
+			list.__delitem__(self, key)
+			self.reindex()
+			return
+		card = self[key]
+		list.__delitem__(self, key)
+		self._forget(card)
+
+	def __setitem__(self, key, value):
+		if isinstance(key, slice):
+			list.__setitem__(self, key, value)
+			self.reindex()
+			return
+		old = self[key]
+		list.__setitem__(self, key, value)
+		self._forget(old)
+		self._add(value)
+
+	def __iadd__(self, cards):
+		list.extend(self, cards)
+		self.reindex()
+		return self
+
+	def extend(self, cards):
+		list.extend(self, cards)
+		self.reindex()
+
+	def clear(self):
+		list.clear(self)
+		self.labels = {}
+
+	def sort(self, *args, **kwargs):
+		list.sort(self, *args, **kwargs)
+		self.reindex()
+
+	def reverse(self):
+		list.reverse(self)
+		self.reindex()
+
 class Deck:
 	""" Deck Class - Models the card Deck """
 
-	def __init__(self, packs):
+	def __init__(self, packs, rng=None):
 		""" Class Constructor
 		Args:
 			packs: Number of packs used to create the Deck - int value
+			rng: seed or random.Random instance for the shuffles and the Joker,
+				a fresh unseeded random.Random when not given
 		Returns:
 			No return value
 		"""
+		if not MIN_PACKS <= packs <= MAX_PACKS:
+			raise ValueError('ERROR: A Deck has ' + str(MIN_PACKS) + ' to ' + str(MAX_PACKS) + ' packs')
 		self.packs = packs
-		self.cards = []
+		self.rng = make_rng(rng)
 		self.joker = None
+		self.joker_rank = None	# every Card of this rank is a Joker
+		self.discards = None	# the Pile the Deck is refilled from once it runs out
+		self.tracker = None	# CardTracker told about the cards the Pile gives back
 
-		# Create all cards in the Deck
-		for i in range(packs):
-			for s in SUIT:
-				for r in RANK:
-					self.cards.append(Card(r, s))
+		# Create the cards of every pack, indexed by pack and card code
+		self.copies = [[DeckCard(code, self, pack) for code in range(CARDS_PER_PACK)] for pack in range(packs)]
+		self.faces = self.copies[0]
+		self.cards = CardZone([copies[code] for copies in self.copies for code in PACK_ORDER])
 
 	def shuffle(self):
 		""" Shuffle the Deck, so that cards are ordered in a random order
@@ -94,36 +325,70 @@ class Deck:
 		Returns:
 			No return value
 		"""
-		random.shuffle(self.cards)
+		self.rng.shuffle(self.cards)
 
 	def draw_card(self):
 		""" Draw a card from the top of the Deck
+		When the Deck runs out, the Pile is shuffled back into it.
+		Args:
+			No args
+		Returns:
+			a Card Object, or None if the Deck and the Pile are both used up
+		"""
+		if len(self.cards) == 0:
+			self.recycle()
+		return self.cards.draw()
+
+	def recycle(self):
+		""" Shuffle the Pile back into the Deck, except for the top card of the Pile
 		Args:
 			No args
 		Returns:
-			a Card Object
+			True if cards were moved into the Deck, otherwise False
 		"""
-		a = self.cards[0]
-		self.cards.pop(0)
-		return a
+		if self.discards is None or len(self.discards) < 2:
+			return False
+		top = self.discards.draw()
+		if self.tracker is not None:
+			self.tracker.recycled(self.discards)
+		self.cards.extend(self.discards)
+		self.discards.clear()
+		self.discards.push(top)
+		self.shuffle()
+		return True
 
 	def set_joker(self):
 		""" Set the Joker Cards in the Deck
 		A Card is selected at random from the deck as Joker.
-		All cards with the same Rank as the Joker are also set to Jokers.
+		All cards with the same Rank as the Joker are also Jokers.
 		Args:
 			No args
 		Returns:
 			No returns
 		"""
-		self.joker = random.choice(self.cards)
-
 		# remove the Joker from Deck and display on Table for Players to see
-		self.cards.remove(self.joker)
+		self.joker = self.cards.pop(self.rng.randrange(len(self.cards)))
+		self.joker_rank = self.joker.rank
+
+	def joker_mask(self):
+		""" Compact form of the Joker selection
+		Args:
+			No args
+		Returns:
+			card code mask of all the Jokers, 0 if no Joker is set - int value
+		"""
+		if self.joker is None:
+			return 0
+		return rank_mask(RANK_INDEX[self.joker.rank])
 
-		for card in self.cards:
-			if self.joker.rank == card.rank:
-				card.isjoker = True
+	def card_ints(self):
+		""" Compact form of the cards left in the Deck
+		Args:
+			No args
+		Returns:
+			list of card ints (see card_to_int) in Deck order
+		"""
+		return [card_to_int(card) for card in self.cards]
 
 class Player:
 	""" Player Class - Models Players Hand and play actions """
@@ -137,10 +402,11 @@ class Player:
 		Returns:
 			No return value
 		"""
-		self.stash = []	# Stash represents the hand of the Player.
+		self.stash = Stash()	# Stash represents the hand of the Player.
 		self.name = name
 		self.deck = deck
 		self.game = game
+		self.evaluator = HandEvaluator()	# distance to close, kept up to date with the stash
 
 	def deal_card(self, card):
 		""" Deal a Card to the Player
@@ -151,6 +417,7 @@ class Player:
 		"""
 		try:
 			self.stash.append(card)
+			self.evaluator.add(card)
 			if len(self.stash) > 14:
 				raise ValueError('ERROR: Player cannot have more than 14 cards during turn')
 		except ValueError as err:
@@ -168,16 +435,126 @@ class Player:
 		card = get_object(self.stash, card)
 
 		# Cannot drop a card if it is already not in stash
-		if card not in self.stash:
+		if card is None:
 			return False
 
-		self.stash.remove(card)
+		self.discard(card)
+		return True
+
+	def discard(self, card):
+		""" Drop a Card object of the stash into the Pile
+		Args:
+			card: Card object in the stash
+		Returns:
+			No returns
+		"""
+		where = self.stash.position(card)
+		self.record(LOG_DROP, where)
+		del self.stash[where]
+		self.evaluator.remove(card)
+		self.emit('drop', card)
 
 		# Player dropped card goes to Pile
 		self.game.add_pile(card)
 
+	def pick_card(self):
+		""" Pick the top card of the Pile into the stash
+		Args:
+			No args
+		Returns:
+			the Card Object, or None if the Pile is empty
+		"""
+		card = self.game.draw_pile()
+		if card is not None:
+			self.record(LOG_PICK)
+			self.stash.append(card)
+			self.evaluator.add(card)
+			self.emit('pick', card)
+		return card
+
+	def take_card(self):
+		""" Take the top card of the Deck into the stash
+		Args:
+			No args
+		Returns:
+			the Card Object, or None if the Deck and the Pile are both used up
+		"""
+		card = self.deck.draw_card()
+		if card is not None:
+			self.record(LOG_TAKE)
+			self.stash.append(card)
+			self.evaluator.add(card)
+			self.emit('take', card)
+		return card
+
+	def move_card(self, what, where=""):
+		""" Move a card of the stash in front of another card
+		Args:
+			what: The player input representation of the Card to move.  For example: AC
+			where: The player input representation of the Card to move it in front of,
+				"" to move it to the end of the stash
+		Returns:
+			Success or Failure as True/False
+		"""
+		move_what = get_object(self.stash, what)
+		if move_what is None:
+			return False
+		if where == "":
+			# If the move_where was not specified by the User then,
+			#		the card to the end of the stash
+			self.move_index(self.stash.position(move_what), len(self.stash))
+			return True
+
+		move_where = get_object(self.stash, where)
+		if move_where is None:
+			return False
+		self.move_index(self.stash.position(move_what), self.stash.position(move_where))
 		return True
 
+	def move_index(self, what, where):
+		""" Move the card at one position of the stash in front of the card at another
+		Args:
+			what: index of the card to move
+			where: index of the card to move it in front of, len(stash) for the end
+		Returns:
+			No returns
+		"""
+		self.record(LOG_MOVE, what, where)
+		card = self.stash.pop(what)
+		if where > what:
+			where -= 1
+		self.stash.insert(where, card)
+		self.emit('move', card, {'from': what, 'to': where})
+
+	def sort_cards(self):
+		""" Sort the stash in the incresing order of RANK values
+		Args:
+			No args
+		Returns:
+			No returns
+		"""
+		self.record(LOG_SORT)
+		sort_sequence(self.stash)
+		self.emit('sort')
+
+	def close(self, card):
+		""" Drop a card and close the game
+		Args:
+			card: The player input representation of the Card to drop.  For example: AC
+		Returns:
+			True if the game is closed, False if the stash cannot close the game
+			(the dropped card is back in the stash), None if the card is not in the stash
+		"""
+		if not self.drop_card(card):
+			return None
+		if self.close_game():
+			return True
+
+		# if this Close was false alarm then discarded Card will
+		#		have to be put back into the stash for the Player to continue.
+		self.pick_card()
+		return False
+
 
 	def close_game(self):
 		""" Close Game operation by the Player
@@ -186,25 +563,136 @@ class Player:
 		Returns:
 			Success or Failure as True/False
 		"""
-		# Divide the stash into 4 sets, 3 sets of 3 cards and 1 set of 4 cards
-		set_array = [self.stash[:3], self.stash[3:6], self.stash[6:9], self.stash[9:]]
-
-		# Need to count the number of sets that are runs without a joker.
-		# 	There must be at least one run with out a joker
-		count = 0
-		for s in set_array:
-			if is_valid_run(s):
-				count += 1
-		if count == 0:
+		self.record(LOG_CLOSE)
+		split = self.winning_split()
+		self.emit('close', None, {'closed': split is not None})
+		if split is None:
 			return False
 
-		# Check if each of the sets is either a run or a book
-		for s in set_array:
-			if is_valid_run(s) == False and is_valid_book(s) == False and is_valid_run_joker(s) == False:
-				return False
-
+		# Arrange the stash in the winning sets, 3 sets of 3 cards and then the set of 4 cards
+		self.stash[:] = [card for s in split for card in s]
+		self.emit('win')
 		return True
 
+	def winning_split(self):
+		""" Find the sets that close the game, whatever order the stash is in
+		Args:
+			No args
+		Returns:
+			list of 4 lists of Card objects (3 sets of 3 cards, then the set of 4 cards)
+			or None if the stash cannot close the game
+		"""
+		split = cached_solve([card.code for card in self.stash], joker_mask(self.stash))
+		if split is None:
+			return None
+		return [[self.stash[i] for i in s] for s in split]
+
+	def distance(self):
+		""" Number of cards the stash must change before it can close the game
+		Args:
+			No args
+		Returns:
+			0 to 13, see HandEvaluator.distance
+		"""
+		return self.evaluator.distance()
+
+	def hint(self):
+		""" Find the card to drop that leaves the stash closest to closing the game
+		One search of the 14 cards finds the best arrangement, and any card it leaves
+		out is a drop that reaches the best distance, so the 14 drops are not searched
+		one by one.  When the rest may close the game it is checked with the solver.
+		Args:
+			No args
+		Returns:
+			(Card to drop, distance left, True if the other 13 cards close the game,
+			the sets of the other 13 cards as lists of Card objects) or None without 14 cards.
+			Sets that are not complete yet are listed with the cards they have.
+		"""
+		if len(self.stash) != 14:
+			return None
+		distance, runs, books, singles = self.evaluator.arrangement()
+
+		# hand the cards out to the sets, a run takes the natural card of a code before a Joker
+		natural = {}
+		wild = {}
+		present = 0
+		for card in self.stash:
+			(wild if card.isjoker else natural).setdefault(card.code, []).append(card)
+			present |= 1 << card.code
+		sets = []
+		for codes in runs:
+			sets.append([(natural[c] if natural.get(c) else wild[c]).pop() for c in codes])
+		for rank, n in books:
+			cards = []
+			for code in range(rank * 4, rank * 4 + 4):
+				while natural.get(code) and len(cards) < n:
+					cards.append(natural[code].pop())
+			sets.append(cards)
+
+		# the cards left over beyond the single card sets are not needed, drop the least useful
+		spare = [card for cards in natural.values() for card in cards]
+		spare_jokers = [card for cards in wild.values() for card in cards]
+		if len(spare) <= singles and spare_jokers:
+			card = spare_jokers[0]
+		else:
+			card = min(spare, key=lambda c: (PARTNER_MASKS[c.code] & present).bit_count())
+
+		if distance == 0:
+			rest = list(self.stash)
+			del rest[self.stash.position(card)]
+			split = cached_solve([c.code for c in rest], joker_mask(rest))
+			if split is not None:
+				return card, 0, True, [[rest[i] for i in s] for s in split]
+			# the distance lets Jokers fill any run, try the other cards the arrangement
+			#	leaves out with the solver
+			found = closing_split(self.stash, spare + spare_jokers)
+			if found is not None:
+				return found[0], 0, True, found[1]
+			distance = 1
+		return card, distance, False, sets
+
+	def render(self, screen):
+		""" Draw the stash, the top of the Pile and the action prompt
+		Args:
+			screen: Screen object to draw on
+		Returns:
+			No returns
+		"""
+		prompt = "*** " + self.name + ", What would you like to do? ***, \n(M)ove Cards, (P)ick from pile, (T)ake from deck, (D)rop, (S)ort, (H)int, (C)lose Game, (R)ules: "
+		screen.frame(["*** " + self.name + " your cards are:", print_cards(self.stash), self.game.pile_text()] + prompt.split("\n"))
+
+	def record(self, action, *args):
+		""" Add an action of the Player to the log of the Game, if the Game keeps one
+		Args:
+			action: one of the LOG_ action codes
+			args: stash indexes the action takes
+		Returns:
+			No returns
+		"""
+		if self.game is not None and self.game.log is not None:
+			self.game.log.record(action, self.game.players.index(self), *args)
+
+	def emit(self, kind, card=None, data=None):
+		""" Report an event of the Player to the EventBus of the Game, if the Game has one
+		Args:
+			kind: one of rummy_events.EVENT_KINDS
+			card: the Card the event is about
+			data: dict of the other details
+		Returns:
+			No returns
+		"""
+		if self.game is not None and self.game.events is not None:
+			self.game.events.emit(self.game, kind, self.game.players.index(self), card, data)
+
+	def hand_mask(self):
+		""" Compact form of the stash
+		Args:
+			No args
+		Returns:
+			HandMask of the cards in the stash
+		"""
+		return HandMask.from_cards(self.stash)
+
 	def play(self):
 		""" Play a single turn by the Player
 		Args:
@@ -214,141 +702,177 @@ class Player:
 		"""
 		# Stay in a loop until the Player drops a card or closes the game.
 		while True:
-			# clear screen to remove the output of previous Player action
-			print(chr(27)+"[2J")
-			print("***",self.name,"your cards are:")
-			print(print_cards(self.stash))
-			self.game.display_pile()
+			# redraw what changed since the previous Player action
+			self.render(self.game.screen)
 
 			# Get Player Action
-			action = input("*** " + self.name + ", What would you like to do? ***, \n(M)ove Cards, (P)ick from pile, (T)ake from deck, (D)rop, (S)ort, (C)lose Game, (R)ules: ")
+			action = self.game.ask()
 
 			# Move or Rearrange Cards in the stash
 			if action == 'M' or action == 'm':
 				# Get the Card that needs to moved.
-				move_what = input("Enter which card you want to move. \nEnter Rank followed by first letter of Suit. i.e. 4H (4 of Hearts): ")
-				move_what.strip()
-				if get_object(self.stash, move_what.upper()) not in self.stash:
-					input("ERROR: That card is not in your stash.  Enter to continue")
+				move_what = self.game.ask("Enter which card you want to move. \nEnter Rank followed by first letter of Suit. i.e. 4H (4 of Hearts): ")
+				move_what = move_what.strip().upper()
+				if get_object(self.stash, move_what) is None:
+					self.game.pause("ERROR: That card is not in your stash.  Enter to continue")
 					continue
 
 				# Get the Card where the move_what needs to moved.
-				move_where = input("Enter where you want move card to (which card the moving card will go before) Enter Space to move to end \nEnter Rank followed by first letter of Suit. i.e. 4H (4 of Hearts):" )
-				move_where.strip()
-				if move_where != "" and get_object(self.stash, move_where.upper()) not in self.stash:
-					input("ERROR: This is an invalid location.  Enter to continue")
+				move_where = self.game.ask("Enter where you want move card to (which card the moving card will go before) Enter Space to move to end \nEnter Rank followed by first letter of Suit. i.e. 4H (4 of Hearts):" )
+				move_where = move_where.strip().upper()
+				if not self.move_card(move_what, move_where):
+					self.game.pause("ERROR: This is an invalid location.  Enter to continue")
 					continue
 
-				# Perform the Move Operation
-				move_what = get_object(self.stash, move_what.upper())
-				if move_where != "":
-					move_where = get_object(self.stash, move_where.upper())
-					location = self.stash.index(move_where)
-					if location > self.stash.index(move_what):
-						location = location - 1
-					self.stash.remove(move_what)
-					self.stash.insert(location, move_what)
-				else:
-					# If the move_where was not specified by the User then,
-					#		the card to the end of the stash
-					self.stash.remove(move_what)
-					self.stash.append(move_what)
-
 			# Pick card from Pile
 			if action == 'P' or action == 'p':
-				if len(self.stash) < 14:
-					c = self.game.draw_pile()
-					self.stash.append(c)
-				else:
-					input("ERROR: You have " + str(len(self.stash)) + " cards. Cannot pick anymore. Enter to continue")
+				if len(self.stash) >= 14:
+					self.game.pause("ERROR: You have " + str(len(self.stash)) + " cards. Cannot pick anymore. Enter to continue")
+				elif self.pick_card() is None:
+					self.game.pause("ERROR: The pile is empty. Enter to continue")
 
 			# Take Card from Deck
 			if action == 'T' or action == 't':
 				if len(self.stash) < 14:
-					c = self.deck.draw_card()
-					self.stash.append(c)
+					if self.take_card() is None:
+						self.game.pause("ERROR: The deck is empty. Enter to continue")
 				else:
-					input("ERROR: You have " + str(len(self.stash)) + " cards. Cannot take anymore. Enter to continue")
+					self.game.pause("ERROR: You have " + str(len(self.stash)) + " cards. Cannot take anymore. Enter to continue")
 
 			# Drop card to Pile
 			if action == 'D' or action == 'd':
 				if len(self.stash) == 14:
-					drop = input("Which card would you like to drop? \nEnter Rank followed by first letter of Suit. i.e. 4H (4 of Hearts): ")
+					drop = self.game.ask("Which card would you like to drop? \nEnter Rank followed by first letter of Suit. i.e. 4H (4 of Hearts): ")
 					drop = drop.strip()
 					drop = drop.upper()
 					if self.drop_card(drop):
 						# return False because Drop Card does not end the game
 						return False
 					else:
-						input("ERROR: Not a valid card, Enter to continue")
+						self.game.pause("ERROR: Not a valid card, Enter to continue")
 				else:
-					input("ERROR: Cannot drop a card. Player must have 13 cards total. Enter to continue")
+					self.game.pause("ERROR: Cannot drop a card. Player must have 13 cards total. Enter to continue")
 
 			# Sort cards in the stash
 			if action == 'S' or action == 's':
-				sort_sequence(self.stash)
+				self.sort_cards()
+
+			# Suggest the card to drop
+			if action == 'H' or action == 'h':
+				hint = self.hint()
+				if hint is None:
+					self.game.pause("ERROR: Take or pick a card first. Enter to continue")
+				else:
+					card, distance, closes, sets = hint
+					if closes:
+						message = "Hint: Close the game dropping " + card.label() + ", your sets are"
+					else:
+						message = "Hint: Drop " + card.label() + ", " + str(distance) + " card(s) from closing, your sets are"
+					self.game.pause(message + " |".join(print_cards(s) for s in sets) + "\nEnter to continue")
 
 			# Close the Game
 			if action == 'C' or action == 'c':
 
 				if len(self.stash) == 14:
-					drop = input("Which card would you like to drop? \nEnter Rank followed by first letter of Suit. i.e. 4H (4 of Hearts): ")
+					drop = self.game.ask("Which card would you like to drop? \nEnter Rank followed by first letter of Suit. i.e. 4H (4 of Hearts): ")
 					drop = drop.strip()
 					drop = drop.upper()
-					if self.drop_card(drop):
-						if self.close_game():
+					closed = self.close(drop)
+					if closed:
+						if self.game.script is None:
 							print(print_cards(self.stash))
-							# Return True because Close ends the Game.
-							return True
-						else:
-							input("ERROR: The game is not over. Enter to Continue playing.")
-							# if this Close was false alarm then discarded Card will
-							#		have to be put back into the stash for the Player to continue.
-							self.stash.append(self.game.draw_pile())
+						# Return True because Close ends the Game.
+						return True
+					elif closed is None:
+						self.game.pause("ERROR: Not a valid card, Enter to continue")
 					else:
-						input("ERROR: Not a valid card, Enter to continue")
+						self.game.pause("ERROR: The game is not over. Enter to Continue playing.")
 				else:
-					input("ERROR: You do not have enough cards to close the game. Enter to Continue playing.")
+					self.game.pause("ERROR: You do not have enough cards to close the game. Enter to Continue playing.")
 
 			# Show Rules of the game
 			if action == 'R' or action == 'r':
-				print("------------------ Rules --------------------",
-					"\n- Rummy is a card game based on making sets.",
-					"\n- From a stash of 13 cards, 4 sets must be created (3 sets of 3, 1 set of 4).",
-					"\n- The set of 4 must always be at the end"
-					"\n- A valid set can either be a run or a book.",
-					"\n- One set must be a run WITHOUT using a joker."
-					"\n- A run is a sequence of numbers in a row, all with the same suit. ",
-					"\n \tFor example: 4 of Hearts, 5 of Hearts, and 6 of Hearts",
-					"\n- A book of cards must have the same rank but may have different suits.",
-					"\n \tFor example: 3 of Diamonds, 3 of Spades, 3 of Clubs",
-					"\n- Jokers are randomly picked from the deck at the start of the game.",
-					"\n- Joker is denoted by '-J' and can be used to complete sets.",
-					"\n- During each turn, the player may take a card from the pile or from the deck.",
-					"Immediately after, the player must drop any one card into the pile so as not go over the 13 card limit.",
-					"\n- When a player has created all the sets, select Close Game option and drop the excess card into the pile.",
-					"\n- Card with Rank 10 is represented as Rank T"
-					"\n--------------------------------------------" )
-				input("Enter to continue ....")
+				# a script has no one to read the rules
+				if self.game.script is None:
+					self.game.screen.invalidate()
+					print("------------------ Rules --------------------",
+						"\n- Rummy is a card game based on making sets.",
+						"\n- From a stash of 13 cards, 4 sets must be created (3 sets of 3, 1 set of 4).",
+						"\n- The cards may be in any order, the sets are found when the game is closed."
+						"\n- A valid set can either be a run or a book.",
+						"\n- One set must be a run WITHOUT using a joker."
+						"\n- A run is a sequence of numbers in a row, all with the same suit. ",
+						"\n \tFor example: 4 of Hearts, 5 of Hearts, and 6 of Hearts",
+						"\n- A book of cards must have the same rank but may have different suits.",
+						"\n \tFor example: 3 of Diamonds, 3 of Spades, 3 of Clubs",
+						"\n- Jokers are randomly picked from the deck at the start of the game.",
+						"\n- Joker is denoted by '-J' and can be used to complete sets.",
+						"\n- During each turn, the player may take a card from the pile or from the deck.",
+						"Immediately after, the player must drop any one card into the pile so as not go over the 13 card limit.",
+						"\n- When a player has created all the sets, select Close Game option and drop the excess card into the pile.",
+						"\n- Card with Rank 10 is represented as Rank T"
+						"\n- With more than one pack, 4H2 is the second 4 of Hearts of the stash, 4H3 the third..."
+						"\n--------------------------------------------" )
+				self.game.pause("Enter to continue ....")
 
 class Game:
 	""" Game Class - Models a single Game """ 
 
-	def __init__(self, hands, deck):
+	def __init__(self, hands, deck, names=None, rng=None):
 		""" Class Constructor 
 			Args:
 				hands:  represents the number of players in the game - an int
 				deck: Reference to Deck Object
+				names: names of the Players, asked for when not given - list of strings
+				rng: seed or random.Random instance for the Deck, the Deck keeps its own when not given
 			Returns:
 				No returns
 		"""
-		self.pile = []
+		if not MIN_PLAYERS <= hands <= MAX_PLAYERS:
+			raise ValueError('ERROR: A Game has ' + str(MIN_PLAYERS) + ' to ' + str(MAX_PLAYERS) + ' players')
+		self.pile = CardZone()
 		self.players = []
+		self.deck = deck
+		self.log = None	# GameLog of the actions, when the Game is recorded
+		self.events = None	# EventBus the actions are reported to, see rummy_events
+		self.screen = Screen()	# terminal the interactive Players share
+		self.script = None	# Script the answers are read from instead of the terminal
+		self.turns = 0	# number of turns played
+		self.tracker = CardTracker(deck.packs, hands, deck.joker)	# the cards everybody has seen
+		deck.discards = self.pile
+		deck.tracker = self.tracker
+		if rng is not None:
+			deck.rng = make_rng(rng)
+		self.rng = deck.rng
+		self.turn = 0	# index of the Player whose turn it is
 
 		for i in range(hands):
-			name = input("Enter name of Player " + str(i) + ": ")
+			if names is None:
+				name = input("Enter name of Player " + str(i) + ": ")
+			else:
+				name = names[i]
 			self.players.append(Player(name, deck, self))
 
+	def deal(self, hand_size=13):
+		""" Deal the Cards to the Players and start the Pile
+			Args:
+				hand_size: number of Cards dealt to each Player
+			Returns:
+				No returns
+		"""
+		if len(self.players) * hand_size >= len(self.deck.cards):
+			raise ValueError('ERROR: Not enough cards in the Deck for ' + str(len(self.players)) + ' players')
+		for i in range(hand_size):
+			for hand in self.players:
+				hand.deal_card(self.deck.draw_card())
+
+		# Create Pile, its first card was not dropped by a Player
+		card = self.deck.draw_card()
+		self.pile.push(card)
+		self.tracker.shown(card)
+		if self.events is not None:
+			self.events.emit(self, 'deal', None, card, {'players': len(self.players), 'hand_size': hand_size})
+
 	def display_pile(self):
 		""" Displays the top of the Pile.
 			Args:
@@ -356,10 +880,18 @@ class Game:
 			Returns:
 				No returns
 		"""
+		print(self.pile_text())
+
+	def pile_text(self):
+		""" Line that shows the top of the Pile.
+			Args:
+				No args.
+			Returns:
+				string
+		"""
 		if len(self.pile) == 0:
-			print("Empty pile.")
-		else:
-			print("The card at the top of the pile is: ", self.pile[0])
+			return "Empty pile."
+		return "The card at the top of the pile is:  " + str(self.pile.peek())
 
 	def add_pile(self, card):
 		""" Adds card to the top of the Pile.
@@ -368,7 +900,8 @@ class Game:
 			Returns:
 				No returns
 		"""
-		self.pile.insert(0, card)
+		self.pile.push(card)
+		self.tracker.dropped(card, self.turn)
 
 	def draw_pile(self):
 		""" Draw the top card from the Pile.
@@ -377,10 +910,33 @@ class Game:
 			Returns:
 				Returns the top Card from the Pile - Card Object
 		"""
-		if len(self.pile) != 0:
-			return self.pile.pop(0)
+		card = self.pile.draw()
+		if card is not None:
+			self.tracker.picked(card, self.turn)
+		return card
+
+	def ask(self, prompt=""):
+		""" Read an answer of the Player whose turn it is.
+			Args:
+				prompt: question shown on the terminal
+			Returns:
+				the answer - string, from the Script when the Game has one
+		"""
+		if self.script is None:
+			return input(prompt)
+		return self.script.read(self.turn)
+
+	def pause(self, message):
+		""" Show a message and wait until the Player hits enter.
+			Args:
+				message: the message, a Script only counts it
+			Returns:
+				No returns
+		"""
+		if self.script is None:
+			input(message)
 		else:
-			return None
+			self.script.notice(message)
 
 	def play(self):
 		""" Play the close_game.
@@ -389,30 +945,82 @@ class Game:
 			Returns:
 				No returns
 		"""
-		i = 0
-		while self.players[i].play() == False:
+		while True:
+			closed = self.players[self.turn].play()
+			if closed != False:
+				break
+			self.turns += 1
+			self.turn += 1
+			if self.turn == len(self.players):
+				self.turn = 0
+			if self.script is not None:
+				continue
+			self.screen.invalidate()
 			print(chr(27)+"[2J")
-			i += 1
-			if i == len(self.players):
-				i = 0
-			print("***", self.players[i].name, "to play now.")
-			input(self.players[i].name + " hit enter to continue...")
+			print("***", self.players[self.turn].name, "to play now.")
+			input(self.players[self.turn].name + " hit enter to continue...")
 
 		# Game Over
-		print("*** GAME OVER ***")
-		print("*** ", self.players[i].name, " Won the game ***")
+		self.turns += 1
+		if self.script is None:
+			print("*** GAME OVER ***")
+			if closed is None:
+				print("*** The Deck and the Pile are used up, the game is a draw ***")
+			else:
+				print("*** ", self.players[self.turn].name, " Won the game ***")
 
 
 #global nonclass functions
+def make_rng(rng=None):
+	""" Random number generator from a seed
+		Args:
+			rng: None, an int seed or a random.Random instance
+		Returns:
+			random.Random instance, rng itself if it is one
+	"""
+	if isinstance(rng, random.Random):
+		return rng
+	return random.Random(rng)
+
+def new_game(hands, packs=2, seed=None, names=None, hand_size=13, joker=False, record=False):
+	""" Create a seeded Game: shuffle the Deck, pick the Joker and deal the Cards
+		Args:
+			hands: number of Players
+			packs: number of packs in the Deck
+			seed: int seed, a random one is picked when not given
+			names: names of the Players, asked for when not given - list of strings
+			hand_size: number of Cards dealt to each Player
+			joker: True to pick a Joker
+			record: True to keep a GameLog of the actions in game.log
+		Returns:
+			Game object
+	"""
+	if seed is None:
+		seed = random.SystemRandom().getrandbits(64)
+	rng = random.Random(seed)
+	deck = Deck(packs, rng)
+	deck.shuffle()
+	if joker:
+		deck.set_joker()
+	game = Game(hands, deck, names, rng)
+	if record:
+		game.log = GameLog(seed, packs, hands, hand_size, joker)
+	game.deal(hand_size)
+	return game
+
 def is_valid_book(sequence):
 	""" Check if the sequence is a valid book.
 		Args:
-			sequence: an array of Card objects.  Array will have either 3 ro 4 cards
+			sequence: an array of Card objects.  Array will have either 3 ro 4 cards,
+				it is not changed
 		Returns:
 			Success or Failure as True/False
 	"""
-	# Move all Jokers to the end of the sequence
-	while(sequence[0].isjoker == True):
+	# Move all Jokers to the end of a copy of the sequence (a set of only Jokers is a book)
+	sequence = list(sequence)
+	for i in range(len(sequence)):
+		if sequence[0].isjoker == False:
+			break
 		sequence.append(sequence.pop(0))
 
 	# Compare Cards in sequnce with 0th Card, except for Jokers.
@@ -427,14 +1035,15 @@ def is_valid_book(sequence):
 def is_valid_run(sequence):
 	""" Check if the sequence is a valid run.
 		Args:
-			sequence: an array of Card objects.  Array will have either 3 ro 4 cards
+			sequence: an array of Card objects.  Array will have either 3 ro 4 cards,
+				it is not changed
 		Returns:
 			Success or Failure as True/False
 	"""
-	RANK_VALUE["A"] = 1 #resetting value of A (may have been set to 14 in previous run)
+	values = RANK_VALUE
 
-	# Order the Cards in the sequence
-	sort_sequence(sequence)
+	# Order a copy of the Cards in the sequence
+	sequence = sort_sequence(list(sequence))
 
 	# Check to see if all Cards in the sequence have the same SUIT
 	for card in sequence:
@@ -444,12 +1053,12 @@ def is_valid_run(sequence):
 	# this is to sort a sequence that has K, Q and A
 	if sequence[0].rank == "A":
 		if sequence[1].rank == "Q" or sequence[1].rank == "J" or sequence[1].rank == "K":
-			RANK_VALUE[sequence[0].rank] = 14
-			sort_sequence(sequence)
+			values = ACE_HIGH_VALUE
+			sort_sequence(sequence, values)
 
 	# Rank Comparison
 	for i in range(1,len(sequence)):
-		if RANK_VALUE[sequence[i].rank] != RANK_VALUE[(sequence[i-1].rank)]+1:
+		if values[sequence[i].rank] != values[(sequence[i-1].rank)]+1:
 			return False
 
 	return True
@@ -457,18 +1066,15 @@ def is_valid_run(sequence):
 def is_valid_run_joker(sequence):
 	""" Check if the sequence with Jokers is a valid run.
 		Args:
-			sequence: an array of Card objects.  Array will have either 3 ro 4 cards
+			sequence: an array of Card objects.  Array will have either 3 ro 4 cards,
+				it is not changed
 		Returns:
 			Success or Failure as True/False
 	"""
+	values = RANK_VALUE
 
-	RANK_VALUE["A"] = 1 #resetting value of A (may have been set to 14 in previous run)
-
-	# Order the Cards in the sequence
-	sort_sequence(sequence)
-
-	# Push all Jokers to the end and count the number of Jokers
-	push_joker_toend(sequence)
+	# Order a copy of the Cards, all Jokers pushed to the end, and count the number of Jokers
+	sequence = push_joker_toend(sequence)
 	joker_count = 0
 	for card in sequence:
 		if card.is_joker() == True:
@@ -484,16 +1090,15 @@ def is_valid_run_joker(sequence):
 	# This is to cover for K, Q and A run with Jokers
 	if sequence[0].rank == "A":
 		if sequence[1].rank == "Q" or sequence[1].rank == "J" or sequence[1].rank == "K":
-			RANK_VALUE[sequence[0].rank] = 14
-			sort_sequence(sequence)
-			push_joker_toend(sequence)
+			values = ACE_HIGH_VALUE
+			sequence = push_joker_toend(sequence, values)
 
 	rank_inc = 1
 	for i in range(1,len(sequence)):
 		if sequence[i].is_joker() == True:
 			continue
 		# Compare RANK values with accomodating for Jokers.
-		while (RANK_VALUE[sequence[i].rank] != RANK_VALUE[(sequence[i-1].rank)]+rank_inc):
+		while (values[sequence[i].rank] != values[(sequence[i-1].rank)]+rank_inc):
 			# Use Joker Count for missing Cards in the run
 			if joker_count > 0:
 				rank_inc += 1
@@ -501,46 +1106,73 @@ def is_valid_run_joker(sequence):
 				continue
 			else:
 				# if No more Jokers left, then revert to regular comparison
-				if RANK_VALUE[sequence[i].rank] != RANK_VALUE[(sequence[i-1].rank)]+1:
+				if values[sequence[i].rank] != values[(sequence[i-1].rank)]+1:
 					return False
 				else:
 					break
 	return True
 
-def push_joker_toend(sequence):
-	""" Push the Joker to the end of the sequence.
+def push_joker_toend(sequence, values=RANK_VALUE):
+	""" Sorted copy of the sequence with the Jokers pushed to the end.
 		Args:
-			sequence: sequence of Card Objects.
+			sequence: sequence of Card Objects, it is not changed
+			values: RANK values to sort by
 		Returns:
-			no return
+			new list of the Card Objects
 	"""
-	sort_sequence(sequence)
-	joker_list = []
-	for card in sequence:
-		if card.is_joker()== True:
-			sequence.remove(card)
-			joker_list.append(card)
-	sequence += joker_list
-	return sequence
+	ordered = sort_sequence(list(sequence), values)
+	return [card for card in ordered if not card.is_joker()] + [card for card in ordered if card.is_joker()]
 
 def get_object(arr, str_card):
 	""" Get Card Object using its User Input string representation
 	Args:
-		arr: array of Card objects
+		arr: array of Card objects, a Stash is looked up through its label index
 		str_card: Card descriptor as described by user input, that is a 2 character
 			string of Rank and Suit of the Card.  For example, KH for King of Hearts.
+			A third digit picks one of the copies of the Card, KH2 is the second
+			King of Hearts of the arr.
 	Returns:
 		object pointer corresponding to string, from the arr
 	"""
 	# Make sure the str_card has only a RANK letter and SUIT letter
-	#		for example KH for King of Hearts.
-	if len(str_card) != 2:
+	#		for example KH for King of Hearts, and maybe the copy digit.
+	copy = 0
+	if len(str_card) == 3 and str_card[2] in "123456789":
+		copy = int(str_card[2]) - 1
+		str_card = str_card[:2]
+	elif len(str_card) != 2:
 		return None
 
+	if isinstance(arr, Stash):
+		return arr.find(str_card, copy)
+
 	for item in arr:
 		if item.rank == str_card[0] and item.suit[0] == str_card[1]:
-			return item
+			if copy == 0:
+				return item
+			copy -= 1
+
+	return None
 
+def closing_split(stash, drops=None):
+	""" Find a card of a stash of 14 cards that can be dropped so that the rest closes the game
+		Args:
+			stash: array of 14 Card objects
+			drops: the Cards of the stash worth dropping, every card when not given
+		Returns:
+			(Card to drop, the 4 sets of the other cards as lists of Card objects) or None
+	"""
+	codes = [card.code for card in stash]
+	jokers = joker_mask(stash)
+	tried = set()
+	for i, card in enumerate(stash):
+		if codes[i] in tried or drops is not None and not any(card is drop for drop in drops):
+			continue
+		tried.add(codes[i])
+		split = cached_solve(codes[:i] + codes[i+1:], jokers)
+		if split is not None:
+			rest = stash[:i] + stash[i+1:]
+			return card, [[rest[n] for n in s] for s in split]
 	return None
 
 def print_cards(arr):
@@ -550,15 +1182,109 @@ def print_cards(arr):
 		Returns:
 			a displayable string representation of the Cards in the arr
 	"""
-	s = ""
-	for card in arr:
-		s = s + " " + str(card)
-	return s
+	return "".join([" " + str(card) for card in arr])
+
+class Screen:
+	""" Screen Class - Draws the frames of Player.play on a terminal
+
+	A frame is a list of lines, the last line is the prompt and the cursor is left
+	after it.  The full screen mode clears the screen and draws every line, as
+	Player.play always did.  The differential mode keeps the last frame and only
+	moves the cursor to the lines that changed, then clears whatever was typed
+	below the prompt.  Every frame is sent in one write.
+	"""
+
+	def __init__(self, out=None, diff=True, headless=False):
+		""" Class Constructor
+		Args:
+			out: stream to write to, sys.stdout when not given
+			diff: True for the differential mode, False to redraw the full screen
+			headless: True to only count the bytes and write nothing
+		Returns:
+			No return value
+		"""
+		self.out = out
+		self.diff = diff
+		self.headless = headless
+		self.last = None	# lines of the last frame, None when the screen must be redrawn
+		self.bytes = 0
+		self.frames = 0
+
+	def invalidate(self):
+		""" Redraw the full screen on the next frame, for when something else wrote to the terminal """
+		self.last = None
+
+	def frame(self, lines):
+		""" Draw a frame
+		Args:
+			lines: list of strings, the last is the prompt
+		Returns:
+			No returns
+		"""
+		if not self.diff:
+			data = chr(27) + "[2J\n" + "\n".join(lines)
+		elif self.last is None:
+			data = chr(27) + "[2J" + chr(27) + "[H" + "\n".join(lines)
+		else:
+			parts = []
+			for row, line in enumerate(lines):
+				if row >= len(self.last) or self.last[row] != line:
+					parts.append("%s[%d;1H%s[2K%s" % (chr(27), row + 1, chr(27), line))
+			parts.append("%s[%d;%dH%s[J" % (chr(27), len(lines), len(lines[-1]) + 1, chr(27)))
+			data = "".join(parts)
+		self.last = list(lines)
+		self.frames += 1
+		self.bytes += len(data.encode())
+		if not self.headless:
+			out = self.out or sys.stdout
+			out.write(data)
+			out.flush()
+
+class Script:
+	""" Script Class - Answers of the Players read in bulk instead of typed at the terminal
+
+	Every line is one answer, exactly as it would be typed: an action such as T,
+	then the cards the action asks for, an empty line moves a card to the end.
+	The lines come from files, pipes or generators.  A generator is only asked for
+	its next line when Player.play needs it, so it can look at the Game first.
+	The "Enter to continue" pauses read nothing, their messages are counted.
+	"""
+
+	def __init__(self, *sources):
+		""" Class Constructor
+		Args:
+			sources: one iterable of lines shared by all Players, taken in turn order,
+				or one iterable for each Player
+		Returns:
+			No return value
+		"""
+		self.sources = [iter(source) for source in sources]
+		self.answers = 0
+		self.notices = collections.Counter()	# messages shown instead of a pause
+
+	def read(self, seat=0):
+		""" Next answer of a Player
+		Args:
+			seat: index of the Player
+		Returns:
+			the line without its newline - string
+			raises EOFError, as input does, once the lines are used up
+		"""
+		line = next(self.sources[seat % len(self.sources)], None)
+		if line is None:
+			raise EOFError('ERROR: The script has no more lines')
+		self.answers += 1
+		return line.rstrip("\r\n")
+
+	def notice(self, message):
+		""" Count a message a Player would have had to acknowledge """
+		self.notices[message.split(".")[0].split(",")[0].strip()] += 1
 
-def sort_sequence(sequence):
+def sort_sequence(sequence, values=RANK_VALUE):
 	""" Sort the Cards in the sequence in the incresing order of RANK values
 		Args:
-			sequence: array of Card objects
+			sequence: array of Card objects, sorted in place
+			values: RANK values to sort by
 		Returns:
 			sorted sequence.
 	"""
@@ -567,22 +1293,1888 @@ def sort_sequence(sequence):
 	while is_sort_complete == False:
 		is_sort_complete = True
 		for i in range(0, len(sequence)-1):
-			if RANK_VALUE[sequence[i].rank] > RANK_VALUE[sequence[i+1].rank]:
+			if values[sequence[i].rank] > values[sequence[i+1].rank]:
 				a = sequence[i+1]
 				sequence[i+1] = sequence[i]
 				sequence[i] = a
 				is_sort_complete = False
 	return sequence
 
-def unit_tests():
-	""" Unit Tests for Checking various aspects of the program
+#compact binary log of the actions of a Game
+#	An action is one byte with the action code in the high nibble and the Player in the
+#	low nibble, followed by one byte for each stash index the action takes.
+LOG_TAKE = 0	# Player.take_card
+LOG_PICK = 1	# Player.pick_card
+LOG_DROP = 2	# Player.discard, stash index of the card
+LOG_MOVE = 3	# Player.move_index, stash indexes of the card and of where it goes
+LOG_SORT = 4	# Player.sort_cards
+LOG_CLOSE = 5	# Player.close_game
+LOG_ARGS = [0, 0, 1, 2, 0, 0]
+LOG_MAGIC = b'RL'
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct('<2sBQBBBB')	# magic, version, seed, packs, hands, hand size, joker
+
+class GameLog:
+	""" GameLog Class - The actions of a Game made with new_game, a few bytes per action """
+
+	def __init__(self, seed, packs, hands, hand_size, joker, actions=b''):
+		""" Class Constructor
+		Args:
+			seed, packs, hands, hand_size, joker: the new_game arguments of the Game
+			actions: bytes of the actions recorded so far
+		Returns:
+			No return value
+		"""
+		self.seed = seed
+		self.packs = packs
+		self.hands = hands
+		self.hand_size = hand_size
+		self.joker = joker
+		self.actions = bytearray(actions)
+
+	def record(self, action, player, *args):
+		""" Add an action to the log
+		Args:
+			action: one of the LOG_ action codes
+			player: index of the Player in the Game
+			args: stash indexes the action takes
+		Returns:
+			No returns
+		"""
+		self.actions.append(action << 4 | player)
+		self.actions.extend(args)
+
+	def to_bytes(self):
+		""" The log in its binary form
 		Args:
 			No args
 		Returns:
-			no returns.
-	"""
+			bytes, a header followed by the actions
+		"""
+		header = LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, self.seed, self.packs, self.hands, self.hand_size, self.joker)
+		return header + bytes(self.actions)
 
-	print("Running Unit Tests")
+	@classmethod
+	def from_bytes(cls, data):
+		""" Read a log made by to_bytes
+		Args:
+			data: bytes
+		Returns:
+			GameLog object
+		"""
+		magic, version, seed, packs, hands, hand_size, joker = LOG_HEADER.unpack_from(data)
+		if magic != LOG_MAGIC or version != LOG_VERSION:
+			raise ValueError('ERROR: Not a Rummy game log')
+		return cls(seed, packs, hands, hand_size, bool(joker), data[LOG_HEADER.size:])
+
+def replay(log, names=None, upto=None):
+	""" Rebuild a Game from its log without the interactive loop
+		Args:
+			log: GameLog object or the bytes made by GameLog.to_bytes
+			names: names of the Players, Player0, Player1 ... when not given
+			upto: number of actions to play, all of them when not given
+		Returns:
+			Game object in the state after the actions, game.turn is the last Player that played
+	"""
+	if not isinstance(log, GameLog):
+		log = GameLog.from_bytes(log)
+	if names is None:
+		names = ['Player' + str(i) for i in range(log.hands)]
+	game = new_game(log.hands, log.packs, log.seed, names, log.hand_size, log.joker)
+	players = game.players
+	actions = log.actions
+	n = 0
+	done = 0
+	while n < len(actions) and (upto is None or done < upto):
+		action = actions[n] >> 4
+		player = players[actions[n] & 15]
+		game.turn = actions[n] & 15
+		if action == LOG_TAKE:
+			player.take_card()
+		elif action == LOG_PICK:
+			player.pick_card()
+		elif action == LOG_DROP:
+			player.discard(player.stash[actions[n+1]])
+		elif action == LOG_MOVE:
+			player.move_index(actions[n+1], actions[n+2])
+		elif action == LOG_SORT:
+			player.sort_cards()
+		elif action == LOG_CLOSE:
+			player.close_game()
+		else:
+			raise ValueError('ERROR: Unknown action in the game log')
+		n += 1 + LOG_ARGS[action]
+		done += 1
+	return game
+
+#compact snapshot of the state of a Game
+#	The header is followed by one byte per card code for the Deck and the Pile, then
+#	for every Player the stash size, the length of the name, the stash and the name.
+#	The copies of a card in the packs of a Deck play alike, so a card code is all a card
+#	needs.  restore hands out the copies of a card code pack by pack.
+SNAP_MAGIC = b'RS'
+SNAP_VERSION = 1
+SNAP_HEADER = struct.Struct('<2sBBBBBBIHH')	# magic, version, packs, hands, turn, joker, joker rank, turns, deck size, pile size
+SNAP_NONE = 255	# no Joker
+SNAP_RECORD = struct.Struct('<IIB')	# payload size, crc32 of the key and the payload, key size
+
+def snapshot(game):
+	""" Compact binary form of the state of a Game
+		Args:
+			game: Game object
+		Returns:
+			bytes, see restore.  The random state of the Deck is not kept.
+	"""
+	deck = game.deck
+	joker = deck.joker.code if deck.joker is not None else SNAP_NONE
+	joker_rank = RANK_INDEX[deck.joker_rank] if deck.joker_rank is not None else SNAP_NONE
+	parts = [SNAP_HEADER.pack(SNAP_MAGIC, SNAP_VERSION, deck.packs, len(game.players), game.turn, joker, joker_rank,
+		game.turns, len(deck.cards), len(game.pile)), bytes([card.code for card in deck.cards]), bytes([card.code for card in game.pile])]
+	for player in game.players:
+		name = player.name.encode()[:255]
+		parts.append(bytes((len(player.stash), len(name))))
+		parts.append(bytes([card.code for card in player.stash]))
+		parts.append(name)
+	return b''.join(parts)
+
+def restore(data, rng=None):
+	""" Rebuild a Game from a snapshot
+		Args:
+			data: bytes made by snapshot
+			rng: seed or random.Random instance the Deck shuffles with, a fresh unseeded
+				random.Random when not given.  Games restored together may share one.
+		Returns:
+			Game object
+	"""
+	magic, version, packs, hands, turn, joker, joker_rank, turns, deck_size, pile_size = SNAP_HEADER.unpack_from(data)
+	if magic != SNAP_MAGIC or version != SNAP_VERSION:
+		raise ValueError('ERROR: Not a Rummy snapshot')
+	deck = Deck(packs, rng)
+	copies = deck.copies
+	taken = [0] * CARDS_PER_PACK
+
+	def copy_of(code):
+		# the next copy of the card that is not placed yet
+		pack = taken[code]
+		if pack >= packs:
+			raise ValueError('ERROR: The snapshot has more copies of a card than the Deck')
+		taken[code] = pack + 1
+		return copies[pack][code]
+
+	n = SNAP_HEADER.size
+	deck.cards[:] = [copy_of(code) for code in data[n:n+deck_size]]
+	n += deck_size
+	pile = [copy_of(code) for code in data[n:n+pile_size]]
+	n += pile_size
+	if joker != SNAP_NONE:
+		deck.joker = copy_of(joker)
+	if joker_rank != SNAP_NONE:
+		deck.joker_rank = RANK[joker_rank]
+
+	stashes = []
+	names = []
+	for i in range(hands):
+		size, length = data[n], data[n+1]
+		n += 2
+		stashes.append(data[n:n+size])
+		names.append(data[n+size:n+size+length].decode(errors='replace'))
+		n += size + length
+
+	game = Game(hands, deck, names)
+	game.pile.extend(pile)
+	# who picked which card is not kept, only what the Pile shows
+	for card in pile:
+		game.tracker.shown(card)
+	for player, codes in zip(game.players, stashes):
+		cards = [copy_of(code) for code in codes]
+		player.stash.extend(cards)
+		player.evaluator = HandEvaluator(cards)
+	game.turn = turn
+	game.turns = turns
+	return game
+
+class SnapshotFile:
+	""" SnapshotFile Class - Append only file of the snapshots of many Games
+
+	Every record is a snapshot of one table, the last record of a table wins and an
+	empty one removes the table.  Records are kept in a buffer of bounded size and
+	appended to the file when it fills up or on flush.  A record cut short by a crash
+	is dropped, with everything after it, when the file is loaded.
+	"""
+
+	def __init__(self, path, limit=1 << 20):
+		""" Class Constructor
+		Args:
+			path: path of the file
+			limit: bytes buffered before they are written
+		Returns:
+			No return value
+		"""
+		self.path = path
+		self.limit = limit
+		self.buffer = bytearray()
+		self.appended = 0	# records added since the file was last compacted
+
+	def append(self, key, data):
+		""" Add the snapshot of a table
+		Args:
+			key: name of the table - string
+			data: bytes made by snapshot, b'' to remove the table
+		Returns:
+			No returns
+		"""
+		key = key.encode()[:255]
+		self.buffer += SNAP_RECORD.pack(len(data), zlib.crc32(data, zlib.crc32(key)), len(key))
+		self.buffer += key
+		self.buffer += data
+		self.appended += 1
+		if len(self.buffer) >= self.limit:
+			self.flush()
+
+	def remove(self, key):
+		""" Forget a table whose game is over """
+		self.append(key, b'')
+
+	def flush(self, sync=False):
+		""" Write the buffered records to the end of the file
+		Args:
+			sync: True to wait until the records are on the disk
+		Returns:
+			No returns
+		"""
+		if not self.buffer:
+			return
+		with open(self.path, 'ab') as f:
+			f.write(self.buffer)
+			if sync:
+				f.flush()
+				os.fsync(f.fileno())
+		self.buffer.clear()
+
+	def load(self):
+		""" Last snapshot of every table in the file
+		Args:
+			No args
+		Returns:
+			dict of table name to the bytes of its snapshot
+		"""
+		tables = {}
+		if not os.path.exists(self.path):
+			return tables
+		with open(self.path, 'rb+') as f:
+			good = 0
+			while True:
+				head = f.read(SNAP_RECORD.size)
+				if len(head) < SNAP_RECORD.size:
+					break
+				size, crc, length = SNAP_RECORD.unpack(head)
+				key = f.read(length)
+				data = f.read(size)
+				if len(key) < length or len(data) < size or zlib.crc32(data, zlib.crc32(key)) != crc:
+					break
+				good += SNAP_RECORD.size + length + size
+				if data:
+					tables[key.decode(errors='replace')] = data
+				else:
+					tables.pop(key.decode(errors='replace'), None)
+			# drop a record cut short by a crash, so that new records follow the good ones
+			f.truncate(good)
+		return tables
+
+	def compact(self):
+		""" Rewrite the file with only the last snapshot of every table
+		Args:
+			No args
+		Returns:
+			dict of table name to the bytes of its snapshot, as load
+		"""
+		self.flush()
+		tables = self.load()
+		compact = SnapshotFile(self.path + '.tmp', limit=float('inf'))
+		for key, data in tables.items():
+			compact.append(key, data)
+		open(compact.path, 'wb').close()
+		compact.flush(sync=True)
+		os.replace(compact.path, self.path)
+		self.appended = 0
+		return tables
+
+#compact integer representation of the cards
+def card_code(rank, suit):
+	""" Compact code of a Card, independent of the pack it came from
+		Args:
+			rank: A valid RANK value - a single char
+			suit: A valid SUIT value - a string
+		Returns:
+			RANK index * 4 + SUIT index, an int in 0 - 51
+	"""
+	return RANK_INDEX[rank] * 4 + SUIT_INDEX[suit]
+
+def card_to_int(card):
+	""" Compact int of a Card, including the pack it came from
+		Args:
+			card: Card object
+		Returns:
+			pack * CARDS_PER_PACK + card code - int value
+	"""
+	return card.pack * CARDS_PER_PACK + card.code
+
+def int_to_card(value):
+	""" Card object for a compact int created by card_to_int
+		Args:
+			value: compact card int
+		Returns:
+			a new Card Object
+	"""
+	pack, code = divmod(value, CARDS_PER_PACK)
+	return Card(RANK[code >> 2], SUIT[code & 3], pack)
+
+def rank_mask(rank):
+	""" Card code mask of all four suits of a rank
+		Args:
+			rank: RANK index - int value
+		Returns:
+			mask with the 4 bits of that rank set
+	"""
+	return 0xF << (rank * 4)
+
+def joker_mask(arr):
+	""" Card code mask of the Jokers in an array of Cards
+		Args:
+			arr: array of Card objects
+		Returns:
+			mask with the bit of each Joker card code set
+	"""
+	mask = 0
+	for card in arr:
+		if card.isjoker:
+			mask |= 1 << card.code
+	return mask
+
+class HandMask:
+	""" HandMask Class - Compact form of a hand of Cards
+	mask has the bit of every card code that is held, counts holds the number
+	of copies of each code for decks built from more than one pack.
+	"""
+
+	__slots__ = ('mask', 'counts')
+
+	def __init__(self, codes=()):
+		""" Class Constructor
+		Args:
+			codes: card codes in the hand, duplicates allowed
+		Returns:
+			No return value
+		"""
+		self.mask = 0
+		self.counts = bytearray(CARDS_PER_PACK)
+		for code in codes:
+			self.add(code)
+
+	@classmethod
+	def from_cards(cls, arr):
+		""" Build a HandMask from an array of Card objects
+		Args:
+			arr: array of Card objects
+		Returns:
+			HandMask object
+		"""
+		return cls(card.code for card in arr)
+
+	def add(self, code):
+		""" Add a card code to the hand
+		Args:
+			code: card code
+		Returns:
+			No returns
+		"""
+		self.counts[code] += 1
+		self.mask |= 1 << code
+
+	def remove(self, code):
+		""" Remove a card code from the hand
+		Args:
+			code: card code
+		Returns:
+			True if the code was in the hand, otherwise False
+		"""
+		if self.counts[code] == 0:
+			return False
+		self.counts[code] -= 1
+		if self.counts[code] == 0:
+			self.mask &= ~(1 << code)
+		return True
+
+	def __contains__(self, code):
+		return (self.mask >> code) & 1 == 1
+
+	def __len__(self):
+		return sum(self.counts)
+
+	def codes(self):
+		""" Card codes of the hand in increasing order, duplicates repeated
+		Args:
+			No args
+		Returns:
+			list of card codes
+		"""
+		codes = []
+		mask = self.mask
+		while mask:
+			low = mask & -mask
+			code = low.bit_length() - 1
+			codes += [code] * self.counts[code]
+			mask ^= low
+		return codes
+
+	def suit_ranks(self, suit):
+		""" Ranks held in a suit
+		Args:
+			suit: SUIT index - int value
+		Returns:
+			13 bit mask, bit i set if RANK[i] of that suit is held
+		"""
+		m = 0
+		bits = self.mask >> suit
+		for r in range(len(RANK)):
+			if (bits >> (r * 4)) & 1:
+				m |= 1 << r
+		return m
+
+def is_valid_run_codes(codes):
+	""" Compact version of is_valid_run
+		Args:
+			codes: card codes of the sequence.  Either 3 or 4 codes
+		Returns:
+			Success or Failure as True/False
+	"""
+	suit = codes[0] & 3
+	ranks = 0
+	for code in codes:
+		bit = 1 << (code >> 2)
+		if code & 3 != suit or ranks & bit:
+			return False
+		ranks |= bit
+
+	# A run is a block of set bits. An Ace can also follow the King (Q K A)
+	full = (1 << len(codes)) - 1
+	if ranks == full * (ranks & -ranks):
+		return True
+	if ranks & 1:
+		ranks = (ranks ^ 1) | (1 << len(RANK))
+		return ranks == full * (ranks & -ranks)
+	return False
+
+def is_valid_book_codes(codes, jokers=0):
+	""" Compact version of is_valid_book
+		Args:
+			codes: card codes of the sequence.  Either 3 or 4 codes
+			jokers: card code mask of the Jokers
+		Returns:
+			Success or Failure as True/False
+	"""
+	rank = -1
+	for code in codes:
+		if (jokers >> code) & 1:
+			continue
+		if rank < 0:
+			rank = code >> 2
+		elif code >> 2 != rank:
+			return False
+	return True
+
+def is_valid_run_joker_codes(codes, jokers=0):
+	""" Compact version of is_valid_run_joker
+		Args:
+			codes: card codes of the sequence.  Either 3 or 4 codes
+			jokers: card code mask of the Jokers
+		Returns:
+			Success or Failure as True/False
+	"""
+	suit = -1
+	ranks = []
+	for code in codes:
+		if (jokers >> code) & 1:
+			continue
+		if suit < 0:
+			suit = code & 3
+		elif code & 3 != suit:
+			return False
+		ranks.append((code >> 2) + 1)
+	ranks.sort()
+	return joker_run_fits(ranks, len(codes) - len(ranks))
+
+def joker_run_fits(ranks, joker_count):
+	""" Rank comparison of is_valid_run_joker on plain RANK values
+		Args:
+			ranks: sorted RANK values (Ace as 1) of the non Joker cards of one suit
+			joker_count: number of Jokers available to fill the gaps
+		Returns:
+			Success or Failure as True/False
+	"""
+	# This is to cover for K, Q and A run with Jokers
+	if len(ranks) > 1 and ranks[0] == 1 and ranks[1] >= RANK_VALUE['J']:
+		ranks = ranks[1:] + [14]
+
+	rank_inc = 1
+	for i in range(1, len(ranks)):
+		while ranks[i] != ranks[i-1] + rank_inc:
+			if joker_count > 0:
+				rank_inc += 1
+				joker_count -= 1
+				continue
+			if ranks[i] != ranks[i-1] + 1:
+				return False
+			break
+	return True
+
+def close_game_codes(codes, jokers=0):
+	""" Compact version of Player.close_game
+		Args:
+			codes: card codes of the stash in stash order
+			jokers: card code mask of the Jokers
+		Returns:
+			Success or Failure as True/False
+	"""
+	flags = [meld_flags(s, jokers) for s in (codes[:3], codes[3:6], codes[6:9], codes[9:])]
+
+	# There must be at least one run with out a joker
+	if not any(f & MELD_RUN for f in flags):
+		return False
+
+	# Each set is a run, a book or a run with Jokers
+	return all(flags)
+
+#precomputed index of the sets of 3 and 4 cards
+MELD_RUN = 1		# is_valid_run
+MELD_RUN_JOKER = 2	# is_valid_run_joker
+MELD_BOOK = 4		# is_valid_book
+# weight of a card in a meld key, a 3 bit count per RANK for non Joker cards and then for Jokers
+_RANK_WEIGHT = [1 << (3 * r) for r in range(len(RANK))]
+_JOKER_WEIGHT = [1 << (3 * (len(RANK) + r)) for r in range(len(RANK))]
+_MELD_INDEX = {}
+
+def meld_key(codes, jokers=0):
+	""" Canonical key of a set of cards for the meld index
+	The validators only look at the ranks, which cards are Jokers and whether the
+	suits are all the same, so the key is the sum of the rank weights and two suit flags.
+		Args:
+			codes: card codes of the set
+			jokers: card code mask of the Jokers
+		Returns:
+			int key, the same for any order of the cards and any renaming of the suits
+	"""
+	key = 0
+	suits = 0
+	natural_suits = 0
+	for code in codes:
+		bit = 1 << (code & 3)
+		suits |= bit
+		if (jokers >> code) & 1:
+			key += _JOKER_WEIGHT[code >> 2]
+		else:
+			key += _RANK_WEIGHT[code >> 2]
+			natural_suits |= bit
+	return (key << 2) | ((suits & (suits - 1) == 0) << 1) | (natural_suits & (natural_suits - 1) == 0)
+
+def classify_codes(codes, jokers=0):
+	""" Run the compact validators on a set of cards
+		Args:
+			codes: card codes of the set
+			jokers: card code mask of the Jokers
+		Returns:
+			MELD_RUN, MELD_RUN_JOKER and MELD_BOOK flags, 0 if the set is not valid
+	"""
+	flags = 0
+	if is_valid_run_codes(codes):
+		flags |= MELD_RUN
+	if is_valid_run_joker_codes(codes, jokers):
+		flags |= MELD_RUN_JOKER
+	if is_valid_book_codes(codes, jokers):
+		flags |= MELD_BOOK
+	return flags
+
+def _meld_samples():
+	""" One set of cards for every key of the meld index
+		Args:
+			No args
+		Returns:
+			generator of (card codes, Joker card code mask) tuples
+	"""
+	for size in (3, 4):
+		# kinds below len(RANK) are non Joker ranks, the others are Joker ranks
+		for kinds in itertools.combinations_with_replacement(range(2 * len(RANK)), size):
+			naturals = [k for k in kinds if k < len(RANK)]
+			wild = [k - len(RANK) for k in kinds if k >= len(RANK)]
+
+			# every card the same suit
+			if not set(naturals) & set(wild):
+				codes = [r * 4 for r in naturals + wild]
+				yield codes, sum(1 << (r * 4) for r in wild)
+			# the non Joker cards the same suit, the Jokers in another suit
+			if naturals and wild or len(wild) > 1:
+				codes = [r * 4 for r in naturals] + [r * 4 + 1 + (n & 1) for n, r in enumerate(wild)]
+				yield codes, sum(1 << c for c in codes[len(naturals):])
+			# the non Joker cards in different suits
+			if len(naturals) > 1:
+				codes = [r * 4 + (n > 0) for n, r in enumerate(naturals)] + [r * 4 + 2 for r in wild]
+				yield codes, sum(1 << c for c in codes[len(naturals):])
+
+def build_meld_index():
+	""" Build the index of every set of 3 or 4 cards, it is built on first use of meld_flags
+		Args:
+			No args
+		Returns:
+			dict of meld key to the validator flags
+	"""
+	index = {}
+	for codes, jokers in _meld_samples():
+		index[meld_key(codes, jokers)] = classify_codes(codes, jokers)
+	_MELD_INDEX.update(index)
+	return _MELD_INDEX
+
+def meld_flags(codes, jokers=0):
+	""" Look up a set of cards in the meld index
+		Args:
+			codes: card codes of the set
+			jokers: card code mask of the Jokers
+		Returns:
+			MELD_RUN, MELD_RUN_JOKER and MELD_BOOK flags, 0 if the set is not valid
+	"""
+	if not _MELD_INDEX:
+		build_meld_index()
+	key = meld_key(codes, jokers)
+	flags = _MELD_INDEX.get(key)
+	if flags is None:
+		# Sets of other sizes are not in the prebuilt index
+		flags = _MELD_INDEX[key] = classify_codes(codes, jokers)
+	return flags
+
+def validate_set(sequence):
+	""" Run is_valid_run, is_valid_run_joker and is_valid_book on a set of Card objects
+		Args:
+			sequence: an array of Card objects, it is not changed
+		Returns:
+			MELD_RUN, MELD_RUN_JOKER and MELD_BOOK flags, 0 if the set is not valid
+	"""
+	flags = 0
+	if is_valid_run(sequence):
+		flags |= MELD_RUN
+	if is_valid_run_joker(sequence):
+		flags |= MELD_RUN_JOKER
+	if is_valid_book(sequence):
+		flags |= MELD_BOOK
+	return flags
+
+def validate_sets(sets, workers=None, chunk=256):
+	""" Run validate_set on many sets on a pool of threads
+	The validators change neither their arguments nor any global, so the sets
+	may share Card objects and other threads may use the validators at the same time.
+		Args:
+			sets: list of arrays of Card objects
+			workers: number of threads, defaults to the number of cores
+			chunk: number of sets given to a thread at once
+		Returns:
+			list of validate_set flags, one per set in the same order
+	"""
+	chunks = [sets[i:i + chunk] for i in range(0, len(sets), chunk)]
+	with concurrent.futures.ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+		results = pool.map(lambda part: [validate_set(s) for s in part], chunks)
+		return [flags for part in results for flags in part]
+
+def classify_set(sequence):
+	""" Look up a set of Card objects in the meld index
+		Args:
+			sequence: an array of Card objects.  Array will have either 3 ro 4 cards
+		Returns:
+			MELD_RUN, MELD_RUN_JOKER and MELD_BOOK flags, 0 if the set is not valid
+	"""
+	return meld_flags([card.code for card in sequence], joker_mask(sequence))
+
+def check_meld_index():
+	""" Compare every entry of the meld index with is_valid_run, is_valid_run_joker and is_valid_book
+		Args:
+			No args
+		Returns:
+			list of the sets (as Card objects) where the index and the validators differ
+	"""
+	if not _MELD_INDEX:
+		build_meld_index()
+	wrong = []
+	for codes, jokers in _meld_samples():
+		sequence = []
+		for code in codes:
+			card = Card(RANK[code >> 2], SUIT[code & 3])
+			card.isjoker = (jokers >> code) & 1 == 1
+			sequence.append(card)
+		if validate_set(sequence) != _MELD_INDEX[meld_key(codes, jokers)]:
+			wrong.append(sequence)
+	return wrong
+
+#arrangement independent hand solver
+def _run_windows(length):
+	""" RANK indexes of every run of a given length, in run order
+		Args:
+			length: number of cards in the run
+		Returns:
+			list of tuples of RANK indexes, Q K A is (11, 12, 0)
+	"""
+	windows = [tuple(range(start, start + length)) for start in range(len(RANK) - length + 1)]
+	windows.append(tuple(range(len(RANK) - length + 1, len(RANK))) + (0,))
+	return windows
+
+RUN_WINDOWS = {3: _run_windows(3), 4: _run_windows(4)}
+RUN_WINDOWS_BY_RANK = {size: [[w for w in RUN_WINDOWS[size] if r in w] for r in range(len(RANK))] for size in RUN_WINDOWS}
+# card code masks of every possible pure run of 3 cards, a hand without one can never close
+RUN_MASKS = [sum(1 << (r * 4 + s) for r in w) for s in range(len(SUIT)) for w in RUN_WINDOWS[3]]
+# card codes that can share a set with a card when there are not enough Jokers to make up a set:
+#	the other suits of the rank and the cards of the suit up to 3 ranks away
+PARTNER_MASKS = [rank_mask(c >> 2) & ~(1 << c) | sum(1 << (((c >> 2) + d) % len(RANK) * 4 + (c & 3)) for d in (-3, -2, -1, 1, 2, 3))
+	for c in range(CARDS_PER_PACK)]
+
+def solve_hand(codes, jokers=0):
+	""" Find an arrangement of a stash that closes the game, whatever order the cards are in
+		Args:
+			codes: card codes of the 13 cards of the stash
+			jokers: card code mask of the Jokers
+		Returns:
+			the 4 sets (3 sets of 3 cards, then the set of 4 cards) as lists of
+			indexes into codes, or None if the cards cannot close the game
+	"""
+	if len(codes) != 13:
+		return None
+	if RUN_TABLE is not None and not RUN_TABLE.may_close(codes, jokers):
+		return None
+	return _HandSearch(codes, jokers).solve()
+
+def _choose(items, k):
+	""" All ways to pick k cards from a multiset
+		Args:
+			items: list of (key, copies available) tuples
+			k: number of cards to pick
+		Returns:
+			generator of tuples of keys
+	"""
+	if k == 0:
+		yield ()
+		return
+	for n, (key, avail) in enumerate(items):
+		for take in range(1, min(avail, k) + 1):
+			for rest in _choose(items[n+1:], k - take):
+				yield (key,) * take + rest
+
+class _HandSearch:
+	""" _HandSearch Class - Memoized search behind solve_hand
+
+	Cards are grouped by key: a key below CARDS_PER_PACK is the code of the non Joker
+	cards, a key above it is a Joker that is used as its own card in a pure run.
+	All other Jokers are wild and only counted.  The search always places the
+	lowest remaining key in a set, so each arrangement is tried once, and
+	remembers the states that cannot be completed.
+	"""
+
+	def __init__(self, codes, jokers):
+		""" Class Constructor
+		Args:
+			codes: card codes of the stash
+			jokers: card code mask of the Jokers
+		Returns:
+			No return value
+		"""
+		self.natural_at = {}	# code -> positions of the non Joker cards
+		self.joker_at = {}	# code -> positions of the Joker cards
+		self.present = 0
+		for n, code in enumerate(codes):
+			group = self.joker_at if (jokers >> code) & 1 else self.natural_at
+			group.setdefault(code, []).append(n)
+			self.present |= 1 << code
+		self.natural = {code: len(at) for code, at in self.natural_at.items()}
+		self.joker = {code: len(at) for code, at in self.joker_at.items()}
+
+	def solve(self):
+		""" Run the search
+		Args:
+			No args
+		Returns:
+			list of 4 lists of indexes into the codes, or None
+		"""
+		present = self.present
+		if not any(m & present == m for m in RUN_MASKS):
+			return None
+
+		# A card that no other card can share a set with needs 2 Jokers
+		joker_count = sum(self.joker.values())
+		lonely = 0
+		for code, count in self.natural.items():
+			if count == 1 and not PARTNER_MASKS[code] & present:
+				lonely += 1
+		if 2 * lonely > joker_count:
+			return None
+
+		# Jokers that could sit in a pure run as their own card
+		candidates = []
+		for code, count in self.joker.items():
+			for window in RUN_WINDOWS_BY_RANK[3][code >> 2] + RUN_WINDOWS_BY_RANK[4][code >> 2]:
+				m = sum(1 << (r * 4 + (code & 3)) for r in window)
+				if m & present == m:
+					candidates.append((code, count))
+					break
+
+		for picks in itertools.product(*[range(count + 1) for code, count in candidates]):
+			keyed = dict(self.natural)
+			for (code, count), n in zip(candidates, picks):
+				if n:
+					keyed[CARDS_PER_PACK + code] = n
+			self.keys = sorted(keyed)
+			self.index = {key: i for i, key in enumerate(self.keys)}
+			self.count = [keyed[key] for key in self.keys]
+			self.wild = joker_count - sum(picks)
+			self.failed = set()
+
+			# card codes still in hand, to stop early once no run without a Joker is left
+			self.held = [0] * CARDS_PER_PACK
+			self.left = 0
+			for key, n in keyed.items():
+				self.held[key % CARDS_PER_PACK] += n
+				self.left |= 1 << (key % CARDS_PER_PACK)
+			self.runs = [m for m in RUN_MASKS if m & self.left == m]
+
+			sets = self.search(3, 1, True)
+			if sets is not None:
+				return self.place(sets)
+		return None
+
+	def search(self, n3, n4, need_pure):
+		""" Place the remaining cards into sets
+		Args:
+			n3: number of sets of 3 cards still to make
+			n4: number of sets of 4 cards still to make
+			need_pure: True if no run without a Joker has been made yet
+		Returns:
+			list of (keys, size) for the sets, or None
+		"""
+		count = self.count
+		for i, n in enumerate(count):
+			if n:
+				break
+		else:
+			# Only wild Jokers are left, they make books on their own
+			if need_pure or self.wild != 3 * n3 + 4 * n4:
+				return None
+			return [((), 3)] * n3 + [((), 4)] * n4
+
+		state = (tuple(count), self.wild, n3, n4, need_pure)
+		if state in self.failed:
+			return None
+		if need_pure and not any(m & self.left == m for m in self.runs):
+			self.failed.add(state)
+			return None
+
+		for size, r3, r4 in ((3, n3 - 1, n4), (4, n3, n4 - 1)):
+			if r3 < 0 or r4 < 0:
+				continue
+			for keys, wild, pure in self.sets(i, size):
+				self.take(keys, -1)
+				self.wild -= wild
+				rest = self.search(r3, r4, need_pure and not pure)
+				self.take(keys, 1)
+				self.wild += wild
+				if rest is not None:
+					return [(keys, size)] + rest
+
+		self.failed.add(state)
+		return None
+
+	def take(self, keys, step):
+		""" Take cards out of the hand or put them back
+		Args:
+			keys: key indexes of the cards
+			step: -1 to take the cards, 1 to put them back
+		Returns:
+			No returns
+		"""
+		for j in keys:
+			self.count[j] += step
+			code = self.keys[j] % CARDS_PER_PACK
+			self.held[code] += step
+			if self.held[code] == 0 or (step > 0 and self.held[code] == 1):
+				self.left ^= 1 << code
+
+	def sets(self, i, size):
+		""" Candidate sets that contain key i
+		Args:
+			i: index of the key
+			size: number of cards in the set
+		Returns:
+			generator of (key indexes, wild Jokers used, pure run True/False)
+		"""
+		count = self.count
+		index = self.index
+		key = self.keys[i]
+		code = key % CARDS_PER_PACK
+		rank = code >> 2
+		suit = code & 3
+
+		# Pure runs, the Jokers of the hand may be used as their own card
+		for window in RUN_WINDOWS_BY_RANK[size][rank]:
+			options = []
+			for r in window:
+				if r == rank:
+					options.append((i,))
+					continue
+				c = r * 4 + suit
+				options.append(tuple(index[k] for k in (c, CARDS_PER_PACK + c) if k in index and count[index[k]] > 0))
+				if not options[-1]:
+					break
+			else:
+				for keys in itertools.product(*options):
+					yield keys, 0, True
+
+		if key >= CARDS_PER_PACK:
+			return
+
+		# Books, any number of copies of the rank topped up with wild Jokers
+		same_rank = []
+		for c in range(rank * 4, rank * 4 + 4):
+			if c in index:
+				j = index[c]
+				avail = count[j] - (1 if j == i else 0)
+				if avail > 0:
+					same_rank.append((j, avail))
+		for taken in range(max(0, size - 1 - self.wild), size):
+			for keys in _choose(same_rank, taken):
+				yield (i,) + keys, size - 1 - taken, False
+
+		# Runs with Jokers, the cards of the suit plus at least one wild Joker
+		if self.wild == 0:
+			return
+		same_suit = [index[c] for c in range(suit, CARDS_PER_PACK, 4) if c != code and c in index and count[index[c]] > 0]
+		for taken in range(max(1, size - 1 - self.wild), size - 1):
+			for keys in itertools.combinations(same_suit, taken):
+				ranks = sorted([rank + 1] + [(self.keys[j] >> 2) + 1 for j in keys])
+				if joker_run_fits(ranks, size - 1 - taken):
+					yield (i,) + keys, size - 1 - taken, False
+
+	def place(self, sets):
+		""" Turn the sets of keys into sets of indexes into the codes
+		Args:
+			sets: list of (keys, size) found by search
+		Returns:
+			list of lists of indexes, the sets of 3 cards first
+		"""
+		natural_at = {code: list(at) for code, at in self.natural_at.items()}
+		joker_at = {code: list(at) for code, at in self.joker_at.items()}
+		placed = []
+		for keys, size in sets:
+			at = []
+			for j in keys:
+				key = self.keys[j]
+				if key >= CARDS_PER_PACK:
+					at.append(joker_at[key - CARDS_PER_PACK].pop())
+				else:
+					at.append(natural_at[key].pop())
+			placed.append((at, size))
+
+		# The wild Jokers fill up the sets after their own cards
+		spare = [n for at in joker_at.values() for n in at]
+		for at, size in placed:
+			while len(at) < size:
+				at.append(spare.pop())
+		return [at for at, size in placed if size == 3] + [at for at, size in placed if size == 4]
+
+#lazy enumeration of the sets in a stash
+def iter_melds(stash, joker=None):
+	""" Every valid set of 3 or 4 cards of a stash, the most useful first
+	Pure runs come first (4 cards, then 3), then books without Jokers, then runs with
+	Jokers and books with Jokers, fewest Jokers first.  Sets are made lazily, so a
+	caller that stops early does not pay for the rest.  Sets made of the same card
+	codes are yielded once.
+		Args:
+			stash: array of Card objects
+			joker: the Joker Card picked by Deck.set_joker, or its rank; when not given
+				the isjoker flags of the Cards are used
+		Returns:
+			generator of tuples of Card objects
+	"""
+	if joker is not None:
+		rank = joker.rank if isinstance(joker, Card) else joker
+		is_joker = lambda card: card.rank == rank
+	else:
+		is_joker = lambda card: card.isjoker
+	jokers = [card for card in stash if is_joker(card)]
+	jmask = 0
+	for card in jokers:
+		jmask |= 1 << card.code
+	natural = {}	# code -> non Joker Cards
+	for card in stash:
+		if not is_joker(card):
+			natural.setdefault(card.code, []).append(card)
+	# Jokers can sit in a pure run as their own card, after the non Joker copies
+	held = {code: list(cards) for code, cards in natural.items()}
+	for card in jokers:
+		held.setdefault(card.code, []).append(card)
+	seen = set()
+
+	def fresh(cards):
+		key = tuple(sorted(card.code for card in cards))
+		if key in seen:
+			return False
+		seen.add(key)
+		return True
+
+	# Pure runs
+	for size in (4, 3):
+		for suit in range(len(SUIT)):
+			for window in RUN_WINDOWS[size]:
+				codes = [r * 4 + suit for r in window]
+				if all(code in held for code in codes):
+					meld = tuple(held[code][0] for code in codes)
+					if fresh(meld):
+						yield meld
+
+	# Books, then runs and books topped up with Jokers
+	for wild in range(0, min(len(jokers), 4) + 1):
+		for size in (4, 3):
+			n = size - wild
+			if n < 0:
+				continue
+			for extra in itertools.combinations(jokers, wild):
+				if n == 0:
+					if fresh(extra):
+						yield extra
+					continue
+				for rank in range(len(RANK)):
+					cards = [card for code in range(rank * 4, rank * 4 + 4) for card in natural.get(code, ())]
+					for chosen in itertools.combinations(cards, n):
+						meld = chosen + extra
+						if fresh(meld) and meld_flags([card.code for card in meld], jmask) & MELD_BOOK:
+							yield meld
+				if wild == 0:
+					continue
+				# is_valid_run_joker lets a Joker fill more than one gap, so the cards of a suit
+				#	are not limited to one window of ranks
+				for suit in range(len(SUIT)):
+					cards = [natural[code][0] for code in range(suit, CARDS_PER_PACK, 4) if code in natural]
+					for chosen in itertools.combinations(cards, n):
+						meld = chosen + extra
+						if fresh(meld) and meld_flags([card.code for card in meld], jmask) & MELD_RUN_JOKER:
+							yield meld
+
+#cache of solved hands
+HAND_CACHE_VERSION = 1
+
+class HandCache:
+	""" HandCache Class - Bounded LRU cache in front of solve_hand
+
+	Hands are keyed by a signature that is the same for any order of the cards, any
+	renaming of the suits and any pack the cards came from: the count of every rank
+	in each suit, Jokers apart, with the four suits sorted.  The sets are kept as
+	card codes with the sorted suits and are mapped back to the hand on a hit.
+	"""
+
+	def __init__(self, maxsize=1 << 16):
+		""" Class Constructor
+		Args:
+			maxsize: most hands kept, the least recently used is dropped first
+		Returns:
+			No return value
+		"""
+		self.maxsize = maxsize
+		self.entries = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def signature(self, codes, jokers=0):
+		""" Canonical signature of a hand
+		Args:
+			codes: card codes of the hand
+			jokers: card code mask of the Jokers
+		Returns:
+			(int key, list of the original SUIT index of every canonical suit)
+		"""
+		columns = [0, 0, 0, 0]
+		for code in codes:
+			# 4 bit count per rank, the Jokers of a rank in the next 4 bits
+			columns[code & 3] += 1 << ((code >> 2) * 8 + 4 * ((jokers >> code) & 1))
+		order = sorted(range(4), key=columns.__getitem__)
+		key = 0
+		for suit in order:
+			key = (key << (8 * len(RANK))) | columns[suit]
+		return key, order
+
+	def solve(self, codes, jokers=0):
+		""" solve_hand with the answers of equivalent hands remembered
+		Args:
+			codes: card codes of the 13 cards of the stash
+			jokers: card code mask of the Jokers
+		Returns:
+			the 4 sets as lists of indexes into codes, or None, like solve_hand
+		"""
+		if len(codes) != 13:
+			return None
+		key, order = self.signature(codes, jokers)
+		if key in self.entries:
+			self.hits += 1
+			self.entries.move_to_end(key)
+			sets = self.entries[key]
+			if sets is None:
+				return None
+			# put the cards of the hand back in the sets, in the original suits
+			at = {}
+			for n, code in enumerate(codes):
+				at.setdefault(code, []).append(n)
+			return [[at[(c & ~3) | order[c & 3]].pop() for c in s] for s in sets]
+
+		self.misses += 1
+		split = solve_hand(codes, jokers)
+		canonical = {suit: i for i, suit in enumerate(order)}
+		sets = None
+		if split is not None:
+			sets = tuple(tuple((codes[n] & ~3) | canonical[codes[n] & 3] for n in s) for s in split)
+		self.entries[key] = sets
+		if len(self.entries) > self.maxsize:
+			self.entries.popitem(last=False)
+			self.evictions += 1
+		return split
+
+	def stats(self):
+		""" Hit, miss and eviction counts
+		Args:
+			No args
+		Returns:
+			dict with size, maxsize, hits, misses, evictions and hit_rate
+		"""
+		lookups = self.hits + self.misses
+		return {'size': len(self.entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+			'evictions': self.evictions, 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+	def clear(self):
+		""" Forget every hand and reset the counts """
+		self.entries.clear()
+		self.hits = self.misses = self.evictions = 0
+
+	def save(self, path):
+		""" Write the cached hands to a JSON file, least recently used first
+		Args:
+			path: file path
+		Returns:
+			No returns
+		"""
+		with open(path, 'w') as f:
+			json.dump({'version': HAND_CACHE_VERSION, 'entries': list(self.entries.items())}, f)
+
+	def load(self, path):
+		""" Add the hands of a file written by save, a missing file is ignored
+		Args:
+			path: file path
+		Returns:
+			number of hands read
+		"""
+		try:
+			with open(path) as f:
+				data = json.load(f)
+		except FileNotFoundError:
+			return 0
+		if data.get('version') != HAND_CACHE_VERSION:
+			raise ValueError('ERROR: Not a hand cache file')
+		for key, sets in data['entries']:
+			self.entries[key] = None if sets is None else tuple(tuple(s) for s in sets)
+			self.entries.move_to_end(key)
+		while len(self.entries) > self.maxsize:
+			self.entries.popitem(last=False)
+			self.evictions += 1
+		return len(data['entries'])
+
+# the cache shared by the Players, the bots and the simulations of a process
+HAND_CACHE = HandCache()
+
+def cached_solve(codes, jokers=0):
+	""" solve_hand through HAND_CACHE
+		Args:
+			codes: card codes of the 13 cards of the stash
+			jokers: card code mask of the Jokers
+		Returns:
+			the 4 sets as lists of indexes into codes, or None
+	"""
+	return HAND_CACHE.solve(codes, jokers)
+
+#precomputed run decompositions of every holding of a suit
+RUN_TABLE_MAGIC = b'RRUN'
+RUN_TABLE_VERSION = 1
+RUN_TABLE_HEADER = struct.Struct('<4sHHI')	# magic, version, number of windows, number of decompositions
+RUN_TABLE_ENTRY = struct.Struct('<IHH')	# first decomposition, number of decompositions, ranks in runs without a Joker
+RUN_TABLE_WINDOWS = RUN_WINDOWS[3] + RUN_WINDOWS[4]	# a decomposition is a mask of indexes into this list
+RUN_TABLE_MASKS = [sum(1 << r for r in window) for window in RUN_TABLE_WINDOWS]
+RUN_TABLE_JOKER_SHIFT = len(RUN_TABLE_WINDOWS)	# the Jokers a decomposition needs are kept above the windows
+RUN_TABLE_RANK_SHIFT = 32	# and the ranks its runs hold above them
+RUN_TABLE = None	# RunTable solve_hand rules stashes out with, when one is loaded
+
+def suit_decompositions(ranks):
+	""" Every way to make runs of a holding of a suit
+	A decomposition is a set of runs that do not share a rank, at most 4 of them
+	and at most one of 4 cards like the sets of a stash, each holding at least 2 of
+	the ranks.  The ranks the runs are missing must be filled in by Jokers.
+		Args:
+			ranks: 13 bit mask of the ranks held in the suit
+		Returns:
+			list of (window index mask, Jokers needed, number of runs, mask of the
+			ranks held in the runs) tuples, fewest Jokers first, then fewest runs
+	"""
+	windows = [(i, mask, len(RUN_TABLE_WINDOWS[i]) - (mask & ranks).bit_count())
+		for i, mask in enumerate(RUN_TABLE_MASKS) if (mask & ranks).bit_count() >= 2]
+	found = []
+
+	def extend(start, used, ids, missing, count, four):
+		if ids:
+			found.append((ids, missing, count, used & ranks))
+		if count == 4:
+			return
+		for j in range(start, len(windows)):
+			i, mask, holes = windows[j]
+			is_four = len(RUN_TABLE_WINDOWS[i]) == 4
+			if mask & used or is_four and four:
+				continue
+			extend(j + 1, used | mask, ids | (1 << i), missing + holes, count + 1, four or is_four)
+
+	extend(0, 0, 0, 0, 0, False)
+	found.sort(key=lambda d: (d[1], d[2]))
+	return found
+
+def build_run_table():
+	""" Build the run table of every holding of a suit, it takes about half a second
+		Args:
+			No args
+		Returns:
+			bytes, as written by write_run_table
+	"""
+	entries = []
+	records = []
+	for ranks in range(1 << len(RANK)):
+		found = suit_decompositions(ranks)
+		pure = 0
+		for ids, missing, count, held in found:
+			if missing == 0:
+				pure |= held
+			records.append(ids | (missing << RUN_TABLE_JOKER_SHIFT) | (held << RUN_TABLE_RANK_SHIFT))
+		entries.append(RUN_TABLE_ENTRY.pack(len(records) - len(found), len(found), pure))
+	header = RUN_TABLE_HEADER.pack(RUN_TABLE_MAGIC, RUN_TABLE_VERSION, len(RUN_TABLE_WINDOWS), len(records))
+	return header + b''.join(entries) + struct.pack('<%dQ' % len(records), *records)
+
+def write_run_table(path):
+	""" Write the run table to a file, readers never see a file that is half written
+		Args:
+			path: file name
+		Returns:
+			No returns
+	"""
+	with open(path + '.tmp', 'wb') as f:
+		f.write(build_run_table())
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(path + '.tmp', path)
+
+class RunTable:
+	""" RunTable Class - The run decompositions of every holding of a suit, read in place
+
+	The table is a header, one RUN_TABLE_ENTRY per 13 bit holding and the
+	decompositions as 64 bit words: the window mask, the Jokers the runs need and
+	the ranks of the holding the runs hold.  Opened
+	from a file it is mapped read only, so every process of a simulation pool
+	shares the pages of one copy instead of building its own.
+	"""
+
+	def __init__(self, data):
+		""" Class Constructor
+		Args:
+			data: bytes or mmap made by build_run_table
+		Returns:
+			No return value
+		"""
+		magic, version, windows, size = RUN_TABLE_HEADER.unpack_from(data)
+		if magic != RUN_TABLE_MAGIC or version != RUN_TABLE_VERSION or windows != len(RUN_TABLE_WINDOWS):
+			raise ValueError('ERROR: Not a Rummy run table')
+		start = RUN_TABLE_HEADER.size
+		end = start + RUN_TABLE_ENTRY.size * (1 << len(RANK))
+		self.data = data
+		self.entries = memoryview(data)[start:end].cast('H')	# 4 shorts per holding
+		self.records = memoryview(data)[end:end + 8 * size].cast('Q')
+
+	@classmethod
+	def open(cls, path):
+		""" Map a run table file
+		Args:
+			path: file written by write_run_table
+		Returns:
+			RunTable object
+		"""
+		with open(path, 'rb') as f:
+			return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+	def pure(self, ranks):
+		""" Ranks of a holding that fit in a run without a Joker, a 13 bit mask """
+		return self.entries[ranks * 4 + 3]
+
+	def decompositions(self, ranks):
+		""" The decompositions of a holding, see suit_decompositions
+		Args:
+			ranks: 13 bit mask of the ranks held in the suit
+		Returns:
+			list of (tuple of runs as tuples of RANK indexes, Jokers needed) tuples
+		"""
+		entries = self.entries
+		first = entries[ranks * 4] | (entries[ranks * 4 + 1] << 16)
+		found = []
+		for record in self.records[first:first + entries[ranks * 4 + 2]]:
+			windows = tuple(RUN_TABLE_WINDOWS[i] for i in range(RUN_TABLE_JOKER_SHIFT) if (record >> i) & 1)
+			found.append((windows, (record >> RUN_TABLE_JOKER_SHIFT) & 15))
+		return found
+
+	def fewest_runs(self, ranks, needed):
+		""" Fewest runs without a Joker that hold some ranks of a holding
+		Args:
+			ranks: 13 bit mask of the ranks held in the suit
+			needed: 13 bit mask of the ranks that must be in the runs
+		Returns:
+			number of runs, 0 when nothing is needed, None when the ranks do not fit
+		"""
+		if not needed:
+			return 0
+		if needed & ~self.pure(ranks):
+			return None
+		entries = self.entries
+		first = entries[ranks * 4] | (entries[ranks * 4 + 1] << 16)
+		windows = (1 << RUN_TABLE_JOKER_SHIFT) - 1
+		for record in self.records[first:first + entries[ranks * 4 + 2]]:
+			if (record >> RUN_TABLE_JOKER_SHIFT) & 15:
+				break
+			if needed & ~(record >> RUN_TABLE_RANK_SHIFT) == 0:
+				return (record & windows).bit_count()
+		return None
+
+	def may_close(self, codes, jokers=0):
+		""" Quick check that rules out most of the stashes that cannot close the game
+		Every stash needs a run without a Joker.  Without Jokers and without two copies
+		of a card, every card that is not in a book must also be in one of the runs
+		and those runs must fit in the 4 sets.
+		Args:
+			codes: card codes of the 13 cards of the stash
+			jokers: card code mask of the Jokers
+		Returns:
+			False if the stash cannot close the game, True if solve_hand must decide
+		"""
+		entries = self.entries
+		suits = [0, 0, 0, 0]
+		counts = [0] * len(RANK)
+		books = 0	# a rank with fewer than 3 cards cannot make a book without a Joker
+		seen = 0
+		copies = False
+		for code in codes:
+			rank = code >> 2
+			suits[code & 3] |= 1 << rank
+			counts[rank] += 1
+			if counts[rank] == 3:
+				books |= 1 << rank
+			copies = copies or (seen >> code) & 1
+			seen |= 1 << code
+		if not (entries[suits[0] * 4 + 3] or entries[suits[1] * 4 + 3] or entries[suits[2] * 4 + 3] or entries[suits[3] * 4 + 3]):
+			return False
+		if copies or jokers & seen:
+			return True
+
+		runs = 0
+		for ranks in suits:
+			fewest = self.fewest_runs(ranks, ranks & ~books)
+			if fewest is None:
+				return False
+			runs += fewest
+		return runs <= 4
+
+def load_run_table(path=None):
+	""" Make solve_hand rule stashes out with a run table first
+		Args:
+			path: run table file to map, it is written first when it does not exist;
+				the table is built in memory when not given
+		Returns:
+			the RunTable object
+	"""
+	global RUN_TABLE
+	if path is None:
+		RUN_TABLE = RunTable(build_run_table())
+	else:
+		if not os.path.exists(path):
+			write_run_table(path)
+		RUN_TABLE = RunTable.open(path)
+	return RUN_TABLE
+
+#incremental distance to close
+_DISTANCE_CACHE = {}
+DISTANCE_CACHE_SIZE = 1 << 16
+
+class HandEvaluator:
+	""" HandEvaluator Class - Number of cards a stash must change before it can close the game
+
+	The evaluator is told about every card that enters or leaves the stash and keeps
+	the per-suit run masks, the per-rank counts and a packed count of every card code
+	up to date, so an update is a few integer operations.  Distances are cached by
+	the packed counts, so asking again about a stash seen before is a dict lookup.
+	"""
+
+	def __init__(self, cards=()):
+		""" Class Constructor
+		Args:
+			cards: Card objects already in the stash
+		Returns:
+			No return value
+		"""
+		self.key = 0	# 4 bit count of every non Joker card code
+		self.joker_key = 0	# 4 bit count of every Joker card code
+		self.suit_masks = [0] * len(SUIT)	# bit i set if RANK[i] of the suit is held
+		self.rank_counts = [0] * len(RANK)	# non Joker cards held of each rank
+		self.jokers = 0
+		for card in cards:
+			self.add(card)
+
+	def add(self, card):
+		""" A card entered the stash
+		Args:
+			card: Card object
+		Returns:
+			No returns
+		"""
+		code = card.code
+		if card.isjoker:
+			self.jokers += 1
+			self.joker_key += 1 << (code * 4)
+			return
+		self.key += 1 << (code * 4)
+		self.suit_masks[code & 3] |= 1 << (code >> 2)
+		self.rank_counts[code >> 2] += 1
+
+	def remove(self, card):
+		""" A card left the stash
+		Args:
+			card: Card object
+		Returns:
+			No returns
+		"""
+		code = card.code
+		if card.isjoker:
+			self.jokers -= 1
+			self.joker_key -= 1 << (code * 4)
+			return
+		self.key -= 1 << (code * 4)
+		self.rank_counts[code >> 2] -= 1
+		if (self.key >> (code * 4)) & 15 == 0:
+			self.suit_masks[code & 3] &= ~(1 << (code >> 2))
+
+	def distance(self):
+		""" Minimum number of cards to change before the stash can close the game
+		With 14 cards in the stash the best card to drop is left out.  Jokers count
+		as free cards in every set, in the pure run only as their own card.  Runs
+		with Jokers are expected to fit in the length of the set.
+		Args:
+			No args
+		Returns:
+			0 to 13 - int value
+		"""
+		state = (self.key, self.joker_key)
+		distance = _DISTANCE_CACHE.get(state)
+		if distance is None:
+			if len(_DISTANCE_CACHE) >= DISTANCE_CACHE_SIZE:
+				_DISTANCE_CACHE.clear()
+			distance = _DISTANCE_CACHE[state] = 13 - _best_keep(self)
+		return distance
+
+	def arrangement(self):
+		""" Distance of the stash and the sets the distance was found with
+		Args:
+			No args
+		Returns:
+			(distance, runs as tuples of card codes, books as (RANK index, cards) tuples,
+			number of sets holding a single card)
+		"""
+		plan = [[], [], 4]
+		distance = 13 - _best_keep(self, plan)
+		if len(_DISTANCE_CACHE) >= DISTANCE_CACHE_SIZE:
+			_DISTANCE_CACHE.clear()
+		_DISTANCE_CACHE[(self.key, self.joker_key)] = distance
+		return (distance,) + tuple(plan)
+
+	def distance_without(self, card):
+		""" Distance of the stash if a card was dropped
+		Args:
+			card: Card object in the stash
+		Returns:
+			0 to 13 - int value
+		"""
+		self.remove(card)
+		distance = self.distance()
+		self.add(card)
+		return distance
+
+	def distance_with(self, card):
+		""" Distance of the stash if a card was added
+		Args:
+			card: Card object
+		Returns:
+			0 to 13 - int value
+		"""
+		self.add(card)
+		distance = self.distance()
+		self.remove(card)
+		return distance
+
+@functools.lru_cache(maxsize=None)
+def _suit_windows(ranks):
+	""" Runs of a suit that already hold at least 2 of the ranks
+		Args:
+			ranks: 13 bit mask of the ranks held in the suit
+		Returns:
+			tuple of (length, tuple of RANK indexes) tuples
+	"""
+	windows = []
+	for size in (4, 3):
+		for window in RUN_WINDOWS[size]:
+			if sum((ranks >> r) & 1 for r in window) >= 2:
+				windows.append((size, window))
+	return tuple(windows)
+
+def _fill_books(counts, books, fours):
+	""" Most cards of a stash that a number of books can hold
+	Books of 3 cards are filled from the rank with the most cards left, which is the
+	best order when every book has the same size.  The rank with the most cards is not
+	always the best place for the book of 4 cards, so it is tried on every rank with 4
+	cards or more.
+		Args:
+			counts: non Joker cards held of each rank
+			books: number of books to make
+			fours: RANK indexes the book of 4 cards is tried on, empty when no book has 4 cards
+		Returns:
+			(number of cards in the books, list of (rank, cards) tuples), the list is None
+			when the books cannot all hold 2 cards or more
+	"""
+	best = (0, None)
+	for four in fours + [None]:
+		avail = list(counts)
+		made = []
+		total = 0
+		if four is not None and books > 0:
+			avail[four] -= 4
+			total = 4
+			made.append((four, 4))
+		while len(made) < books:
+			most = max(avail)
+			if most < 2:
+				made = None
+				break
+			rank = avail.index(most)
+			avail[rank] -= min(3, most)
+			total += min(3, most)
+			made.append((rank, min(3, most)))
+		if made is not None and (best[1] is None or total > best[0]):
+			best = (total, made)
+	return best
+
+def _best_keep(evaluator, plan=None):
+	""" Largest number of cards of a stash that can stay when it is changed to close the game
+	The 4 sets are runs picked from the cards of a suit, books picked from the cards of a rank,
+	and sets holding a single card of the stash.  Runs are searched first, the books
+	and single cards are then filled in from what is left.
+		Args:
+			evaluator: HandEvaluator of the stash
+			plan: list that is filled with the best arrangement found when given:
+				the runs as tuples of card codes, the books as (rank, cards) tuples
+				and the number of sets holding a single card
+		Returns:
+			number of cards kept - int value
+	"""
+	counts = [(evaluator.key >> (code * 4)) & 15 for code in range(CARDS_PER_PACK)]
+	joker_counts = [(evaluator.joker_key >> (code * 4)) & 15 for code in range(CARDS_PER_PACK)]
+	rank_left = list(evaluator.rank_counts)
+	held = [counts[c] + joker_counts[c] for c in range(CARDS_PER_PACK)]
+	# bit of every card code still held, as a natural card or as a Joker
+	present = sum(1 << c for c in range(CARDS_PER_PACK) if held[c])
+	# bit of every card code held more than once
+	twice = sum(1 << c for c in range(CARDS_PER_PACK) if held[c] > 1)
+
+	# Jokers can sit in a run as their own card
+	candidates = []
+	for suit in range(len(SUIT)):
+		ranks = evaluator.suit_masks[suit]
+		for c in range(suit, CARDS_PER_PACK, 4):
+			if joker_counts[c]:
+				ranks |= 1 << (c >> 2)
+		for size, window in _suit_windows(ranks):
+			codes = tuple(r * 4 + suit for r in window)
+			candidates.append((size, codes, sum(1 << c for c in codes)))
+
+	# try the fullest runs first so that the bound below cuts off more of the search
+	candidates.sort(key=lambda c: -(c[2] & present).bit_count())
+	best = [0]
+	runs_taken = []
+
+	def complete(runs, kept, lost, four_left, jokers):
+		# fill the sets that are not runs with books, then with single cards
+		groups = 4 - runs
+		left = sum(rank_left)
+		fours = [r for r in range(len(RANK)) if rank_left[r] >= 4] if four_left else []
+		for b in range(groups + 1):
+			books, made = _fill_books(rank_left, b, fours)
+			if made is None:
+				break
+			singles = groups - b
+			n = kept + books + min(singles, left - books)
+			pure = lost
+			if singles > 0:
+				# one of the single card sets becomes the run without a Joker
+				size = 4 if four_left and b == 0 and singles == 1 else 3
+				pure = min(pure, size - (1 if left - books > 0 else 0))
+			if pure < 13 and n + min(jokers, 13 - n - pure) > best[0]:
+				best[0] = n + min(jokers, 13 - n - pure)
+				if plan is not None:
+					plan[:] = [list(runs_taken), list(made), singles]
+
+	def search(options, runs, kept, lost, four_left, jokers):
+		nonlocal present
+		# no set can hold more than 4 cards, nor more than the cards of one rank or one run
+		#	still open, so the sets left hold at most the fullest of those
+		chunks = sorted(rank_left, reverse=True)
+		if chunks[0] > 4:
+			chunks = sorted([min(n - k, 4) for n in chunks for k in range(0, n, 4)], reverse=True)
+		if min(13, kept + sum(chunks[:4 - runs]) + jokers) > best[0]:
+			complete(runs, kept, lost, four_left, jokers)
+		if runs == 4 or best[0] == 13:
+			return
+		# the runs that still hold 2 cards, the later ones of the list only.  Runs that
+		#	take the same cards leave the same sets to fill, only the first one is tried
+		live = {}
+		for option in options:
+			taken = option[2] & present
+			if taken & (taken - 1):
+				live.setdefault((option[0], taken), option)
+		options = list(live.values())
+		room = chunks
+		for taken in {taken for size, taken in live}:
+			room.append(taken.bit_count())
+			if not taken & ~twice:
+				# a run held more than once can be taken once for every copy of its cards
+				copies = min(held[c] for c in range(CARDS_PER_PACK) if (taken >> c) & 1)
+				room += [room[-1]] * (min(copies, 4 - runs) - 1)
+		room.sort(reverse=True)
+		if min(13, kept + sum(room[:4 - runs]) + jokers) <= best[0]:
+			return
+		# a run taken here leaves the other sets at most the fullest of the rest
+		rest = kept + sum(room[:3 - runs]) + jokers
+		for i, (size, taken) in enumerate(live):
+			if size == 4 and not four_left or size == 3 and runs == 3 and four_left:
+				continue
+			if rest + taken.bit_count() <= best[0]:
+				continue
+			codes = options[i][1]
+			taken = [c for c in codes if (present >> c) & 1]
+			natural = [c for c in taken if counts[c] > 0]
+			wild = [c for c in taken if counts[c] == 0]
+			before = present
+			for c in natural:
+				counts[c] -= 1
+				rank_left[c >> 2] -= 1
+				if not counts[c] and not joker_counts[c]:
+					present &= ~(1 << c)
+			for c in wild:
+				joker_counts[c] -= 1
+				if not joker_counts[c]:
+					present &= ~(1 << c)
+			runs_taken.append(tuple(taken))
+			search(options[i:], runs + 1, kept + len(taken), min(lost, size - len(taken)), four_left and size != 4, jokers - len(wild))
+			runs_taken.pop()
+			present = before
+			for c in natural:
+				counts[c] += 1
+				rank_left[c >> 2] += 1
+			for c in wild:
+				joker_counts[c] += 1
+
+	search(candidates, 0, 0, 13, True, evaluator.jokers)
+	return best[0]
+
+_COMPLETIONS = {}	# (sorted card codes, Joker mask) -> card codes that make a set with them
+
+def completing_codes(codes, jokers=0):
+	""" Card codes that make a valid set with some cards
+		Args:
+			codes: sorted tuple of card codes
+			jokers: card code mask of the Jokers
+		Returns:
+			tuple of card codes, cached since the answer only depends on the arguments
+	"""
+	key = (codes, jokers)
+	found = _COMPLETIONS.get(key)
+	if found is None:
+		candidates = jokers
+		for code in codes:
+			candidates |= PARTNER_MASKS[code] | (1 << code)
+		found = []
+		while candidates:
+			low = candidates & -candidates
+			code = low.bit_length() - 1
+			candidates ^= low
+			if meld_flags(list(codes) + [code], jokers):
+				found.append(code)
+		found = _COMPLETIONS[key] = tuple(found)
+	return found
+
+class CardTracker:
+	""" CardTracker Class - The cards of a Game that everybody has seen
+
+	Every card dropped on the Pile, the first card of the Pile and the Joker on the
+	table are public, and so is every card a Player picks from the Pile: it is known
+	to be in that Player's stash until the Player drops a card with the same code.
+	The tracker keeps per card code counts of those copies, updated in constant time
+	on every Pile event, so the queries never look at the history of the Pile.
+	A viewer's own stash is read from its HandEvaluator.
+	"""
+
+	def __init__(self, packs, players=2, joker=None):
+		""" Class Constructor
+		Args:
+			packs: number of packs in the Deck
+			players: number of Players
+			joker: the Joker Card on the table, None when there is none
+		Returns:
+			No return value
+		"""
+		self.packs = packs
+		self.joker = joker
+		self.jokers = rank_mask(RANK_INDEX[joker.rank]) if joker is not None else 0
+		self.out = [0] * CARDS_PER_PACK	# public copies of every card code: Pile, known in a stash, Joker on the table
+		self.out_total = 0
+		self.pile = [0] * CARDS_PER_PACK	# copies of every card code in the Pile
+		self.held = [[0] * CARDS_PER_PACK for i in range(players)]	# copies every Player picked and still holds
+		self.held_total = [0] * players
+		self.picks = [[0] * len(RANK) for i in range(players)]	# cards of every rank each Player picked from the Pile
+		self.drops = [[0] * len(RANK) for i in range(players)]	# cards of every rank each Player dropped
+		if joker is not None:
+			self.out[joker.code] += 1
+			self.out_total += 1
+
+	def shown(self, card):
+		""" A card nobody held was put face up on the Pile """
+		self.pile[card.code] += 1
+		self.out[card.code] += 1
+		self.out_total += 1
+
+	def dropped(self, card, player):
+		""" A Player dropped a card on the Pile
+		Args:
+			card: Card object
+			player: index of the Player
+		Returns:
+			No returns
+		"""
+		code = card.code
+		self.drops[player][code >> 2] += 1
+		if self.held[player][code]:
+			# a card everybody saw the Player pick, it was public already
+			self.held[player][code] -= 1
+			self.held_total[player] -= 1
+			self.pile[code] += 1
+		else:
+			self.shown(card)
+
+	def picked(self, card, player):
+		""" A Player picked the top card of the Pile
+		Args:
+			card: Card object
+			player: index of the Player
+		Returns:
+			No returns
+		"""
+		code = card.code
+		self.pile[code] -= 1
+		self.held[player][code] += 1
+		self.held_total[player] += 1
+		self.picks[player][code >> 2] += 1
+
+	def recycled(self, cards):
+		""" The cards of the Pile were shuffled back into the Deck, nobody knows where they are """
+		for card in cards:
+			self.pile[card.code] -= 1
+			self.out[card.code] -= 1
+		self.out_total -= len(cards)
+
+	def remaining(self, code, player):
+		""" Copies of a card a Player has not seen
+		Args:
+			code: card code
+			player: the Player looking, with its stash
+		Returns:
+			copies in the Deck or in the other stashes, as far as the Player knows
+		"""
+		evaluator = player.evaluator
+		mine = ((evaluator.key >> (code * 4)) & 15) + ((evaluator.joker_key >> (code * 4)) & 15)
+		seat = player.game.players.index(player) if player.game is not None else None
+		picked = self.held[seat][code] if seat is not None else 0
+		return self.packs - self.out[code] - mine + picked
+
+	def unseen(self, player):
+		""" Number of cards a Player has not seen: the Deck and the unknown cards of the other stashes """
+		seat = player.game.players.index(player) if player.game is not None else None
+		picked = self.held_total[seat] if seat is not None else 0
+		return self.packs * CARDS_PER_PACK - self.out_total - len(player.stash) + picked
+
+	def p_next(self, code, player):
+		""" Probability that the next card a Player takes from the Deck has a card code
+		Every card the Player has not seen is taken to be as likely to be next.
+		Args:
+			code: card code
+			player: the Player looking
+		Returns:
+			float
+		"""
+		unseen = self.unseen(player)
+		return self.remaining(code, player) / unseen if unseen > 0 else 0.0
+
+	def p_complete(self, cards, player):
+		""" Probability that the next card from the Deck makes a set of 3 or 4 cards with some cards
+		For example the chance to draw the card that completes a run of 2 or 3 cards.
+		Args:
+			cards: 2 or 3 Card objects
+			player: the Player looking
+		Returns:
+			float
+		"""
+		unseen = self.unseen(player)
+		if unseen <= 0:
+			return 0.0
+		codes = tuple(sorted(card.code for card in cards))
+		count = 0
+		for code in completing_codes(codes, self.jokers | joker_mask(cards)):
+			count += self.remaining(code, player)
+		return count / unseen
+
+	def collecting(self, player, rank):
+		""" Chance that a Player is collecting a rank, from what it picked and dropped
+		A guess: every pick of the rank counts for it, every drop against it, starting
+		from 1 in 4 before the Player did either.
+		Args:
+			player: index of the Player
+			rank: RANK index
+		Returns:
+			float from 0 to 1
+		"""
+		picks = self.picks[player][rank]
+		return (picks + 1) / (picks + self.drops[player][rank] + 4)
+
+def unit_tests():
+	""" Unit Tests for Checking various aspects of the program
+		Args:
+			No args
+		Returns:
+			no returns.
+	"""
+
+	print("Running Unit Tests")
 	"""
 	#test 1 - check players deal card exception handling
 	player = Player("Vinitha", None, None)
@@ -638,6 +3230,450 @@ def unit_tests():
 	player2.deal_card(Card("K", "Spades"))
 	assert (player2.close_game() == False)
 
+	#test 8 - compact validators give the same answers as the Card validators
+	rng = random.Random(8)
+	deck = Deck(2)
+	assert (len(deck.cards) == 104 and deck.cards[0] is not deck.cards[52] and len(deck.faces) == 52)
+	assert (deck.cards[0].code == deck.cards[52].code and card_to_int(deck.cards[52]) == card_to_int(deck.cards[0]) + CARDS_PER_PACK)
+	for i in range(3000):
+		# draw from a few suits and a narrow band of ranks so that valid sets are common
+		suits = rng.sample(SUIT, rng.choice([1, 1, 2, 4]))
+		low = rng.randrange(len(RANK))
+		pool = [c for c in deck.cards if c.suit in suits and (RANK_INDEX[c.rank] - low) % len(RANK) < 5]
+		cards = rng.sample(pool, min(len(pool), rng.choice([3, 4])))
+		deck.joker_rank = rng.choice(RANK + [None] * 4)
+		codes = [card.code for card in cards]
+		jokers = joker_mask(cards)
+		assert (is_valid_run(list(cards)) == is_valid_run_codes(codes))
+		assert (is_valid_book(list(cards)) == is_valid_book_codes(codes, jokers))
+		assert (is_valid_run_joker(list(cards)) == is_valid_run_joker_codes(codes, jokers))
+		assert (meld_flags(codes, jokers) == classify_codes(codes, jokers) == classify_set(cards))
+	deck.set_joker()
+	assert (len(deck.cards) == 103 and sum(card.isjoker for card in deck.cards) == 7)
+	for packs, hands in ((MIN_PACKS - 1, 2), (MAX_PACKS + 1, 2), (1, MIN_PLAYERS - 1), (8, MAX_PLAYERS + 1), (1, 5)):
+		try:
+			new_game(hands, packs, seed=8, names=[str(n) for n in range(hands)])
+			assert (False)
+		except ValueError:
+			pass
+	assert (len(new_game(MAX_PLAYERS, MAX_PACKS, seed=8, names=[str(n) for n in range(MAX_PLAYERS)]).players) == 10)
+
+	hand = HandMask([0, 4, 4, 51])
+	assert (len(hand) == 4 and hand.codes() == [0, 4, 4, 51] and 51 in hand)
+	assert (hand.remove(4) and 4 in hand and hand.remove(4) and 4 not in hand)
+	assert (int_to_card(card_to_int(Card("T", "Spades", 1))).code == card_code("T", "Spades"))
+
+	#test 9 - close game finds the sets whatever order the stash is in
+	player9 = Player("Tom", None, None)
+	for card in player1.stash:
+		player9.deal_card(card)
+	random.Random(9).shuffle(player9.stash)
+	assert (player9.close_game() == True)
+	assert (close_game_codes([card.code for card in player9.stash]) == True)
+	player9.stash[0] = Card("K", "Clubs")
+	assert (player9.close_game() == False)
+
+	#test 10 - the meld index has the same answers as the validators for every set
+	assert (check_meld_index() == [])
+
+	#test 11 - non interactive Game and Player actions
+	deck = Deck(1)
+	game = Game(2, deck, ["Tom", "Narm"])
+	game.deal(13)
+	assert (len(game.players[0].stash) == 13 and len(game.pile) == 1 and len(deck.cards) == 52 - 27)
+	player = game.players[0]
+	first, last = player.stash[0], player.stash[-1]
+	assert (player.move_card(first.label()) and player.stash[-1] is first)
+	assert (player.move_card(first.label(), last.label()) and player.stash[-2] is first)
+	assert (player.move_card("XX") == False)
+	top = player.pick_card()
+	assert (top is not None and player.pick_card() is None and len(player.stash) == 14)
+	assert (player.close(top.label()) == False and len(player.stash) == 14 and len(game.pile) == 0)
+
+	#test 12 - the distance to close follows the stash card by card
+	assert (player1.distance() == 0 and player2.distance() > 0)
+	for card in list(player.stash):
+		player.drop_card(card.label())
+		player.take_card()
+		fresh = HandEvaluator(player.stash)
+		assert (player.evaluator.key == fresh.key and player.evaluator.suit_masks == fresh.suit_masks)
+		assert (player.distance() == fresh.distance() == min(player.evaluator.distance_without(c) for c in player.stash))
+	# the book of 4 goes on the rank with 4 cards, so dropping TS for a 2 closes the game
+	suits = {s[0]: s for s in SUIT}
+	cards = [Card(label[0], suits[label[1]]) for label in "2C 2C 2H 2H 2S 6D 6H 6H 6H JC QC TC TS".split()]
+	for card in cards:
+		card.isjoker = card.rank == "Q"
+	evaluator = HandEvaluator(cards)
+	assert (evaluator.distance() == 1 and evaluator.distance_with(Card("2", "Hearts")) == 0)
+	# 2 pack stashes holding runs twice are 0 away exactly when the solver closes them
+	rng = random.Random(12)
+	closed = 0
+	for i in range(400):
+		codes = []
+		while len(codes) < 13:
+			suit, low = rng.randrange(4), rng.randrange(len(RANK))
+			if rng.random() < 0.3:
+				codes += [low * 4 + rng.randrange(4) for n in range(3)]
+			else:
+				codes += [(low + n) % len(RANK) * 4 + suit for n in range(rng.choice([3, 4]))] * rng.choice([1, 2])
+			if rng.random() < 0.3:
+				codes.append(rng.randrange(CARDS_PER_PACK))
+		codes = codes[:13]
+		if max(codes.count(code) for code in codes) > 2:
+			continue
+		closes = cached_solve(codes) is not None
+		closed += closes
+		assert ((HandEvaluator([Card(RANK[code >> 2], SUIT[code & 3]) for code in codes]).distance() == 0) == closes)
+	assert (closed > 20)
+
+	#test 13 - the Pile is shuffled back into the Deck once the Deck runs out
+	deck = Deck(1)
+	game = Game(2, deck, ["Tom", "Narm"])
+	game.deal(13)
+	player = game.players[0]
+	for turn in range(200):
+		assert (player.take_card() is not None)
+		player.drop_card(player.stash[0].label())
+		assert (len(deck.cards) + len(game.pile) + 26 == 52)
+	assert (game.pile.peek() is not None and len(player.stash) == 13)
+	deck.cards.clear()
+	game.pile[:] = game.pile[-1:]
+	assert (deck.draw_card() is None and player.take_card() is None and len(game.pile) == 1)
+
+	#test 14 - a recorded game is rebuilt from its log
+	game = new_game(3, 2, seed=14, names=["Tom", "Narm", "Varun"], joker=True, record=True)
+	rng = random.Random(14)
+	for turn in range(300):
+		player = game.players[game.turn]
+		if rng.random() < 0.5 or player.pick_card() is None:
+			player.take_card()
+		if rng.random() < 0.2:
+			player.sort_cards()
+		if rng.random() < 0.3:
+			where = rng.choice(player.stash).label() if rng.random() < 0.5 else ""
+			player.move_card(rng.choice(player.stash).label(), where)
+		if rng.random() < 0.1 and player.close(rng.choice(player.stash).label()):
+			break
+		player.drop_card(rng.choice(player.stash).label())
+		game.turn = (game.turn + 1) % 3
+	copy = replay(game.log.to_bytes())
+	assert ([card_to_int(c) for c in copy.deck.cards] == [card_to_int(c) for c in game.deck.cards])
+	assert ([card_to_int(c) for c in copy.pile] == [card_to_int(c) for c in game.pile])
+	for a, b in zip(copy.players, game.players):
+		assert ([card_to_int(c) for c in a.stash] == [card_to_int(c) for c in b.stash])
+	assert (len(replay(game.log, upto=10).pile) > 0)
+
+	#test 15 - the instrumentation counts calls while it is on and leaves no trace when it is off
+	sys.modules.setdefault('rummy_final', sys.modules[__name__])
+	import rummy_metrics
+	original = Player.close_game
+	rummy_metrics.enable()
+	assert (Player.close_game is not original and rummy_metrics.enabled())
+	player9.close_game()
+	assert (is_valid_book(list(player1.stash[:3])) in (True, False))
+	rummy_metrics.disable()
+	assert (Player.close_game is original and not hasattr(sys.modules[__name__], 'input'))
+	snap = rummy_metrics.snapshot()
+	assert (snap['close_game']['count'] >= 1 and snap['validator.is_valid_book']['count'] >= 1)
+	assert ('rummy_call_seconds_count{name="close_game"}' in rummy_metrics.to_prometheus(snap))
+	rummy_metrics.reset()
+
+	#test 16 - many threads validating shared Card objects agree with a single thread
+	sets = []
+	rng = random.Random(16)
+	deck = Deck(2)
+	cards = deck.cards
+	for i in range(2000):
+		sets.append(rng.sample(cards[:26], rng.choice([3, 4])))
+	deck.joker_rank = "5"
+	orders = [list(s) for s in sets]
+	expected = [validate_set(s) for s in sets]
+	interval = sys.getswitchinterval()
+	sys.setswitchinterval(1e-6)
+	try:
+		for workers in (2, 8, 32):
+			assert (validate_sets(sets, workers, chunk=16) == expected)
+	finally:
+		sys.setswitchinterval(interval)
+	assert (orders == sets and RANK_VALUE["A"] == 1)
+
+	#test 17 - batch validation agrees with solve_hand, when NumPy is installed
+	import rummy_batch
+	if rummy_batch.np is not None:
+		hands = rummy_batch.random_deals(3000, 14, seed=17)
+		ranks = rummy_batch.np.random.default_rng(17).integers(-1, len(RANK), 3000)
+		valid, order = rummy_batch.validate_hands(hands[:, :13], ranks)
+		closes, discard, placed = rummy_batch.best_discards(hands, ranks)
+		for i in range(3000):
+			jokers = rank_mask(int(ranks[i])) if ranks[i] >= 0 else 0
+			codes = [int(c) % CARDS_PER_PACK for c in hands[i]]
+			assert (valid[i] == (solve_hand(codes[:13], jokers) is not None))
+			if valid[i]:
+				assert (close_game_codes([codes[k] for k in order[i]], jokers))
+			if closes[i]:
+				assert (close_game_codes([codes[k] for k in placed[i]], jokers) and discard[i] not in placed[i])
+
+	#test 18 - the hand cache answers for hands with renamed suits and keeps to its size
+	cache = HandCache(maxsize=2)
+	codes = [card.code for card in player1.stash]
+	renamed = [(c & ~3) | (3 - (c & 3)) for c in reversed(codes)]
+	assert (cache.solve(codes) is not None and cache.solve(renamed) is not None)
+	split = cache.solve(renamed)
+	assert (sorted(n for s in split for n in s) == list(range(13)))
+	assert (close_game_codes([renamed[n] for s in split for n in s]) == True)
+	assert (cache.solve([card.code for card in player2.stash]) is None)
+	cache.solve(codes[1:] + [51])
+	assert (cache.stats()['hits'] == 2 and cache.stats()['misses'] == 3 and cache.stats()['evictions'] == 1)
+	import tempfile
+	with tempfile.TemporaryDirectory() as tmp:
+		cache.save(os.path.join(tmp, 'hands.json'))
+		warm = HandCache()
+		assert (warm.load(os.path.join(tmp, 'hands.json')) == 2 and warm.solve(codes[1:] + [51]) is None)
+		assert (warm.stats()['hits'] == 1)
+
+	#test 19 - the lazy set enumeration finds every valid set of the stash
+	rng = random.Random(19)
+	for i in range(20):
+		deck = Deck(2, rng)
+		deck.shuffle()
+		deck.set_joker()
+		stash = deck.cards[:14]
+		found = {tuple(sorted(card.code for card in meld)) for meld in iter_melds(stash)}
+		expected = set()
+		for size in (3, 4):
+			for combo in itertools.combinations(stash, size):
+				if validate_set(combo):
+					expected.add(tuple(sorted(card.code for card in combo)))
+		assert (found == expected)
+		assert (all(validate_set(meld) for meld in iter_melds(stash, deck.joker)))
+	melds = iter_melds(player1.stash)
+	assert (is_valid_run(next(melds)))
+
+	#test 20 - the differential screen only sends the lines that changed
+	game = new_game(2, 1, seed=20, names=["Tom", "Narm"])
+	full = Screen(diff=False, headless=True)
+	diff = Screen(headless=True)
+	player = game.players[0]
+	for screen in (full, diff):
+		player.render(screen)
+		player.render(screen)
+	assert (diff.bytes < full.bytes and diff.frames == full.frames == 2)
+	out = io.StringIO()
+	screen = Screen(out)
+	player.render(screen)
+	player.take_card()
+	player.render(screen)
+	assert (out.getvalue().count(chr(27) + "[2K") == 1 and screen.bytes == len(out.getvalue().encode()))
+
+	#test 21 - the stash index follows every change and tells the copies of a card apart
+	rng = random.Random(21)
+	player = Player("Tom", None, None)
+	first, second = Card("4", "Hearts", 0), Card("4", "Hearts", 1)
+	for card in [first, Card("K", "Clubs"), second] + [Card(r, s) for r, s in zip("A29T", SUIT)]:
+		player.deal_card(card)
+	assert (get_object(player.stash, "4H") is first and get_object(player.stash, "4H2") is second)
+	assert (get_object(player.stash, "4H3") is None and get_object(player.stash, "5H") is None)
+	assert (player.move_card("4H2", "4H") and get_object(player.stash, "4H") is second)
+	for i in range(200):
+		labels = [card.label() for card in player.stash]
+		label = rng.choice(labels)
+		copy = rng.randrange(labels.count(label))
+		assert (get_object(player.stash, label + str(copy + 1)) is get_object(list(player.stash), label + str(copy + 1)))
+		player.move_card(label + str(copy + 1), rng.choice(labels + [""]))
+		if i % 50 == 0:
+			player.sort_cards()
+		expected = {}
+		for card in player.stash:
+			expected.setdefault(card.label(), []).append(card)
+		assert (player.stash.labels == expected)
+	deck = Deck(2)
+	player = Player("Tom", deck, None)
+	for pack, code in [(0, card_code("4", "Hearts")), (0, card_code("K", "Clubs")), (1, card_code("4", "Hearts")), (0, card_code("2", "Spades"))]:
+		player.deal_card(deck.copies[pack][code])
+	second = get_object(player.stash, "4H2")
+	assert (second.pack == 1 and player.stash.position(second) == 2)
+	assert (player.move_card("4H2", "") and [c.label() for c in player.stash] == ["4H", "KC", "2S", "4H"])
+	assert (player.stash[-1] is second and get_object(player.stash, "4H") is deck.copies[0][card_code("4", "Hearts")])
+
+	#test 22 - a Script answers the prompts of Player.play and skips the pauses
+	game = new_game(2, 2, seed=22, names=["Tom", "Narm"])
+	game.screen = Screen(headless=True)
+	label = game.deck.cards.peek().label()
+	game.script = Script(["D", "T", "d", label + "\n"])
+	try:
+		game.play()
+	except EOFError:
+		pass
+	assert (game.turns == 1 and game.turn == 1 and game.pile.peek().label() == label)
+	assert (len(game.players[0].stash) == 13 and game.script.answers == 4)
+	assert (game.script.notices == {"ERROR: Cannot drop a card": 1})
+
+	#test 23 - a snapshot restores the Deck, the Joker, the Pile, the stashes and the turn
+	game = new_game(3, 2, seed=23, names=["Tom", "Narm", "Varun"], joker=True)
+	for i in range(10):
+		player = game.players[game.turn]
+		player.take_card()
+		player.drop_card(player.stash[i].label())
+		game.turn = (game.turn + 1) % 3
+	data = snapshot(game)
+	copy = restore(data)
+	assert (snapshot(copy) == data and copy.turn == game.turn and copy.deck.joker.code == game.deck.joker.code)
+	assert ([c.code for c in copy.deck.cards] == [c.code for c in game.deck.cards])
+	assert ([c.code for c in copy.pile] == [c.code for c in game.pile])
+	for a, b in zip(copy.players, game.players):
+		assert (a.name == b.name and [str(c) for c in a.stash] == [str(c) for c in b.stash] and a.distance() == b.distance())
+	with tempfile.TemporaryDirectory() as tmp:
+		store = SnapshotFile(os.path.join(tmp, 'tables.snap'))
+		store.append("t1", b"old")
+		store.append("t2", data)
+		store.append("t1", b"new")
+		store.append("t3", b"gone")
+		store.remove("t3")
+		store.flush()
+		with open(store.path, 'ab') as f:
+			f.write(SNAP_RECORD.pack(100, 0, 2) + b"t4" + b"cut")
+		assert (store.load() == {"t1": b"new", "t2": data})
+		store.append("t5", b"after")
+		store.flush()
+		assert (store.appended == 6 and store.compact() == {"t1": b"new", "t2": data, "t5": b"after"} and store.appended == 0)
+		assert (store.load() == store.compact())
+
+	#test 24 - the tracker counts what every Player has seen, also after the Pile is shuffled back into the Deck
+	game = new_game(2, 1, seed=24, names=["Tom", "Narm"], joker=True)
+	tracker = game.tracker
+	for turn in range(40):
+		player = game.players[game.turn]
+		if turn % 3 != 0 or player.pick_card() is None:
+			player.take_card()
+		player.drop_card(player.stash[turn % 14].label())
+		game.turn = (game.turn + 1) % 2
+		assert (tracker.pile == [sum(1 for c in game.pile if c.code == code) for code in range(CARDS_PER_PACK)])
+		other = game.players[game.turn - 1]
+		for code in range(CARDS_PER_PACK):
+			hidden = sum(1 for c in game.deck.cards if c.code == code) + sum(1 for c in other.stash if c.code == code)
+			assert (tracker.remaining(code, game.players[game.turn]) == hidden - tracker.held[(game.turn + 1) % 2][code])
+	assert (game.deck.cards.peek() is not None and abs(sum(tracker.p_next(code, player) for code in range(CARDS_PER_PACK)) - 1) < 1e-9)
+	player = Player("Tom", None, None)
+	tracker = CardTracker(1)
+	run = [Card('5', 'Hearts'), Card('6', 'Hearts'), Card('7', 'Hearts')]
+	assert (tracker.p_complete(run, player) == 2 / 52)
+	tracker.shown(Card('8', 'Hearts'))
+	assert (tracker.p_complete(run, player) == 1 / 51)
+	assert (tracker.collecting(0, 3) == 0.25)
+
+	#test 25 - the hint finds the drop that closes the game, or one that leaves the best distance
+	deck = Deck(1)
+	player = Player("Tom", deck, None)
+	for rank, suit in ["4H", "5H", "6H", "7H", "9C", "9S", "9D", "JC", "QC", "KC", "2S", "8D", "2D", "2C"]:
+		player.deal_card(deck.faces[card_code(rank, {s[0]: s for s in SUIT}[suit])])
+	card, distance, closes, sets = player.hint()
+	assert (closes and distance == 0 and card.label() == "8D" and sorted(len(s) for s in sets) == [3, 3, 3, 4])
+	assert (all(validate_set(s) for s in sets))
+	for seed in range(20):
+		game = new_game(2, 1 + seed % 3, seed=seed, names=["Tom", "Narm"], joker=seed % 2 == 0)
+		player = game.players[0]
+		assert (player.hint() is None)
+		player.take_card()
+		card, distance, closes, sets = player.hint()
+		assert (distance == player.evaluator.distance_without(card) == min(player.evaluator.distance_without(c) for c in player.stash))
+		assert (closes == (closing_split(player.stash) is not None))
+	# a run held twice is taken twice, the stashes close with more than one pack
+	for labels in ["3H 3H 4H 4H 5H 5H 9C TC JC JC QC KC AC 8D", "AD AD 2D 2D 3D 3D 6H 7H 8H 2H 2D 2D 2D",
+			"6H 7H 8H TS TS JS JS QS QS 7H 7S 7S 7D"]:
+		deck = Deck(5)
+		pool = list(deck.cards)
+		player = Player("Tom", deck, None)
+		for label in labels.split():
+			player.deal_card(pool.pop([c.label() for c in pool].index(label)))
+		if len(player.stash) == 14:
+			card, distance, closes, sets = player.hint()
+			assert (closes and distance == 0 and card.label() == "8D")
+		else:
+			assert (player.distance() == 0 and player.winning_split() is not None)
+	game = new_game(2, 2, seed=25, names=["Tom", "Narm"])
+	game.screen = Screen(headless=True)
+	game.script = Script(["H", "T", "H"])
+	try:
+		game.play()
+	except EOFError:
+		pass
+	assert (game.script.notices["ERROR: Take or pick a card first"] == 1)
+	assert (sum(n for message, n in game.script.notices.items() if message.startswith("Hint: Drop")) == 1)
+
+	#test 26 - the run table is read from its file and never rules out a stash that can close the game
+	with tempfile.TemporaryDirectory() as tmp:
+		path = os.path.join(tmp, 'runs.table')
+		write_run_table(path)
+		table = RunTable.open(path)
+		assert (table.decompositions(0b111) == [(((0, 1, 2),), 0), (((1, 2, 3),), 1), (((0, 1, 2, 3),), 1), (((1, 2, 3, 4),), 2)])
+		assert (table.pure(0b101) == 0 and table.fewest_runs(0b111111, 0b100001) == 2 and table.fewest_runs(0b1011, 0b1000) is None)
+		codes = [card_code(rank, {s[0]: s for s in SUIT}[suit]) for rank, suit in ["4H", "5H", "6H", "7H", "9C", "9S", "9D", "JC", "QC", "KC", "2S", "2D", "2C"]]
+		assert (table.may_close(codes) and not table.may_close(codes[:-1] + [card_code('8', 'Clubs')]))
+		rng = random.Random(26)
+		for i in range(300):
+			codes = rng.sample(range(CARDS_PER_PACK), 13) if i % 2 else [rng.randrange(CARDS_PER_PACK) for n in range(13)]
+			jokers = rank_mask(rng.randrange(len(RANK))) if i % 3 == 0 else 0
+			assert (table.may_close(codes, jokers) or solve_hand(codes, jokers) is None)
+
+	#test 27 - the events of a Game reach the subscribers in order, in batches, and a full buffer drops the oldest
+	import rummy_events
+	bus = rummy_events.EventBus(batch=4)
+	seen = []
+	bus.subscribe(seen.append)
+	game = Game(2, Deck(1, 27), ["Tom", "Narm"])
+	assert (bus.attach(game, "t27") == "t27")
+	game.deal(13)
+	player = game.players[0]
+	player.take_card()
+	player.sort_cards()
+	player.move_index(0, 14)
+	label = player.stash[0].label()
+	player.drop_card(label)
+	player.close_game()
+	bus.flush()
+	with tempfile.TemporaryDirectory() as tmp:
+		sink = rummy_events.JsonlSink(os.path.join(tmp, 'events.jsonl'))
+		bus.subscribe(sink)
+		game.players[1].pick_card()
+		bus.close()
+		with open(sink.path) as f:
+			lines = [json.loads(line) for line in f]
+	events = [event for batch in seen for event in batch]
+	assert (all(len(batch) <= 4 for batch in seen) and [e.seq for e in events] == list(range(1, 8)))
+	assert ([e.kind for e in events] == ['deal', 'take', 'sort', 'move', 'drop', 'close', 'pick'])
+	assert (events[0].game == "t27" and events[0].player is None and events[3].data == {'from': 0, 'to': 13})
+	assert (events[4].card == label and events[5].data == {'closed': False} and events[6].player == 1)
+	assert (len(lines) == 1 and lines[0]['kind'] == 'pick' and lines[0]['seq'] == 7 and bus.stats()['delivered'] == 7)
+	bus = rummy_events.EventBus(size=4, batch=100, interval=60)
+	seen = []
+	bus.subscribe(seen.append)
+	for i in range(10):
+		bus.emit(game, 'sort', 0)
+	assert (bus.stats()['dropped'] == 6)
+	bus.close()
+	assert ([e.seq for batch in seen for e in batch] == [7, 8, 9, 10])
+	import threading
+	bus = rummy_events.EventBus(batch=64)
+	seen = []
+	bus.subscribe(seen.append)
+	threads = [threading.Thread(target=lambda: [bus.emit(game, 'sort', 0) for i in range(2000)]) for n in range(4)]
+	interval = sys.getswitchinterval()
+	sys.setswitchinterval(1e-6)
+	try:
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+	finally:
+		sys.setswitchinterval(interval)
+	bus.close()
+	assert ([e.seq for batch in seen for e in batch] == list(range(1, 8001)) and bus.stats()['dropped'] == 0)
+
+	#test 28 - the batch driver plays every seed once, also when the chunks do not divide the games
+	import rummy_sim
+	results = list(rummy_sim.run_batch(7, ['random', 'random'], seed=28, workers=2, chunk=3, max_turns=10))
+	assert (sorted(result.seed for result in results) == list(range(28, 35)))
+
 	"""
 	#test 3 - testing ace values
 	player3 = Player("Narm", None, None)
@@ -688,36 +3724,38 @@ def unit_tests():
 	player7.stash[0].isjoker=True
 	player7.stash[2].isjoker=True
 	print(print_cards(player7.stash))
-	push_joker_toend(player7.stash)
-	print(print_cards(player7.stash))
+	print(print_cards(push_joker_toend(player7.stash)))
 	"""
 
 def main():
 	""" Main Program """
 
-	# Create Deck with 2 Packs
-	deck = Deck(2)
-	deck.shuffle()
-
-	# Joker Logic is disabled currently.
-	# deck.set_joker()
-
-	# New game with 2 players
-	g = Game(2, deck)
-
-	# Deal Cards
-	for i in range(13):
-		for hand in g.players:
-			card = deck.draw_card()
-			hand.deal_card(card)
-
-	# Create Pile
-	first_card = deck.draw_card()
-	g.add_pile(first_card)
+	# RUMMY_METRICS=<file or tcp://host:port> turns the instrumentation on for this game
+	metrics = os.environ.get('RUMMY_METRICS')
+	if metrics:
+		sys.modules.setdefault('rummy_final', sys.modules[__name__])
+		import rummy_metrics
+		rummy_metrics.enable()
+
+	parser = argparse.ArgumentParser(description="Play Rummy at the terminal")
+	parser.add_argument('--players', type=int, default=2, help="%d to %d" % (MIN_PLAYERS, MAX_PLAYERS))
+	parser.add_argument('--packs', type=int, default=2, help="%d to %d" % (MIN_PACKS, MAX_PACKS))
+	parser.add_argument('--joker', action='store_true', help="pick a Joker rank")
+	args = parser.parse_args()
+
+	# New game with the Players and a Deck with the Packs, the Cards are dealt and the Pile created.
+	# Joker Logic is disabled unless asked for.
+	try:
+		g = new_game(args.players, args.packs, joker=args.joker)
+	except ValueError as err:
+		parser.error(err.args[0])
 
 	# Now let the Players begin
 	g.play()
 
+	if metrics:
+		rummy_metrics.export(metrics, 'prometheus' if metrics.endswith('.prom') else 'json')
+
 if __name__ == "__main__":
     main()
    	# unit_tests()
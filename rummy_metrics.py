@@ -0,0 +1,227 @@
+#!/usr/bin/python3
+
+import argparse
+import bisect
+import builtins
+import functools
+import json
+import socket
+import sys
+import time
+
+import rummy_final
+from rummy_final import Deck, Game, Player
+
+"""
+Hot path instrumentation for Rummy.
+enable() swaps the instrumented functions and methods for timed wrappers and
+disable() puts the originals back, so nothing is added to a call while the
+instrumentation is off.  Call counts and latency histograms are exported as JSON
+or as Prometheus text, to a file or to a TCP socket.
+
+Usage:
+	RUMMY_METRICS=metrics.prom python3 rummy_final.py
+	python3 rummy_metrics.py --games 20 --format prometheus --output metrics.prom
+"""
+
+# upper bounds in seconds of the histogram buckets, the last bucket has no bound
+BOUNDS = [1e-6, 2e-6, 5e-6, 1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 0.1, 1.0, 10.0]
+
+# (owner, attribute, metric name) of every instrumented function
+TARGETS = [
+	(Player, 'play', 'turn'),
+	(Player, 'move_card', 'action.move'),
+	(Player, 'pick_card', 'action.pick'),
+	(Player, 'take_card', 'action.take'),
+	(Player, 'drop_card', 'action.drop'),
+	(Player, 'sort_cards', 'action.sort'),
+	(Player, 'close', 'action.close'),
+	(Player, 'close_game', 'close_game'),
+	(rummy_final, 'is_valid_run', 'validator.is_valid_run'),
+	(rummy_final, 'is_valid_book', 'validator.is_valid_book'),
+	(rummy_final, 'is_valid_run_joker', 'validator.is_valid_run_joker'),
+	(rummy_final, 'solve_hand', 'solve_hand'),
+	(rummy_final, 'sort_sequence', 'sort_sequence'),
+	(rummy_final, 'print_cards', 'render.print_cards'),
+	(Deck, 'draw_card', 'deck.draw'),
+	(Deck, 'shuffle', 'deck.shuffle'),
+	(Deck, 'recycle', 'deck.recycle'),
+	(Game, 'add_pile', 'pile.add'),
+	(Game, 'draw_pile', 'pile.draw'),
+]
+
+class Metric:
+	""" Metric Class - Call count and latency histogram of one function """
+
+	__slots__ = ('count', 'total', 'buckets')
+
+	def __init__(self):
+		""" Class Constructor
+		Args:
+			No args
+		Returns:
+			No return value
+		"""
+		self.count = 0
+		self.total = 0.0
+		self.buckets = [0] * (len(BOUNDS) + 1)
+
+	def observe(self, seconds):
+		""" Count a call
+		Args:
+			seconds: how long the call took
+		Returns:
+			No returns
+		"""
+		self.count += 1
+		self.total += seconds
+		self.buckets[bisect.bisect_left(BOUNDS, seconds)] += 1
+
+_METRICS = {}
+_PATCHED = []	# (owner, attribute, original) of every patch in place
+_MISSING = object()	# original of an attribute the owner did not have
+
+def timed(name, func):
+	""" Wrap a function so that every call is counted in a Metric
+	Args:
+		name: metric name
+		func: function to wrap
+	Returns:
+		the wrapping function
+	"""
+	metric = _METRICS.setdefault(name, Metric())
+	clock = time.perf_counter
+
+	@functools.wraps(func)
+	def wrapper(*args, **kwargs):
+		start = clock()
+		try:
+			return func(*args, **kwargs)
+		finally:
+			metric.observe(clock() - start)
+	return wrapper
+
+def _patch(owner, attr, value):
+	""" Set an attribute and remember what to put back """
+	_PATCHED.append((owner, attr, owner.__dict__.get(attr, _MISSING)))
+	setattr(owner, attr, value)
+
+def enable():
+	""" Switch the instrumentation on
+	Functions that other modules imported from rummy_final are swapped there as well.
+	Args:
+		No args
+	Returns:
+		No returns
+	"""
+	if _PATCHED:
+		return
+	for owner, attr, name in TARGETS:
+		original = getattr(owner, attr)
+		wrapper = timed(name, original)
+		if isinstance(owner, type):
+			_patch(owner, attr, wrapper)
+			continue
+		for module in list(sys.modules.values()):
+			if getattr(module, attr, None) is original:
+				_patch(module, attr, wrapper)
+
+	# time spent waiting on the Player, Player.play looks up input in the module first
+	_patch(rummy_final, 'input', timed('input_wait', builtins.input))
+
+def disable():
+	""" Switch the instrumentation off and put the original functions back
+	Args:
+		No args
+	Returns:
+		No returns
+	"""
+	while _PATCHED:
+		owner, attr, original = _PATCHED.pop()
+		if original is _MISSING:
+			delattr(owner, attr)
+		else:
+			setattr(owner, attr, original)
+
+def enabled():
+	""" True while the instrumentation is on """
+	return bool(_PATCHED)
+
+def reset():
+	""" Forget every count collected so far """
+	for metric in _METRICS.values():
+		metric.__init__()
+
+def snapshot():
+	""" Current counts of every metric
+	Args:
+		No args
+	Returns:
+		dict of metric name to dict with count, sum (seconds) and buckets (per bucket, not cumulative)
+	"""
+	return {name: {'count': m.count, 'sum': m.total, 'buckets': list(m.buckets)}
+		for name, m in sorted(_METRICS.items()) if m.count}
+
+def to_json(snap):
+	""" JSON text of a snapshot """
+	return json.dumps({'time': time.time(), 'bounds': BOUNDS, 'metrics': snap}, sort_keys=True)
+
+def to_prometheus(snap):
+	""" Prometheus text exposition of a snapshot
+	Args:
+		snap: dict made by snapshot
+	Returns:
+		string with one rummy_call_seconds histogram, one series per metric
+	"""
+	lines = ["# HELP rummy_call_seconds Latency of the instrumented Rummy calls.",
+		"# TYPE rummy_call_seconds histogram"]
+	for name, m in snap.items():
+		total = 0
+		for bound, n in zip(BOUNDS + ['+Inf'], m['buckets']):
+			total += n
+			lines.append('rummy_call_seconds_bucket{name="%s",le="%s"} %d' % (name, bound, total))
+		lines.append('rummy_call_seconds_sum{name="%s"} %.9f' % (name, m['sum']))
+		lines.append('rummy_call_seconds_count{name="%s"} %d' % (name, m['count']))
+	return "\n".join(lines) + "\n"
+
+def export(target, fmt='json'):
+	""" Write a snapshot to a file or a TCP socket
+	Args:
+		target: file path, or tcp://host:port
+		fmt: 'json' or 'prometheus'
+	Returns:
+		No returns
+	"""
+	snap = snapshot()
+	text = to_prometheus(snap) if fmt == 'prometheus' else to_json(snap) + "\n"
+	if target.startswith('tcp://'):
+		host, port = target[len('tcp://'):].rsplit(':', 1)
+		with socket.create_connection((host, int(port))) as conn:
+			conn.sendall(text.encode())
+	else:
+		with open(target, 'w') as f:
+			f.write(text)
+
+def main():
+	""" Main Program """
+	parser = argparse.ArgumentParser(description="Play headless games with the instrumentation on and export the counts")
+	parser.add_argument('--games', type=int, default=10)
+	parser.add_argument('--packs', type=int, default=2)
+	parser.add_argument('--format', choices=['json', 'prometheus'], default='json')
+	parser.add_argument('--output', default='-', help="file path, tcp://host:port or - for stdout")
+	args = parser.parse_args()
+
+	import rummy_sim
+	enable()
+	for seed in range(args.games):
+		rummy_sim.play_game(seed, ['greedy', 'greedy'], packs=args.packs, max_turns=300)
+	disable()
+
+	if args.output == '-':
+		snap = snapshot()
+		print(to_prometheus(snap) if args.format == 'prometheus' else to_json(snap))
+	else:
+		export(args.output, args.format)
+
+if __name__ == "__main__":
+	main()
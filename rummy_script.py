@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import random
+import sys
+import time
+import traceback
+
+from rummy_final import Screen, Script, new_game
+from rummy_sim import GreedyPolicy
+
+"""
+Scripted Rummy.
+Drives the real Player.play code path from lines read in bulk instead of the
+terminal, without the screen clears and the "Enter to continue" pauses, and ends
+with a JSON summary.  The lines are the answers the Players would type, one per
+line, see rummy_final.Script.  The soak mode generates them: the turns of
+GreedyPolicy players with a share of invalid answers mixed in, for as many games
+as asked.  The exit
+code is 1 when a game crashed.
+
+Usage:
+	python3 rummy_script.py --script moves.txt --seed 7
+	python3 rummy_script.py --script tom.txt narm.txt --seed 7
+	generate_moves | python3 rummy_script.py --script -
+	python3 rummy_script.py --soak 1000 --packs 2 --players 4
+"""
+
+def stash_label(player, card):
+	""" Label of a card of the stash, with the copy digit when an earlier card has the same label """
+	label = card.label()
+	copies = player.stash.labels[label]
+	if copies[0] is card:
+		return label
+	return label + str(copies.index(card) + 1)
+
+def soak_lines(game, rng, mistakes=0.1, close=True, turns=None):
+	""" Generate the answers of every Player of a Game
+	Args:
+		game: the Game, looked at before every answer
+		rng: random.Random instance
+		mistakes: share of the answers that are errors, moves, sorts or rules
+		close: False to never close the game, so the Deck is refilled from the Pile again and again
+		turns: stop after this many turns, the Game then ends like a script that ran out
+	Returns:
+		generator of lines
+	"""
+	policy = GreedyPolicy(rng)
+	while turns is None or game.turns < turns:
+		player = game.players[game.turn]
+		stash = player.stash
+		if rng.random() < mistakes:
+			what = rng.choice(['M', 'M', 'S', 'R', 'D', 'C', 'P', 'X'])
+			if what in ('P', 'C') and len(stash) < 14:
+				# picking from the pile is no mistake with 13 cards
+				what = 'D'
+			yield what
+			if what == 'M':
+				if rng.random() < 0.2:
+					# not in the stash, Player.play does not ask where to
+					yield "ZZ"
+				else:
+					yield stash_label(player, rng.choice(stash))
+					yield rng.choice([stash_label(player, rng.choice(stash)), "", "QQ"])
+			elif what == 'C':
+				yield stash_label(player, rng.choice(stash))
+			continue
+
+		if len(stash) < 14:
+			yield policy.choose_source(player, game)
+			continue
+
+		card = policy.choose_close(player, game) if close else None
+		if card is not None:
+			yield 'C'
+			yield stash_label(player, card)
+		else:
+			yield 'D'
+			# a random drop now and then, so the greedy Players do not pass the same cards back and forth
+			card = rng.choice(stash) if rng.random() < 0.25 else policy.choose_drop(player, game)
+			yield stash_label(player, card)
+
+def run_script(game, script):
+	""" Play a Game until it is closed, the script ends or the game crashes
+	Args:
+		game: Game object
+		script: Script object with the answers of the Players
+	Returns:
+		summary - dict
+	"""
+	game.script = script
+	game.screen = Screen(headless=True)
+	summary = {'end': 'closed'}
+	start = time.perf_counter()
+	try:
+		game.play()
+		summary['winner'] = game.turn
+	except EOFError:
+		summary['end'] = 'script'
+	except Exception:
+		summary['end'] = 'crash'
+		summary['error'] = traceback.format_exc()
+	elapsed = time.perf_counter() - start
+	summary.update({
+		'turns': game.turns,
+		'answers': script.answers,
+		'seconds': elapsed,
+		'deck_left': len(game.deck.cards),
+		'pile': len(game.pile),
+		'notices': dict(script.notices),
+	})
+	return summary
+
+def soak(games, packs=2, players=2, seed=0, mistakes=0.1, close=True, turns=1000):
+	""" Play many games from generated answers
+	Args:
+		games: number of games
+		packs: number of packs in the Deck
+		players: number of Players
+		seed: seed of the first game, game i is dealt with seed + i
+		mistakes, close, turns: see soak_lines
+	Returns:
+		summary of all the games - dict, with the summaries of the games that crashed
+	"""
+	total = {'games': games, 'closed': 0, 'crashes': [], 'turns': 0, 'answers': 0, 'notices': {}}
+	slowest = 0.0
+	start = time.perf_counter()
+	for i in range(games):
+		game = new_game(players, packs, seed + i, ['Player' + str(n) for n in range(players)])
+		lines = soak_lines(game, random.Random(seed + i), mistakes, close, turns)
+		summary = run_script(game, Script(lines))
+		if summary['end'] == 'closed':
+			total['closed'] += 1
+		elif summary['end'] == 'crash':
+			total['crashes'].append(dict(summary, seed=seed + i))
+		total['turns'] += summary['turns']
+		total['answers'] += summary['answers']
+		for message, count in summary['notices'].items():
+			total['notices'][message] = total['notices'].get(message, 0) + count
+		if summary['turns']:
+			slowest = max(slowest, summary['seconds'] / summary['turns'])
+	elapsed = time.perf_counter() - start
+	total['seconds'] = elapsed
+	total['turns_per_second'] = total['turns'] / elapsed if elapsed else None
+	total['slowest_game_us_per_turn'] = slowest * 1e6
+	return total
+
+def main():
+	""" Main Program """
+	parser = argparse.ArgumentParser(description="Play Rummy from scripted answers instead of the terminal")
+	parser.add_argument('--script', nargs='+', metavar='FILE', help="answers shared by the Players, or one file per Player, - for stdin")
+	parser.add_argument('--soak', type=int, metavar='GAMES', help="play this many games from generated answers")
+	parser.add_argument('--packs', type=int, default=2)
+	parser.add_argument('--players', type=int, default=2)
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--mistakes', type=float, default=0.1, help="share of invalid or idle answers in the soak mode")
+	parser.add_argument('--no-close', action='store_true', help="never close the soak games")
+	parser.add_argument('--turns', type=int, default=1000, help="stop every soak game after this many turns")
+	args = parser.parse_args()
+
+	if args.soak:
+		summary = soak(args.soak, args.packs, args.players, args.seed, args.mistakes, not args.no_close, args.turns)
+		crashed = bool(summary['crashes'])
+	elif args.script:
+		files = [sys.stdin if name == '-' else open(name) for name in args.script]
+		game = new_game(args.players, args.packs, args.seed, ['Player' + str(n) for n in range(args.players)])
+		summary = run_script(game, Script(*files))
+		crashed = summary['end'] == 'crash'
+	else:
+		parser.error("give --script or --soak")
+
+	print(json.dumps(summary))
+	if crashed:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
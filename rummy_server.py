@@ -0,0 +1,499 @@
+#!/usr/bin/python3
+
+import argparse
+import asyncio
+import gc
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from rummy_final import SnapshotFile, get_object, new_game, restore, snapshot
+
+"""
+Multi-table Rummy server.
+Hosts many Games in one asyncio event loop over local TCP.  Every connection
+speaks a line protocol that mirrors the actions of Player.play:
+
+	JOIN <table> <name>	sit at a table, the game starts once every seat is taken
+	M <card> [<card>]	move a card in front of another card, or to the end
+	P			pick from the pile
+	T			take from the deck
+	D <card>		drop a card and end the turn
+	S			sort the cards
+	C <card>		drop a card and close the game
+	R			rules
+	QUIT			leave the table
+
+Cards are written as in Player.play, for example 4H for 4 of Hearts.  Every
+command is answered with one "OK <stash>" or "ERR <message>" line.  The server
+also sends START <seat> <players> <joker>, TURN <seat> <pile top>,
+WIN <seat> <stash>, LEFT <seat> and END lines to every seat of a table.
+
+With --snapshots the tables that changed are saved to an append only file every
+--interval seconds, and the file is compacted once it is mostly old records.  A
+server started again on the same file restores them.  A Player that quits or is
+disconnected in the middle of a game gets its seat back by joining the table under
+the same name, the snapshot of a table is only removed once its game is won.
+
+Usage:
+	python3 rummy_server.py serve --port 7777
+	python3 rummy_server.py serve --port 7777 --snapshots tables.snap
+	python3 rummy_server.py load --tables 500 --turns 40 --spawn
+"""
+
+RULES = ("4 sets from 13 cards (3 sets of 3, 1 set of 4), one run without a Joker; "
+	"take (T) or pick (P) a card, then drop (D) one or close (C) the game")
+
+# a seat whose client does not read is dropped once this much output is queued for it
+MAX_QUEUED = 1 << 20
+
+# the snapshot file is rewritten once it holds this many records more than there are tables
+COMPACT_RECORDS = 4096
+
+def apply_action(game, seat, action, args):
+	""" Play one action of the line protocol for a Player, like Player.play does
+	Args:
+		game: the Game being played
+		seat: index of the Player in the Game
+		action: one of M, P, T, D, S, C - upper case string
+		args: card arguments of the action - list of strings
+	Returns:
+		(reply line, event), event is 'turn' when the turn is over,
+		'win' when the game is closed, otherwise None
+	"""
+	player = game.players[seat]
+	if seat != game.turn:
+		return "ERR It is not your turn", None
+
+	if action == 'M':
+		if not args or get_object(player.stash, args[0]) is None:
+			return "ERR That card is not in your stash", None
+		if not player.move_card(args[0], args[1] if len(args) > 1 else ""):
+			return "ERR This is an invalid location", None
+	elif action == 'P':
+		if len(player.stash) >= 14:
+			return "ERR Cannot pick anymore", None
+		if player.pick_card() is None:
+			return "ERR The pile is empty", None
+	elif action == 'T':
+		if len(player.stash) >= 14:
+			return "ERR Cannot take anymore", None
+		if player.take_card() is None:
+			return "ERR The deck is empty", None
+	elif action == 'D':
+		if len(player.stash) != 14:
+			return "ERR Cannot drop a card", None
+		if not args or not player.drop_card(args[0]):
+			return "ERR Not a valid card", None
+		game.turn = (game.turn + 1) % len(game.players)
+		return stash_line(player), 'turn'
+	elif action == 'S':
+		player.sort_cards()
+	elif action == 'C':
+		if len(player.stash) != 14:
+			return "ERR You do not have enough cards to close the game", None
+		closed = player.close(args[0]) if args else None
+		if closed is None:
+			return "ERR Not a valid card", None
+		if not closed:
+			return "ERR The game is not over", None
+		return stash_line(player), 'win'
+	else:
+		return "ERR Unknown action", None
+	return stash_line(player), None
+
+def stash_line(player):
+	""" OK reply with the stash of a Player """
+	return "OK " + " ".join(card.label() for card in player.stash)
+
+def top_label(game):
+	""" Label of the top card of the Pile, - when the Pile is empty """
+	top = game.pile.peek()
+	return top.label() if top is not None else "-"
+
+class Table:
+	""" Table Class - One Game and the connections seated at it """
+
+	def __init__(self, name, seats, packs):
+		""" Class Constructor
+		Args:
+			name: name of the table - string
+			seats: number of Players
+			packs: number of packs in the Deck
+		Returns:
+			No return value
+		"""
+		self.name = name
+		self.seats = seats
+		self.packs = packs
+		self.writers = []
+		self.names = []
+		self.game = None
+		self.dirty = False	# the Game changed since its last snapshot
+
+	def broadcast(self, line):
+		""" Send a line to every seat, dropping seats that stopped reading
+		Args:
+			line: line without the newline
+		Returns:
+			No returns
+		"""
+		data = (line + "\n").encode()
+		for writer in self.writers:
+			if writer is None or writer.is_closing():
+				continue
+			if writer.transport.get_write_buffer_size() > MAX_QUEUED:
+				writer.close()
+				continue
+			writer.write(data)
+
+	def start(self):
+		""" Deal a new Game once every seat is taken
+		Args:
+			No args
+		Returns:
+			No returns
+		"""
+		self.game = new_game(self.seats, self.packs, names=self.names)
+		self.dirty = True
+		for seat, writer in enumerate(self.writers):
+			writer.write(self.start_line(seat))
+		self.broadcast("TURN %d %s" % (self.game.turn, top_label(self.game)))
+
+	def start_line(self, seat):
+		""" START line of a seat """
+		joker = self.game.deck.joker
+		return ("START %d %d %s\n" % (seat, self.seats, joker.label() if joker else "-")).encode()
+
+	def resume(self, seat):
+		""" Tell a Player that took its seat back at a restored table where the game is
+		Args:
+			seat: index of the Player
+		Returns:
+			No returns
+		"""
+		writer = self.writers[seat]
+		writer.write(self.start_line(seat))
+		writer.write(("TURN %d %s\n" % (self.game.turn, top_label(self.game))).encode())
+
+class RummyServer:
+	""" RummyServer Class - Hosts the tables of one event loop """
+
+	def __init__(self, seats=2, packs=2, snapshots=None):
+		""" Class Constructor
+		Args:
+			seats: number of Players at each table
+			packs: number of packs in the Deck of each table
+			snapshots: path of the snapshot file, the tables in it are restored
+		Returns:
+			No return value
+		"""
+		self.seats = seats
+		self.packs = packs
+		self.tables = {}
+		self.store = None
+		if snapshots:
+			self.store = SnapshotFile(snapshots)
+			self.recover()
+
+	def recover(self):
+		""" Restore the tables of the snapshot file, their seats wait for the Players to join again
+		Args:
+			No args
+		Returns:
+			number of tables restored
+		"""
+		rng = random.Random()
+		# thousands of Games are built at once, the collector would walk them again and again
+		gc.disable()
+		try:
+			for name, data in self.store.compact().items():
+				game = restore(data, rng)
+				table = Table(name, len(game.players), game.deck.packs)
+				table.game = game
+				table.names = [player.name for player in game.players]
+				table.writers = [None] * table.seats
+				self.tables[name] = table
+		finally:
+			gc.enable()
+		return len(self.tables)
+
+	def save(self, sync=False):
+		""" Append the snapshots of the tables that changed to the snapshot file
+		The file is compacted when the records appended since its last compaction
+		outnumber the tables by COMPACT_RECORDS.
+		Args:
+			sync: True to wait until they are on the disk
+		Returns:
+			number of snapshots written
+		"""
+		if self.store is None:
+			return 0
+		saved = 0
+		for table in self.tables.values():
+			if table.dirty and table.game is not None:
+				self.store.append(table.name, snapshot(table.game))
+				table.dirty = False
+				saved += 1
+		if self.store.appended > len(self.tables) + COMPACT_RECORDS:
+			self.store.compact()
+		self.store.flush(sync)
+		return saved
+
+	async def handle(self, reader, writer):
+		""" Serve one connection until it quits or disconnects
+		Args:
+			reader, writer: asyncio streams of the connection
+		Returns:
+			No returns
+		"""
+		table = None
+		seat = None
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				words = line.decode(errors='replace').split()
+				if not words:
+					continue
+				action = words[0].upper()
+				args = [w.upper() for w in words[1:]]
+
+				if action == 'QUIT':
+					break
+				if action == 'R':
+					reply = "OK " + RULES
+				elif action == 'JOIN':
+					if table is not None or len(words) < 3:
+						reply = "ERR Cannot join"
+					else:
+						table, seat = self.join(words[1], words[2], writer)
+						reply = "OK seat %d" % seat if table is not None else "ERR The table is full"
+						if table is not None and table.game is not None:
+							# a seat taken back at a restored table
+							writer.write((reply + "\n").encode())
+							table.resume(seat)
+							await writer.drain()
+							continue
+				elif table is None or table.game is None:
+					reply = "ERR The game has not started"
+				else:
+					reply, event = apply_action(table.game, seat, action, args)
+					table.dirty = True
+					writer.write((reply + "\n").encode())
+					if event == 'turn':
+						table.broadcast("TURN %d %s" % (table.game.turn, top_label(table.game)))
+					elif event == 'win':
+						table.broadcast("WIN %d %s" % (seat, reply[3:]))
+						self.end(table)
+						table = None
+					await writer.drain()
+					continue
+
+				writer.write((reply + "\n").encode())
+				if table is not None and table.game is None and len(table.names) == table.seats:
+					table.start()
+				await writer.drain()
+		except (ConnectionError, asyncio.IncompleteReadError):
+			pass
+		finally:
+			if table is not None:
+				table.writers[seat] = None
+				if table.game is None:
+					# nobody can take the seat back before the game starts
+					self.end(table)
+				else:
+					table.broadcast("LEFT %d" % seat)
+			writer.close()
+
+	def join(self, name, player, writer):
+		""" Take a seat at a table, the table is created by the first Player
+		Args:
+			name: name of the table
+			player: name of the Player
+			writer: asyncio stream of the connection
+		Returns:
+			(Table, seat), (None, None) if the table is full
+		"""
+		table = self.tables.get(name)
+		if table is None:
+			table = self.tables[name] = Table(name, self.seats, self.packs)
+		if table.game is not None and player in table.names:
+			seat = table.names.index(player)
+			if table.writers[seat] is None:
+				table.writers[seat] = writer
+				return table, seat
+		if table.game is not None or len(table.names) == table.seats:
+			return None, None
+		table.names.append(player)
+		table.writers.append(writer)
+		return table, len(table.names) - 1
+
+	def end(self, table):
+		""" Close a table when its game is over, or when a Player left before it started
+		Args:
+			table: Table object
+		Returns:
+			No returns
+		"""
+		if self.tables.get(table.name) is table:
+			del self.tables[table.name]
+			table.broadcast("END")
+			if self.store is not None:
+				self.store.remove(table.name)
+
+async def serve(host, port, seats=2, packs=2, ready=None, snapshots=None, interval=1.0):
+	""" Run the server until it is cancelled
+	Args:
+		host, port: address to listen on
+		seats: number of Players at each table
+		packs: number of packs in the Deck of each table
+		ready: multiprocessing.Event set once the server listens
+		snapshots: path of the snapshot file, see RummyServer
+		interval: seconds between two snapshots of the tables that changed
+	Returns:
+		No returns
+	"""
+	rummy = RummyServer(seats, packs, snapshots)
+	server = await asyncio.start_server(rummy.handle, host, port, limit=1 << 16)
+	if ready is not None:
+		ready.set()
+
+	async def save_loop():
+		while True:
+			await asyncio.sleep(interval)
+			rummy.save()
+
+	saver = asyncio.create_task(save_loop()) if snapshots else None
+	try:
+		async with server:
+			await server.serve_forever()
+	finally:
+		if saver is not None:
+			saver.cancel()
+			rummy.save(sync=True)
+
+def serve_process(host, port, seats, packs, ready):
+	""" Entry point of a server child process """
+	asyncio.run(serve(host, port, seats, packs, ready))
+
+async def bot_client(host, port, table, turns, latencies, rng):
+	""" A load generating client: take a card and drop one at random every turn
+	Args:
+		host, port: address of the server
+		table: name of the table to join
+		turns: number of turns to play before leaving
+		latencies: list the seconds of every action are added to
+		rng: random.Random instance
+	Returns:
+		No returns
+	"""
+	reader, writer = await asyncio.open_connection(host, port)
+
+	async def send(line):
+		start = time.perf_counter()
+		writer.write((line + "\n").encode())
+		while True:
+			reply = (await reader.readline()).decode()
+			if not reply or reply.startswith(("OK", "ERR")):
+				latencies.append(time.perf_counter() - start)
+				return reply.split()
+			if reply.startswith(("WIN", "END")):
+				return None
+
+	await send("JOIN %s %s" % (table, "bot"))
+	seat = None
+	played = 0
+	while played < turns:
+		line = (await reader.readline()).decode().split()
+		if not line or line[0] in ("WIN", "END", "LEFT"):
+			break
+		if line[0] == "START":
+			seat = int(line[1])
+		elif line[0] == "TURN" and int(line[1]) == seat:
+			reply = await send("T")
+			if not reply or reply[0] != "OK":
+				break
+			reply = await send("D " + rng.choice(reply[1:]))
+			if not reply:
+				break
+			played += 1
+	writer.write(b"QUIT\n")
+	writer.close()
+
+async def load(host, port, tables, seats, turns, seed):
+	""" Play many tables at once against a server
+	Args:
+		host, port: address of the server
+		tables: number of tables
+		seats: number of Players at each table
+		turns: number of turns each Player plays
+		seed: seed for the clients
+	Returns:
+		dict with the action count, actions per second and latency percentiles in milliseconds
+	"""
+	latencies = []
+	rng = random.Random(seed)
+	start = time.perf_counter()
+	await asyncio.gather(*[bot_client(host, port, "t%d" % t, turns, latencies, random.Random(rng.random()))
+		for t in range(tables) for s in range(seats)])
+	elapsed = time.perf_counter() - start
+	latencies.sort()
+
+	def percentile(p):
+		return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 3) if latencies else None
+
+	return {
+		'tables': tables,
+		'actions': len(latencies),
+		'actions_per_second': len(latencies) / elapsed,
+		'p50_ms': percentile(0.50),
+		'p99_ms': percentile(0.99),
+		'max_ms': percentile(1.0),
+	}
+
+def main():
+	""" Main Program """
+	parser = argparse.ArgumentParser(description="Host Rummy tables over TCP, or generate load against a server")
+	parser.add_argument('mode', choices=['serve', 'load'])
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=7777)
+	parser.add_argument('--seats', type=int, default=2)
+	parser.add_argument('--packs', type=int, default=2)
+	parser.add_argument('--tables', type=int, default=100)
+	parser.add_argument('--turns', type=int, default=20, help="turns each load client plays")
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--spawn', action='store_true', help="start a server process for the load run")
+	parser.add_argument('--snapshots', metavar='FILE', help="save the tables to this file and restore them on start")
+	parser.add_argument('--interval', type=float, default=1.0, help="seconds between two snapshots")
+	args = parser.parse_args()
+
+	if args.mode == 'serve':
+		try:
+			asyncio.run(serve(args.host, args.port, args.seats, args.packs, snapshots=args.snapshots, interval=args.interval))
+		except KeyboardInterrupt:
+			pass
+		return
+
+	server = None
+	if args.spawn:
+		ready = multiprocessing.Event()
+		server = multiprocessing.Process(target=serve_process, args=(args.host, args.port, args.seats, args.packs, ready), daemon=True)
+		server.start()
+		ready.wait()
+	try:
+		summary = asyncio.run(load(args.host, args.port, args.tables, args.seats, args.turns, args.seed))
+	finally:
+		if server is not None:
+			server.terminate()
+	# the server runs on one event loop, so every table it hosts shares one core
+	summary['server_cores'] = 1
+	summary['client_cores'] = os.cpu_count()
+	print(json.dumps(summary), file=sys.stderr)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,356 @@
+#!/usr/bin/python3
+
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+from rummy_final import Deck, Game, PARTNER_MASKS, cached_solve, joker_mask, load_run_table
+
+"""
+Headless Rummy simulator.
+Plays complete games between Policy objects without any terminal input or output,
+and spreads batches of seeded games over a pool of worker processes.
+
+Usage:
+	python3 rummy_sim.py --games 10000 --policies greedy random --workers 4
+	python3 rummy_sim.py --endurance 20000 --packs 6 --players 6
+	python3 rummy_sim.py --games 10000 --run-table runs.table
+"""
+
+# Result of one simulated game.  winner is the index of the winning Player, None for a draw.
+GameResult = collections.namedtuple('GameResult', ['seed', 'winner', 'turns', 'deck_left'])
+
+class Policy:
+	""" Policy Class - Decides the moves of a non interactive Player """
+
+	def __init__(self, rng):
+		""" Class Constructor
+		Args:
+			rng: random.Random instance the Policy draws its random choices from
+		Returns:
+			No return value
+		"""
+		self.rng = rng
+
+	def choose_source(self, player, game):
+		""" Choose where to get the next card from
+		Args:
+			player: the Player whose turn it is, holding 13 cards
+			game: the Game being played
+		Returns:
+			'P' to pick from the Pile, 'T' to take from the Deck
+		"""
+		return 'T'
+
+	def choose_close(self, player, game):
+		""" Choose the card to drop to close the game
+		Args:
+			player: the Player whose turn it is, holding 14 cards
+			game: the Game being played
+		Returns:
+			the Card object to drop, or None to keep playing
+		"""
+		return closing_drop(player)
+
+	def choose_drop(self, player, game):
+		""" Choose the card to drop at the end of the turn
+		Args:
+			player: the Player whose turn it is, holding 14 cards
+			game: the Game being played
+		Returns:
+			a Card object from the stash
+		"""
+		return self.rng.choice(player.stash)
+
+class RandomPolicy(Policy):
+	""" RandomPolicy Class - Picks the card source and the card to drop at random """
+
+	def choose_source(self, player, game):
+		return self.rng.choice('PT')
+
+class GreedyPolicy(Policy):
+	""" GreedyPolicy Class - Keeps the cards that can share a set with other cards """
+
+	def choose_source(self, player, game):
+		# Only pick the top of the Pile if it goes with a card in the stash
+		top = game.pile.peek()
+		if top is not None and partners(top, player.stash) > 0:
+			return 'P'
+		return 'T'
+
+	def choose_drop(self, player, game):
+		# Drop the card with the fewest partners, Jokers are never dropped
+		best = None
+		for card in player.stash:
+			if card.isjoker:
+				continue
+			score = partners(card, player.stash)
+			if best is None or score < best_score:
+				best = card
+				best_score = score
+		return best if best is not None else player.stash[-1]
+
+class TrackingPolicy(GreedyPolicy):
+	""" TrackingPolicy Class - Greedy, and breaks the ties with what the Game's CardTracker has seen """
+
+	def choose_drop(self, player, game):
+		# Among the cards with the fewest partners drop the one the next Player is least
+		# likely to collect, then the one with the fewest partners left unseen
+		tracker = game.tracker
+		following = (game.turn + 1) % len(game.players)
+		best = None
+		for card in player.stash:
+			if card.isjoker:
+				continue
+			score = partners(card, player.stash)
+			if best is not None and score > best_score[0]:
+				continue
+			score = (score, tracker.collecting(following, card.code >> 2), live_partners(card, player, tracker))
+			if best is None or score < best_score:
+				best = card
+				best_score = score
+		return best if best is not None else player.stash[-1]
+
+class EndurancePolicy(RandomPolicy):
+	""" EndurancePolicy Class - Plays at random and never closes the game """
+
+	def choose_close(self, player, game):
+		return None
+
+POLICIES = {'random': RandomPolicy, 'greedy': GreedyPolicy, 'tracking': TrackingPolicy}
+
+def partners(card, arr):
+	""" Count the cards that can share a set with a card
+	Args:
+		card: Card object
+		arr: array of Card objects
+	Returns:
+		number of other cards of arr of the same rank or of the same suit up to 3 ranks away
+	"""
+	mask = PARTNER_MASKS[card.code] | (1 << card.code)
+	return sum(1 for c in arr if c is not card and (mask >> c.code) & 1)
+
+def live_partners(card, player, tracker):
+	""" Count the copies of the partners of a card that a Player has not seen
+	Args:
+		card: Card object
+		player: the Player looking
+		tracker: CardTracker of the Game
+	Returns:
+		number of cards that can still come from the Deck or from the other stashes
+	"""
+	mask = PARTNER_MASKS[card.code]
+	count = 0
+	while mask:
+		low = mask & -mask
+		count += tracker.remaining(low.bit_length() - 1, player)
+		mask ^= low
+	return count
+
+def closing_drop(player):
+	""" Find a card that can be dropped so that the rest of the stash closes the game
+	Args:
+		player: Player holding 14 cards
+	Returns:
+		the Card object to drop, or None
+	"""
+	codes = [card.code for card in player.stash]
+	jokers = joker_mask(player.stash)
+	tried = set()
+	for i, card in enumerate(player.stash):
+		if codes[i] in tried:
+			continue
+		tried.add(codes[i])
+		if cached_solve(codes[:i] + codes[i+1:], jokers) is not None:
+			return card
+	return None
+
+def play_game(seed, policies, packs=2, hand_size=13, max_turns=2000):
+	""" Play one complete game without any terminal input or output
+	Args:
+		seed: seed for the shuffle and for the Policies - int value
+		policies: Policy classes (or names from POLICIES, or Policy objects), one per Player
+		packs: number of packs in the Deck
+		hand_size: number of cards dealt to each Player
+		max_turns: the game is a draw after this many turns
+	Returns:
+		GameResult
+	"""
+	rng = random.Random(seed)
+	deck = Deck(packs, rng)
+	deck.shuffle()
+
+	names = []
+	players = []
+	for i, policy in enumerate(policies):
+		if isinstance(policy, str):
+			policy = POLICIES[policy]
+		if isinstance(policy, Policy):
+			players.append(policy)
+			names.append(type(policy).__name__ + str(i))
+		else:
+			players.append(policy(random.Random(rng.random())))
+			names.append(policy.__name__ + str(i))
+
+	game = Game(len(players), deck, names, rng)
+	game.deal(hand_size)
+
+	turns = 0
+	while turns < max_turns:
+		turns += 1
+		closed = play_turn(game, players[game.turn])
+		if closed is None:
+			break
+		if closed:
+			return GameResult(seed, game.turn, turns, len(deck.cards))
+		game.turn = (game.turn + 1) % len(game.players)
+
+	return GameResult(seed, None, turns, len(deck.cards))
+
+def play_turn(game, policy):
+	""" Play the turn of the Player whose turn it is
+	Args:
+		game: the Game being played
+		policy: Policy object of the Player
+	Returns:
+		True if the Player closed the game, False if a card was dropped,
+		None if the Deck and the Pile are both used up
+	"""
+	player = game.players[game.turn]
+	if policy.choose_source(player, game) != 'P' or player.pick_card() is None:
+		if player.take_card() is None:
+			return None
+
+	card = policy.choose_close(player, game)
+	if card is not None and player.close(card.label()):
+		return True
+
+	player.drop_card(policy.choose_drop(player, game).label())
+	return False
+
+def endurance(turns, packs=6, players=6, seed=0, window=1000):
+	""" Time a game that goes on for many turns, to check that a turn does not get slower
+	The Players never close the game, so the Deck is used up and refilled from the Pile many times.
+	Args:
+		turns: number of turns to play
+		packs: number of packs in the Deck
+		players: number of Players
+		seed: seed for the shuffle and for the Policies
+		window: number of turns timed together
+	Returns:
+		list of mean microseconds per turn, one entry per window of turns
+	"""
+	rng = random.Random(seed)
+	deck = Deck(packs, rng)
+	deck.shuffle()
+	game = Game(players, deck, ['Player' + str(i) for i in range(players)], rng)
+	game.deal(13)
+	policies = [EndurancePolicy(random.Random(rng.random())) for i in range(players)]
+
+	timings = []
+	start = time.perf_counter()
+	for turn in range(1, turns + 1):
+		if play_turn(game, policies[game.turn]) is None:
+			break
+		game.turn = (game.turn + 1) % len(game.players)
+		if turn % window == 0:
+			now = time.perf_counter()
+			timings.append((now - start) * 1e6 / window)
+			start = now
+	return timings
+
+def play_games(seeds, policies, options):
+	""" Play a chunk of games in a worker process
+	Args:
+		seeds: list of seeds, one game per seed
+		policies: Policy classes or names, one per Player
+		options: keyword arguments for play_game
+	Returns:
+		list of GameResult
+	"""
+	return [play_game(seed, policies, **options) for seed in seeds]
+
+def run_batch(games, policies, seed=0, workers=None, chunk=8, table=None, **options):
+	""" Play many seeded games on a pool of worker processes
+	Args:
+		games: number of games to play
+		policies: Policy classes or names, one per Player.  Classes must be
+			importable by the worker processes.
+		seed: seed of the first game, game i is played with seed + i
+		workers: number of worker processes, defaults to the number of cores
+		chunk: number of games sent to a worker at once
+		table: run table file every worker maps to rule out the stashes that cannot
+			close, it is written before the workers start when it does not exist
+		options: keyword arguments for play_game
+	Returns:
+		generator of GameResult in the order the games finish
+	"""
+	workers = workers or os.cpu_count() or 1
+	seeds = iter(range(seed, seed + games))
+	setup = {}
+	if table is not None:
+		load_run_table(table)
+		setup = {'initializer': load_run_table, 'initargs': (table,)}
+	with concurrent.futures.ProcessPoolExecutor(max_workers=workers, **setup) as pool:
+		pending = set()
+		while True:
+			# Keep every worker busy without queueing all the games at once
+			while len(pending) < workers * 2:
+				batch = list(itertools.islice(seeds, chunk))
+				if not batch:
+					break
+				pending.add(pool.submit(play_games, batch, policies, options))
+			if not pending:
+				return
+			done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+			for future in done:
+				yield from future.result()
+
+def main():
+	""" Main Program """
+	parser = argparse.ArgumentParser(description="Play Rummy games between policies without a terminal")
+	parser.add_argument('--games', type=int, default=100)
+	parser.add_argument('--policies', nargs='+', default=['greedy', 'random'], choices=sorted(POLICIES))
+	parser.add_argument('--packs', type=int, default=2)
+	parser.add_argument('--hand-size', type=int, default=13)
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--workers', type=int, default=None)
+	parser.add_argument('--quiet', action='store_true', help="only print the summary")
+	parser.add_argument('--endurance', type=int, metavar='TURNS', help="time a single game that never closes instead")
+	parser.add_argument('--players', type=int, default=6, help="number of Players of the endurance game")
+	parser.add_argument('--window', type=int, default=1000, help="turns of the endurance game timed together")
+	parser.add_argument('--run-table', metavar='FILE', help="run table the workers share, written when missing")
+	args = parser.parse_args()
+
+	if args.endurance:
+		timings = endurance(args.endurance, args.packs, args.players, args.seed, args.window)
+		for n, us in enumerate(timings):
+			print(json.dumps({'turns': (n + 1) * args.window, 'us_per_turn': round(us, 2)}))
+		return
+
+	start = time.perf_counter()
+	wins = collections.Counter()
+	turns = 0
+	for result in run_batch(args.games, args.policies, args.seed, args.workers, table=args.run_table, packs=args.packs, hand_size=args.hand_size):
+		wins[result.winner] += 1
+		turns += result.turns
+		if not args.quiet:
+			print(json.dumps(result._asdict()))
+	elapsed = time.perf_counter() - start
+
+	summary = {
+		'games': args.games,
+		'wins': {str(k): v for k, v in sorted(wins.items(), key=str)},
+		'mean_turns': turns / max(args.games, 1),
+		'games_per_second': args.games / elapsed,
+	}
+	print(json.dumps(summary), file=sys.stderr)
+
+if __name__ == "__main__":
+	main()
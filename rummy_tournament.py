@@ -0,0 +1,391 @@
+#!/usr/bin/python3
+
+import argparse
+import concurrent.futures
+import csv
+import importlib
+import itertools
+import json
+import math
+import os
+import sys
+import time
+
+from rummy_sim import POLICIES, play_game
+
+"""
+Rummy tournament runner.
+Ranks Policies against each other over seeded two player games played on a
+pool of worker processes.  Every pairing plays the same seeds, with the seats
+swapped every other game.  Round robin plays every pairing, Swiss plays a number
+of rounds that pair entrants with the same score.  Elo ratings are updated as
+the results come in, and every result is appended to a CSV or JSONL file as
+soon as it is known, so a run holds only the standings in memory.  Running
+again with --resume reads the file back and only plays the games it is missing.
+
+Entrants are names from rummy_sim.POLICIES, or module:Class of a Policy class.
+
+Usage:
+	python3 rummy_tournament.py greedy random --games 200 --output results.csv
+	python3 rummy_tournament.py greedy random rummy_bot:MonteCarloPolicy --swiss 5 --output swiss.jsonl --resume
+"""
+
+# columns of the results file, score is the score of the first seat: 1 win, 0.5 draw, 0 loss
+FIELDS = ['key', 'round', 'seed', 'first', 'second', 'winner', 'score', 'turns']
+
+ELO_START = 1500.0
+ELO_K = 16.0
+Z95 = 1.96
+
+def load_policy(spec):
+	""" Policy class of an entrant
+	Args:
+		spec: name from POLICIES, or module:Class
+	Returns:
+		Policy class
+	"""
+	if spec in POLICIES:
+		return POLICIES[spec]
+	if ':' not in spec:
+		raise ValueError('ERROR: Unknown policy ' + spec)
+	module, name = spec.split(':', 1)
+	return getattr(importlib.import_module(module), name)
+
+def play_tasks(tasks, packs, max_turns):
+	""" Play a chunk of tournament games in a worker process
+	Args:
+		tasks: list of (key, round, seed, first, second), first and second are entrant specs
+		packs: number of packs in the Deck
+		max_turns: a game is a draw after this many turns
+	Returns:
+		list of result rows - dicts with the FIELDS
+	"""
+	rows = []
+	for key, rnd, seed, first, second in tasks:
+		result = play_game(seed, [load_policy(first), load_policy(second)], packs=packs, max_turns=max_turns)
+		winner = (first, second)[result.winner] if result.winner is not None else ''
+		score = 0.5 if result.winner is None else 1.0 - result.winner
+		rows.append({'key': key, 'round': rnd, 'seed': seed, 'first': first, 'second': second,
+			'winner': winner, 'score': score, 'turns': result.turns})
+	return rows
+
+class Standings:
+	""" Standings Class - Elo ratings and scores of the entrants """
+
+	def __init__(self, entrants):
+		""" Class Constructor
+		Args:
+			entrants: entrant specs
+		Returns:
+			No return value
+		"""
+		self.entrants = list(entrants)
+		self.rating = {e: ELO_START for e in self.entrants}
+		self.games = {e: 0 for e in self.entrants}
+		self.points = {e: 0.0 for e in self.entrants}
+		self.wins = {e: 0 for e in self.entrants}
+		self.draws = {e: 0 for e in self.entrants}
+		self.met = set()	# pairs of entrants that played each other, as sorted tuples
+		self.pairing = {}	# (round, a, b) of a sorted pair to the points a scored against b in the round
+
+	def update(self, row):
+		""" Count the result of one game
+		Args:
+			row: result row
+		Returns:
+			No returns
+		"""
+		a, b, score = row['first'], row['second'], float(row['score'])
+		expected = 1.0 / (1.0 + 10 ** ((self.rating[b] - self.rating[a]) / 400.0))
+		self.rating[a] += ELO_K * (score - expected)
+		self.rating[b] -= ELO_K * (score - expected)
+		for entrant, points in ((a, score), (b, 1.0 - score)):
+			self.games[entrant] += 1
+			self.points[entrant] += points
+			if points == 1.0:
+				self.wins[entrant] += 1
+			elif points == 0.5:
+				self.draws[entrant] += 1
+		pair = tuple(sorted((a, b)))
+		self.met.add(pair)
+		key = (row['round'],) + pair
+		self.pairing[key] = self.pairing.get(key, 0.0) + (score if pair[0] == a else 1.0 - score)
+
+	def margin(self, entrant):
+		""" Half width of the 95% confidence interval of a rating
+		The share of points p over n games has a standard error of sqrt(p(1-p)/n),
+		which the Elo curve maps to 400/ln(10) / sqrt(n p(1-p)) rating points.
+		Args:
+			entrant: entrant spec
+		Returns:
+			rating points, None before the first game
+		"""
+		n = self.games[entrant]
+		if n == 0:
+			return None
+		p = min(max(self.points[entrant] / n, 0.5 / n), 1 - 0.5 / n)
+		return Z95 * 400.0 / math.log(10) / math.sqrt(n * p * (1 - p))
+
+	def table(self):
+		""" Standings, best rating first
+		Args:
+			No args
+		Returns:
+			list of dicts with the entrant, rating, margin, games, points, wins and draws
+		"""
+		rows = []
+		for e in sorted(self.entrants, key=lambda e: -self.rating[e]):
+			margin = self.margin(e)
+			rows.append({'entrant': e, 'elo': round(self.rating[e], 1), 'elo_95': round(margin, 1) if margin is not None else None,
+				'games': self.games[e], 'points': self.points[e], 'wins': self.wins[e], 'draws': self.draws[e]})
+		return rows
+
+def round_robin(entrants, games, seed):
+	""" Tasks of a round robin: every pairing plays games seeds, seats swapped every other game
+	Args:
+		entrants: entrant specs
+		games: games per pairing
+		seed: seed of the first game of every pairing
+	Returns:
+		generator of (key, round, seed, first, second)
+	"""
+	for a, b in itertools.combinations(entrants, 2):
+		for k in range(games):
+			first, second = (a, b) if k % 2 == 0 else (b, a)
+			yield ("0:%s:%s:%d" % (a, b, k), 0, seed + k, first, second)
+
+def swiss_pairings(standings):
+	""" Pairings of a Swiss round: entrants with the most points first, each paired with the
+	next entrant it has not met yet, or the next one if it has met them all.  With an odd
+	number of entrants the last one sits the round out.
+	Args:
+		standings: Standings of the rounds played so far
+	Returns:
+		list of (a, b) pairs of entrant specs
+	"""
+	order = sorted(standings.entrants, key=lambda e: (-standings.points[e], standings.entrants.index(e)))
+	pairs = []
+	while len(order) > 1:
+		a = order.pop(0)
+		partner = next((b for b in order if tuple(sorted((a, b))) not in standings.met), order[0])
+		order.remove(partner)
+		pairs.append((a, partner))
+	return pairs
+
+def swiss_round(pairs, rnd, games, seed):
+	""" Tasks of one Swiss round, see swiss_pairings and round_robin """
+	for a, b in pairs:
+		for k in range(games):
+			first, second = (a, b) if k % 2 == 0 else (b, a)
+			yield ("%d:%s:%s:%d" % (rnd, a, b, k), rnd, seed + k, first, second)
+
+class ResultFile:
+	""" ResultFile Class - Append only CSV or JSONL file of result rows """
+
+	def __init__(self, path, fmt=None):
+		""" Class Constructor
+		Args:
+			path: file path, None to keep no file
+			fmt: 'csv' or 'jsonl', from the file extension when not given
+		Returns:
+			No return value
+		"""
+		self.path = path
+		self.fmt = fmt or ('jsonl' if path and path.endswith(('.jsonl', '.json')) else 'csv')
+		self.file = None
+		self.writer = None
+
+	def read(self):
+		""" Rows already in the file, read one line at a time.  An unfinished last line,
+		left by a run that was stopped while writing it, is cut off the file.
+		Args:
+			No args
+		Returns:
+			generator of result rows
+		"""
+		if not self.path or not os.path.exists(self.path):
+			return
+		with open(self.path, 'rb+') as f:
+			good = 0
+			header = None
+			for raw in f:
+				if not raw.endswith(b'\n'):
+					break
+				good += len(raw)
+				line = raw.decode()
+				if self.fmt != 'csv':
+					yield json.loads(line)
+				elif header is None:
+					header = next(csv.reader([line]))
+				else:
+					row = dict(zip(header, next(csv.reader([line]))))
+					row['round'], row['seed'], row['turns'] = int(row['round']), int(row['seed']), int(row['turns'])
+					row['score'] = float(row['score'])
+					yield row
+			f.truncate(good)
+
+	def write(self, row):
+		""" Append a row and flush it to the file """
+		if not self.path:
+			return
+		if self.file is None:
+			new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+			self.file = open(self.path, 'a', newline='')
+			if self.fmt == 'csv':
+				self.writer = csv.DictWriter(self.file, FIELDS, lineterminator='\n')
+				if new:
+					self.writer.writeheader()
+		if self.fmt == 'csv':
+			self.writer.writerow(row)
+		else:
+			self.file.write(json.dumps(row) + "\n")
+		self.file.flush()
+
+	def close(self):
+		""" Close the file """
+		if self.file is not None:
+			self.file.close()
+			self.file = None
+
+def play_all(tasks, done, standings, results, pool, workers, chunk, options):
+	""" Play the tasks that are not done yet, updating the standings and the file as results come in
+	Args:
+		tasks: iterable of tasks
+		done: set of the keys already played, the new keys are added
+		standings: Standings
+		results: ResultFile
+		pool: ProcessPoolExecutor
+		workers: number of worker processes
+		chunk: number of games sent to a worker at once
+		options: (packs, max_turns)
+	Returns:
+		number of games played
+	"""
+	tasks = (task for task in tasks if task[0] not in done)
+	played = 0
+	pending = set()
+	while True:
+		# Keep every worker busy without queueing all the games at once
+		while len(pending) < workers * 2:
+			batch = list(itertools.islice(tasks, chunk))
+			if not batch:
+				break
+			pending.add(pool.submit(play_tasks, batch, *options))
+		if not pending:
+			return played
+		finished, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+		for future in finished:
+			for row in future.result():
+				standings.update(row)
+				results.write(row)
+				done.add(row['key'])
+				played += 1
+
+def run_tournament(entrants, games=10, swiss=None, seed=0, workers=None, chunk=8, output=None, fmt=None,
+		resume=False, packs=2, max_turns=500):
+	""" Play a tournament
+	Args:
+		entrants: entrant specs, at least 2
+		games: games per pairing
+		swiss: number of Swiss rounds, round robin when not given
+		seed: seed of the first game of every pairing
+		workers: number of worker processes, defaults to the number of cores
+		chunk: number of games sent to a worker at once
+		output: CSV or JSONL file the results are appended to
+		fmt: 'csv' or 'jsonl', from the file extension when not given
+		resume: True to read the results already in output and only play the others
+		packs: number of packs in the Deck
+		max_turns: a game is a draw after this many turns
+	Returns:
+		summary - dict with the standings and the games per second per core
+	"""
+	if len(set(entrants)) < 2:
+		raise ValueError('ERROR: A tournament needs at least 2 entrants')
+	for spec in entrants:
+		load_policy(spec)
+	workers = workers or os.cpu_count() or 1
+	standings = Standings(entrants)
+	results = ResultFile(output, fmt)
+	done = set()
+	if resume:
+		for row in results.read():
+			standings.update(row)
+			done.add(row['key'])
+	elif output and os.path.exists(output):
+		os.remove(output)
+
+	start = time.perf_counter()
+	played = 0
+	options = (packs, max_turns)
+	try:
+		with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+			if swiss is None:
+				played += play_all(round_robin(entrants, games, seed), done, standings, results, pool, workers, chunk, options)
+			else:
+				# the pairings of a round only depend on the points of the rounds before,
+				# so a resumed run pairs every round as the first run did
+				points = Standings(entrants)
+				for rnd in range(1, swiss + 1):
+					pairs = swiss_pairings(points)
+					tasks = list(swiss_round(pairs, rnd, games, seed))
+					played += play_all(tasks, done, standings, results, pool, workers, chunk, options)
+					round_points(points, standings, rnd, pairs, games)
+	finally:
+		results.close()
+	elapsed = time.perf_counter() - start
+
+	return {
+		'mode': 'swiss' if swiss is not None else 'round-robin',
+		'games_played': played,
+		'games_total': len(done),
+		'seconds': elapsed,
+		'games_per_second_per_core': played / elapsed / workers if elapsed else None,
+		'workers': workers,
+		'standings': standings.table(),
+	}
+
+def round_points(points, standings, rnd, pairs, games):
+	""" Add the match points of a finished Swiss round to the Standings the pairings are made from
+	The entrant that scored more in the games of a pairing gets 1 point, a tie half a point
+	each, so the match points do not depend on the order the games finished in.
+	Args:
+		points: Standings the pairings are made from
+		standings: Standings with every game played
+		rnd: the Swiss round
+		pairs: pairings of the round
+		games: games per pairing
+	Returns:
+		No returns
+	"""
+	for a, b in pairs:
+		x, y = sorted((a, b))
+		scored = standings.pairing.get((rnd, x, y), 0.0)
+		if scored * 2 == games:
+			points.points[x] += 0.5
+			points.points[y] += 0.5
+		else:
+			points.points[x if scored * 2 > games else y] += 1.0
+		points.met.add((x, y))
+
+def main():
+	""" Main Program """
+	parser = argparse.ArgumentParser(description="Rank Rummy policies in a round robin or Swiss tournament")
+	parser.add_argument('entrants', nargs='+', help="names from rummy_sim.POLICIES or module:Class")
+	parser.add_argument('--games', type=int, default=20, help="games per pairing")
+	parser.add_argument('--swiss', type=int, metavar='ROUNDS', help="play Swiss rounds instead of a round robin")
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--workers', type=int, default=None)
+	parser.add_argument('--chunk', type=int, default=8)
+	parser.add_argument('--packs', type=int, default=2)
+	parser.add_argument('--max-turns', type=int, default=500)
+	parser.add_argument('--output', help="CSV or JSONL file the results are appended to")
+	parser.add_argument('--format', choices=['csv', 'jsonl'])
+	parser.add_argument('--resume', action='store_true', help="keep the results in the output file and play the rest")
+	args = parser.parse_args()
+
+	summary = run_tournament(args.entrants, args.games, args.swiss, args.seed, args.workers, args.chunk,
+		args.output, args.format, args.resume, args.packs, args.max_turns)
+	print(json.dumps(summary), file=sys.stderr)
+
+if __name__ == "__main__":
+	main()